@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Benchmark fuzzy intent recognition on a large generated grammar.
+
+Compares rhasspynlu's fuzzy search over the compact intent graph with the
+indexed search from voice2json.fuzzy, and checks that both return the same
+recognitions.
+"""
+import argparse
+import dataclasses
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+this_dir = Path(__file__).parent
+sys.path.insert(0, str(this_dir.parent))
+
+import rhasspynlu  # noqa: E402
+
+from voice2json.fuzzy import (  # noqa: E402
+    load_fuzzy_index,
+    recognize_fuzzy,
+    write_fuzzy_index,
+)
+from voice2json.graph import load_compact_graph, write_compact_graph  # noqa: E402
+from voice2json.utils import PathSampler  # noqa: E402
+
+SENTENCES_INI = """
+[PlaySong]
+play ($song){song} [please]
+put on [the song] ($song){song}
+
+[CallContact]
+call ($contact){contact} [on [the] (mobile | home | work){phone}]
+
+[ChangeLight]
+turn (on | off){state} [the] ($room){room} (light | lamp)
+"""
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "to", "ne", "su", "vi", "da", "pe", "zo", "bu"]
+STOP_WORDS = {"the", "a", "uh", "um", "please"}
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(prog="benchmark-recognize.py")
+    parser.add_argument(
+        "--songs", type=int, default=5000, help="Number of song slot values"
+    )
+    parser.add_argument(
+        "--contacts", type=int, default=2000, help="Number of contact slot values"
+    )
+    parser.add_argument(
+        "--rooms", type=int, default=200, help="Number of room slot values"
+    )
+    parser.add_argument(
+        "--sentences", type=int, default=100, help="Number of test sentences"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+
+    def word() -> str:
+        return "".join(rand.choice(SYLLABLES) for _ in range(rand.randint(2, 3)))
+
+    vocabulary = list({word() for _ in range(3000)})
+
+    def phrase(min_words: int, max_words: int) -> str:
+        return " ".join(
+            rand.choice(vocabulary) for _ in range(rand.randint(min_words, max_words))
+        )
+
+    with tempfile.TemporaryDirectory() as temp_dir_str:
+        temp_dir = Path(temp_dir_str)
+        slots_dir = temp_dir / "slots"
+        slots_dir.mkdir()
+
+        for slot_name, count, min_words, max_words in [
+            ("song", args.songs, 2, 4),
+            ("contact", args.contacts, 1, 2),
+            ("room", args.rooms, 1, 2),
+        ]:
+            slot_values = {phrase(min_words, max_words) for _ in range(count)}
+            (slots_dir / slot_name).write_text("\n".join(sorted(slot_values)))
+
+        # Train
+        start_time = time.perf_counter()
+        intents = rhasspynlu.parse_ini(SENTENCES_INI)
+        sentences, replacements = rhasspynlu.ini_jsgf.split_rules(intents)
+        replacements.update(
+            rhasspynlu.get_slot_replacements(intents, slots_dirs=[slots_dir])
+        )
+        intent_graph = rhasspynlu.sentences_to_graph(
+            sentences, replacements=replacements
+        )
+
+        graph_path = temp_dir / "intent.graph"
+        index_path = temp_dir / "intent.index"
+        write_compact_graph(intent_graph, graph_path)
+        graph = load_compact_graph(graph_path)
+
+        index_start_time = time.perf_counter()
+        write_fuzzy_index(graph, index_path)
+        index_seconds = time.perf_counter() - index_start_time
+        train_seconds = time.perf_counter() - start_time
+
+        index = load_fuzzy_index(index_path, graph)
+
+        # Sample sentences and make them noisy
+        start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(graph)
+        sampler = PathSampler(graph, start_node, end_node)
+        test_sentences = []
+        for path in sampler.sample(args.sentences, rand):
+            tokens = []
+            for from_node, to_node in zip(path, path[1:]):
+                ilabel = graph.edges[(from_node, to_node)]["ilabel"]
+                if ilabel:
+                    tokens.append(ilabel)
+
+            noise = rand.random()
+            if noise < 0.25:
+                # Extra stop word
+                tokens.insert(rand.randint(0, len(tokens)), rand.choice(["uh", "um"]))
+            elif noise < 0.5:
+                # Unknown word
+                tokens.insert(rand.randint(0, len(tokens)), word() + "x")
+            elif (noise < 0.75) and (len(tokens) > 2):
+                # Missing word
+                tokens.pop(rand.randrange(len(tokens)))
+
+            test_sentences.append(tokens)
+
+        def run(recognize_tokens):
+            results = []
+            start_time = time.perf_counter()
+            for tokens in test_sentences:
+                results.append(recognize_tokens(tokens))
+
+            return results, time.perf_counter() - start_time
+
+        baseline, baseline_seconds = run(
+            lambda tokens: rhasspynlu.recognize(
+                tokens, graph, fuzzy=True, stop_words=STOP_WORDS
+            )
+        )
+        indexed, indexed_seconds = run(
+            lambda tokens: recognize_fuzzy(tokens, index, stop_words=STOP_WORDS)
+        )
+
+        def without_timing(recognitions):
+            return [
+                {
+                    k: v
+                    for k, v in dataclasses.asdict(r).items()
+                    if k != "recognize_seconds"
+                }
+                for r in recognitions
+            ]
+
+        mismatches = sum(
+            1
+            for expected, actual in zip(baseline, indexed)
+            if without_timing(expected) != without_timing(actual)
+        )
+
+        json.dump(
+            {
+                "nodes": graph.num_nodes,
+                "edges": graph.num_edges,
+                "train_seconds": train_seconds,
+                "index_seconds": index_seconds,
+                "index_bytes": index_path.stat().st_size,
+                "sentences": len(test_sentences),
+                "recognized": sum(1 for r in baseline if r),
+                "baseline_seconds_per_sentence": baseline_seconds / len(test_sentences),
+                "indexed_seconds_per_sentence": indexed_seconds / len(test_sentences),
+                "speedup": baseline_seconds / indexed_seconds,
+                "mismatches": mismatches,
+            },
+            sys.stdout,
+            indent=4,
+        )
+        print("")
+
+        if mismatches > 0:
+            sys.exit(1)
+
+
+# -----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,16 @@ import argparse
 import io
 import json
 import logging
+import math
 import os
 import re
+import socket
 import subprocess
 import sys
+import tempfile
+import time
 import unittest
+import wave
 from pathlib import Path
 
 logging.basicConfig(level=logging.DEBUG)
@@ -91,6 +96,79 @@ class Voice2JsonTestCase(unittest.TestCase):
         # Stop time should be later
         self.assertGreater(stop_seconds, start_seconds)
 
+    def _print_profile(self, profile_dir, *args, explain=False, env=None):
+        """Use print-profile command to get profile settings."""
+        return json.loads(
+            subprocess.check_output(
+                ["voice2json", "--profile", str(profile_dir)]
+                + list(args)
+                + ["print-profile"]
+                + (["--explain"] if explain else []),
+                env=env,
+            )
+        )
+
+    def test_profile_cache(self):
+        """Check that cached profile changes with !env variables and --setting."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profile_dir = Path(temp_dir)
+            (profile_dir / "profile.yml").write_text(
+                'text-to-speech:\n  espeak:\n    voice: !env "${VOICE2JSON_TEST_VOICE}"\n'
+            )
+
+            env = dict(os.environ)
+            env["VOICE2JSON_TEST_VOICE"] = "first"
+            profile = self._print_profile(profile_dir, env=env)
+            self.assertEqual("first", profile["text-to-speech"]["espeak"]["voice"])
+            self.assertTrue((profile_dir / "profile_cache.pickle").is_file())
+
+            # Environment variable changed
+            env["VOICE2JSON_TEST_VOICE"] = "second"
+            profile = self._print_profile(profile_dir, env=env)
+            self.assertEqual("second", profile["text-to-speech"]["espeak"]["voice"])
+
+            # Setting overrides profile
+            profile = self._print_profile(
+                profile_dir,
+                "--setting",
+                "text-to-speech.espeak.voice",
+                json.dumps("third"),
+                env=env,
+            )
+            self.assertEqual("third", profile["text-to-speech"]["espeak"]["voice"])
+
+            # Setting is not kept
+            profile = self._print_profile(profile_dir, env=env)
+            self.assertEqual("second", profile["text-to-speech"]["espeak"]["voice"])
+
+    def test_print_profile_explain(self):
+        """Check sources of settings from print-profile --explain."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profile_dir = Path(temp_dir)
+            profile_yml = profile_dir / "profile.yml"
+            profile_yml.write_text("text-to-speech:\n  espeak:\n    voice: first\n")
+
+            for args, voice, source in [
+                ([], "first", str(profile_yml)),
+                (
+                    ["--setting", "text-to-speech.espeak.voice", json.dumps("second")],
+                    "second",
+                    "--setting",
+                ),
+            ]:
+                explained = self._print_profile(profile_dir, *args, explain=True)
+                self.assertEqual(
+                    {"value": voice, "source": source},
+                    explained["text-to-speech.espeak.voice"],
+                )
+
+                # Other settings come from defaults
+                self.assertTrue(
+                    explained["text-to-speech.espeak.speak-command"]["source"].endswith(
+                        "profile.defaults.yml"
+                    )
+                )
+
 
 # -----------------------------------------------------------------------------
 
@@ -106,7 +184,7 @@ class ProfileTestCase(unittest.TestCase):
 
     # -------------------------------------------------------------------------
 
-    def _get_report(self, profile_dir):
+    def _get_report(self, profile_dir, *test_args):
         """Use test-examples command to generate a transcription/recognition report."""
         return json.loads(
             subprocess.check_output(
@@ -117,6 +195,7 @@ class ProfileTestCase(unittest.TestCase):
                     "test-examples",
                     "--directory",
                     str(profile_dir / "test" / "perfect"),
+                    *test_args,
                 ]
             )
         )
@@ -131,6 +210,306 @@ class ProfileTestCase(unittest.TestCase):
                 # Should be perfect
                 self.assertEqual(1, stats["intent_entity_accuracy"])
 
+    def test_examples_threads(self):
+        """Check that test-examples gives the same report with multiple workers."""
+        timing_keys = {
+            "transcribe_seconds",
+            "recognize_seconds",
+            "average_transcription_speedup",
+        }
+
+        def without_timing(value):
+            if isinstance(value, dict):
+                return {
+                    key: without_timing(item)
+                    for key, item in value.items()
+                    if key not in timing_keys
+                }
+
+            if isinstance(value, list):
+                return [without_timing(item) for item in value]
+
+            return value
+
+        for profile_dir in profile_dirs:
+            with self.subTest(profile_dir):
+                serial_report = self._get_report(profile_dir, "--threads", "1")
+                threaded_report = self._get_report(profile_dir, "--threads", "2")
+                self.assertEqual(
+                    without_timing(serial_report), without_timing(threaded_report)
+                )
+
+    # -------------------------------------------------------------------------
+
+    def _get_examples(self, profile_dir, *generate_args, settings=None):
+        """Use generate-examples command to get example intents."""
+        return [
+            json.loads(line)
+            for line in subprocess.check_output(
+                ["voice2json", "--profile", str(profile_dir)]
+                + (settings or [])
+                + ["generate-examples"]
+                + list(generate_args)
+            )
+            .decode()
+            .splitlines()
+        ]
+
+    def _get_intents(self, profile_dir, sentences, *recognize_args, settings=None):
+        """Use recognize-intent command to get intents for sentences."""
+        intents = []
+        for line in (
+            subprocess.check_output(
+                ["voice2json", "--profile", str(profile_dir)]
+                + (settings or [])
+                + ["recognize-intent", "--text-input"]
+                + list(recognize_args),
+                input="\n".join(sentences).encode(),
+            )
+            .decode()
+            .splitlines()
+        ):
+            intent = json.loads(line)
+
+            # Only field that changes between runs
+            intent.pop("recognize_seconds", None)
+            intents.append(intent)
+
+        return intents
+
+    def test_recognize_workers(self):
+        """Check that recognizing with worker processes gives the same intents."""
+        for profile_dir in profile_dirs:
+            with self.subTest(profile_dir):
+                examples = self._get_examples(profile_dir, "--number", "10")
+                sentences = [example["text"] for example in examples]
+
+                # Numbers are replaced with words
+                sentences.extend(f"{sentence} 2" for sentence in sentences[:3])
+
+                # Stop words and unknown words
+                sentences.extend(["", "the", "banana"])
+
+                intent_name = examples[0]["intent"]["name"]
+                for recognize_args in [
+                    [],
+                    ["--replace-numbers"],
+                    ["--intent-filter", intent_name],
+                ]:
+                    expected_intents = self._get_intents(
+                        profile_dir, sentences, *recognize_args
+                    )
+                    self.assertEqual(len(sentences), len(expected_intents))
+
+                    # More sentences than fit in one chunk
+                    actual_intents = self._get_intents(
+                        profile_dir,
+                        sentences,
+                        "--workers",
+                        "2",
+                        "--chunk-size",
+                        "3",
+                        *recognize_args,
+                    )
+                    self.assertEqual(expected_intents, actual_intents, recognize_args)
+
+    def test_generate_examples(self):
+        """Check number, reproducibility, and uniqueness of generated examples."""
+        for profile_dir in profile_dirs:
+            with self.subTest(profile_dir):
+                # Number of possible sentences
+                num_sentences = int(
+                    subprocess.check_output(
+                        [
+                            "voice2json",
+                            "--profile",
+                            str(profile_dir),
+                            "generate-examples",
+                            "--count",
+                        ]
+                    )
+                )
+                self.assertGreater(num_sentences, 0)
+
+                # Same seed gives same examples
+                num_examples = min(5, num_sentences)
+                examples = self._get_examples(
+                    profile_dir, "--number", str(num_examples), "--seed", "1"
+                )
+                self.assertEqual(num_examples, len(examples))
+                self.assertEqual(
+                    examples,
+                    self._get_examples(
+                        profile_dir, "--number", str(num_examples), "--seed", "1"
+                    ),
+                )
+
+                if num_sentences > 10000:
+                    # Too many to generate them all
+                    continue
+
+                # Asking for more than the grammar has gives each sentence once
+                all_examples = self._get_examples(
+                    profile_dir, "--number", str(num_sentences + 10)
+                )
+                unique_examples = set(
+                    json.dumps(example, sort_keys=True) for example in all_examples
+                )
+                self.assertEqual(num_sentences, len(all_examples))
+                self.assertEqual(num_sentences, len(unique_examples))
+
+                # Zero means all sentences
+                zero_examples = self._get_examples(profile_dir, "--number", "0")
+                self.assertEqual(
+                    unique_examples,
+                    set(
+                        json.dumps(example, sort_keys=True) for example in zero_examples
+                    ),
+                )
+                self.assertEqual(num_sentences, len(zero_examples))
+
+    def test_fuzzy_index(self):
+        """Check that fuzzy recognition gives the same intents with and without an index."""
+        for profile_dir in profile_dirs:
+            with self.subTest(profile_dir):
+                sentences = []
+                for example in self._get_examples(profile_dir, "--number", "20"):
+                    words = example["text"].split()
+                    sentences.extend(
+                        [
+                            " ".join(words),
+                            # Extra word
+                            " ".join(words + ["please"]),
+                            # Missing word
+                            " ".join(words[1:]),
+                            # Unknown word
+                            " ".join(words[:1] + ["banana"] + words[1:]),
+                        ]
+                    )
+
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    missing_index_path = Path(temp_dir) / "intent.index"
+                    expected_intents = self._get_intents(
+                        profile_dir,
+                        sentences,
+                        settings=[
+                            "--setting",
+                            "intent-recognition.fuzzy-index",
+                            json.dumps(str(missing_index_path)),
+                        ],
+                    )
+
+                actual_intents = self._get_intents(profile_dir, sentences)
+                self.assertEqual(len(sentences), len(actual_intents))
+                self.assertEqual(expected_intents, actual_intents)
+
+    def test_compact_graph(self):
+        """Check that the compact intent graph gives the same results as the pickle."""
+        for profile_dir in profile_dirs:
+            with self.subTest(profile_dir):
+                self.assertTrue((profile_dir / "intent.graph").is_file())
+
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    # Fall back to intent.pickle.gz
+                    pickle_settings = [
+                        "--setting",
+                        "intent-recognition.compact-intent-graph",
+                        json.dumps(str(Path(temp_dir) / "intent.graph")),
+                    ]
+
+                    expected_examples = self._get_examples(
+                        profile_dir,
+                        "--number",
+                        "20",
+                        "--seed",
+                        "1",
+                        settings=pickle_settings,
+                    )
+                    sentences = [example["text"] for example in expected_examples]
+                    expected_intents = self._get_intents(
+                        profile_dir, sentences, settings=pickle_settings
+                    )
+
+                actual_examples = self._get_examples(
+                    profile_dir, "--number", "20", "--seed", "1"
+                )
+                self.assertEqual(expected_examples, actual_examples)
+
+                actual_intents = self._get_intents(profile_dir, sentences)
+                self.assertEqual(expected_intents, actual_intents)
+
+    # -------------------------------------------------------------------------
+
+    def test_serve(self):
+        """Check that serve daemon answers requests like the one-shot commands."""
+        for profile_dir in profile_dirs:
+            with self.subTest(profile_dir):
+                sentences = [
+                    example["text"]
+                    for example in self._get_examples(
+                        profile_dir, "--number", "5", "--seed", "1"
+                    )
+                ]
+                served_intents = []
+
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    socket_path = os.path.join(temp_dir, "voice2json.sock")
+                    serve_proc = subprocess.Popen(
+                        [
+                            "voice2json",
+                            "--profile",
+                            str(profile_dir),
+                            "serve",
+                            "--socket",
+                            socket_path,
+                        ],
+                        stderr=subprocess.PIPE,
+                    )
+
+                    try:
+                        # Wait until ready
+                        line = serve_proc.stderr.readline()
+                        while line and (b"Ready" not in line):
+                            line = serve_proc.stderr.readline()
+
+                        self.assertIn(b"Ready", line)
+
+                        with socket.socket(socket.AF_UNIX) as client_socket:
+                            client_socket.connect(socket_path)
+                            client_file = client_socket.makefile("rwb")
+
+                            def send(request):
+                                client_file.write(json.dumps(request).encode() + b"\n")
+                                client_file.flush()
+                                response = json.loads(client_file.readline())
+                                self.assertNotIn("error", response)
+                                return response
+
+                            for sentence in sentences:
+                                intent = send(
+                                    {
+                                        "type": "recognize-intent",
+                                        "text": sentence,
+                                        "id": sentence,
+                                    }
+                                )
+                                self.assertEqual(sentence, intent.pop("id"))
+                                intent.pop("recognize_seconds", None)
+                                served_intents.append(intent)
+
+                            response = send({"type": "statistics"})
+                            self.assertEqual(
+                                len(sentences),
+                                response["requests"]["recognize-intent"]["count"],
+                            )
+                    finally:
+                        serve_proc.terminate()
+                        serve_proc.wait()
+
+                self.assertEqual(
+                    self._get_intents(profile_dir, sentences), served_intents
+                )
+
     # -------------------------------------------------------------------------
 
     def _get_phonemes(self, profile_dir, word):
@@ -178,6 +557,388 @@ class ProfileTestCase(unittest.TestCase):
                 )
                 self.assertEqual(g2p_test["unknown"]["phonemes"], unknown_phonemes)
 
+    def test_dictionary_index(self):
+        """Check that indexed dictionary lookups match reading the whole dictionary."""
+        for profile_dir in profile_dirs:
+            with self.subTest(profile_dir):
+                with open(profile_dir / "test" / "g2p.json", "r") as g2p_test_file:
+                    word = json.load(g2p_test_file)["known"]["word"]
+
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    # Extra pronunciations for a word in the base dictionary
+                    custom_words_path = Path(temp_dir) / "custom_words.txt"
+                    custom_words_path.write_text(f"{word} A B C\n{word} D E F\n")
+
+                    # Index can't be written here, so whole dictionary is read
+                    missing_index_path = Path(temp_dir) / "missing" / "dictionary.db"
+
+                    for action in ["append", "overwrite_once", "overwrite_always"]:
+                        pronounce_cmd = [
+                            "voice2json",
+                            "--profile",
+                            str(profile_dir),
+                            "--setting",
+                            "training.custom-words-file",
+                            json.dumps(str(custom_words_path)),
+                            "--setting",
+                            "training.custom-words-action",
+                            json.dumps(action),
+                        ]
+
+                        lazy_output = subprocess.check_output(
+                            pronounce_cmd + ["pronounce-word", "--quiet", word]
+                        )
+                        full_output = subprocess.check_output(
+                            pronounce_cmd
+                            + [
+                                "--setting",
+                                "training.base-dictionary-index",
+                                json.dumps(str(missing_index_path)),
+                                "pronounce-word",
+                                "--quiet",
+                                word,
+                            ]
+                        )
+
+                        self.assertEqual(full_output, lazy_output, action)
+
+
+# -----------------------------------------------------------------------------
+
+
+class ConverterTestCase(unittest.TestCase):
+    """Tests intent recognition with converters (no speech to text system)."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profile_dir = Path(self.temp_dir.name)
+        (self.profile_dir / "profile.yml").write_text(
+            "training:\n  acoustic-model-type: dummy\n"
+        )
+
+        self.converters_dir = self.profile_dir / "converters"
+        self.converters_dir.mkdir()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write_converter(self, name, code):
+        """Write an executable Python converter to the profile."""
+        converter_path = self.converters_dir / name
+        converter_path.write_text("#!/usr/bin/env python3\n" + code)
+        converter_path.chmod(0o755)
+
+    def _train(self, sentences_ini):
+        """Train profile with sentences."""
+        (self.profile_dir / "sentences.ini").write_text(sentences_ini)
+        subprocess.check_call(
+            ["voice2json", "--profile", str(self.profile_dir), "train-profile"]
+        )
+
+    def _recognize(self, sentences, settings=None):
+        """Use recognize-intent command to get intents for sentences."""
+        setting_args = []
+        for setting_name, setting_value in (settings or {}).items():
+            setting_args.extend(["--setting", setting_name, json.dumps(setting_value)])
+
+        intents = []
+        for line in (
+            subprocess.check_output(
+                ["voice2json", "--profile", str(self.profile_dir)]
+                + setting_args
+                + ["recognize-intent", "--text-input"],
+                input="\n".join(sentences).encode(),
+            )
+            .decode()
+            .splitlines()
+        ):
+            intent = json.loads(line)
+            intent.pop("recognize_seconds", None)
+            intents.append(intent)
+
+        return intents
+
+    def test_recognition_cache(self):
+        """Check that repeated sentences are cached unless a converter is nondeterministic."""
+        # Counts calls in a file next to the converters directory
+        self._write_converter(
+            "roll",
+            """import sys
+from pathlib import Path
+
+count_path = Path(__file__).parent.parent / "roll_count"
+count = int(count_path.read_text()) if count_path.is_file() else 0
+for line in sys.stdin:
+    if line.strip():
+        count += 1
+        print(count)
+
+count_path.write_text(str(count))
+""",
+        )
+        self._train("[RollDie]\nroll a (die){value!roll}\n")
+        count_path = self.profile_dir / "roll_count"
+        sentences = ["roll a die"] * 3
+
+        # Cached after first recognition
+        intents = self._recognize(sentences)
+        self.assertEqual("RollDie", intents[0]["intent"]["name"])
+        self.assertEqual([intents[0]] * len(sentences), intents)
+        self.assertEqual("1", count_path.read_text())
+
+        # Converter runs every time
+        intents = self._recognize(
+            sentences, {"intent-recognition.nondeterministic-converters": ["roll"]}
+        )
+        self.assertEqual([2, 3, 4], [intent["slots"]["value"] for intent in intents])
+        self.assertEqual("4", count_path.read_text())
+
+    def test_persistent_converters(self):
+        """Check that persistent converters are started once and restarted if they exit."""
+        # Logs process id of each request. Exits after max_requests if given.
+        persistent_code = """import json
+import os
+import sys
+from pathlib import Path
+
+name = Path(__file__).name
+max_requests = {max_requests}
+log_path = Path(__file__).parent.parent / (name + "_calls")
+num_requests = 0
+for line in sys.stdin:
+    request = json.loads(line)
+    with open(log_path, "a") as log_file:
+        print(os.getpid(), file=log_file)
+
+    print(json.dumps([2 * value for value in request["args"]]), flush=True)
+
+    num_requests += 1
+    if max_requests and (num_requests >= max_requests):
+        break
+"""
+        self._write_converter("double", persistent_code.format(max_requests=0))
+        self._write_converter("flaky", persistent_code.format(max_requests=2))
+
+        # One value per line, not persistent
+        self._write_converter(
+            "upper",
+            """import json
+import sys
+
+for line in sys.stdin:
+    if line.strip():
+        print(json.dumps(json.loads(line).upper()))
+""",
+        )
+
+        numbers = "(one:1 | two:2 | three:3 | four:4 | five:5)"
+        self._train(
+            f"""[Double]
+double {numbers}{{number!int!double}}
+
+[Flaky]
+flaky {numbers}{{number!int!flaky}}
+
+[Shout]
+shout (hello){{word!upper}}
+"""
+        )
+
+        number_words = ["one", "two", "three", "four", "five"]
+        sentences = []
+        for word in number_words:
+            sentences.extend([f"double {word}", f"flaky {word}", "shout hello"])
+
+        intents = self._recognize(
+            sentences,
+            {
+                "intent-recognition.persistent-converters": ["double", "flaky"],
+                "intent-recognition.cache.max-size": 0,
+            },
+        )
+        self.assertEqual(len(sentences), len(intents))
+
+        expected_slots = []
+        for number in range(1, len(number_words) + 1):
+            expected_slots.extend(
+                [{"number": 2 * number}, {"number": 2 * number}, {"word": "HELLO"}]
+            )
+
+        self.assertEqual(expected_slots, [intent["slots"] for intent in intents])
+
+        def get_pids(name):
+            return (self.profile_dir / f"{name}_calls").read_text().split()
+
+        # Started once for all sentences
+        double_pids = get_pids("double")
+        self.assertEqual(len(number_words), len(double_pids))
+        self.assertEqual(1, len(set(double_pids)))
+
+        # Restarted after every second request
+        flaky_pids = get_pids("flaky")
+        self.assertEqual(len(number_words), len(flaky_pids))
+        self.assertEqual(3, len(set(flaky_pids)))
+
+    def test_persistent_converter_timeout(self):
+        """Check that a hung persistent converter is restarted."""
+        # First instance hangs, second one answers
+        self._write_converter(
+            "slow",
+            """import json
+import sys
+import time
+from pathlib import Path
+
+hung_path = Path(__file__).parent.parent / "slow_hung"
+for line in sys.stdin:
+    if not hung_path.exists():
+        hung_path.touch()
+        time.sleep(60)
+
+    request = json.loads(line)
+    print(json.dumps([2 * value for value in request["args"]]), flush=True)
+""",
+        )
+
+        self._train("[Slow]\nslow (one:1){number!int!slow}\n")
+
+        start_time = time.perf_counter()
+        intents = self._recognize(
+            ["slow one", "slow one"],
+            {
+                "intent-recognition.persistent-converters": ["slow"],
+                "intent-recognition.persistent-converter-timeout": 1,
+                "intent-recognition.cache.max-size": 0,
+            },
+        )
+
+        self.assertLess(time.perf_counter() - start_time, 30)
+        self.assertEqual(
+            [{"number": 2}, {"number": 2}], [intent["slots"] for intent in intents]
+        )
+
+
+# -----------------------------------------------------------------------------
+
+
+class ConvertWavTestCase(unittest.TestCase):
+    """Tests built-in conversion of PCM WAV audio."""
+
+    def _make_wav(self, samples, sample_rate, sample_width, channels):
+        """Create WAV data from samples in [-1, 1) (interleaved channels)."""
+        scale = 1 << ((8 * sample_width) - 1)
+        with io.BytesIO() as wav_io:
+            wav_file: wave.Wave_write = wave.open(wav_io, "wb")
+            with wav_file:
+                wav_file.setframerate(sample_rate)
+                wav_file.setsampwidth(sample_width)
+                wav_file.setnchannels(channels)
+
+                frames = bytearray()
+                for sample in samples:
+                    value = min(scale - 1, int(round(sample * scale)))
+                    if sample_width == 1:
+                        # 8-bit WAV audio is unsigned
+                        value += 128
+
+                    frames += value.to_bytes(
+                        sample_width, "little", signed=(sample_width > 1)
+                    )
+
+                wav_file.writeframes(bytes(frames))
+
+            return wav_io.getvalue()
+
+    def _tone(self, frequency, sample_rate, seconds, channels=1, amplitude=0.5):
+        """Interleaved samples of a sine wave."""
+        return [
+            amplitude * math.sin(2 * math.pi * frequency * (i / sample_rate))
+            for i in range(int(seconds * sample_rate))
+            for _ in range(channels)
+        ]
+
+    def _convert(self, wav_bytes, sample_rate, sample_width, channels):
+        """Convert WAV data and return (rate, width, channels, samples)."""
+        from voice2json.utils import convert_pcm_wav
+
+        converted_bytes = convert_pcm_wav(
+            wav_bytes,
+            sample_rate=sample_rate,
+            sample_width=sample_width,
+            channels=channels,
+        )
+        self.assertIsNotNone(converted_bytes)
+
+        with io.BytesIO(converted_bytes) as wav_io:
+            with wave.open(wav_io, "rb") as wav_file:
+                width = wav_file.getsampwidth()
+                audio = wav_file.readframes(wav_file.getnframes())
+                scale = 1 << ((8 * width) - 1)
+                samples = []
+                for i in range(0, len(audio), width):
+                    value = int.from_bytes(
+                        audio[i : i + width], "little", signed=(width > 1)
+                    )
+                    if width == 1:
+                        value -= 128
+
+                    samples.append(value / scale)
+
+                return (
+                    wav_file.getframerate(),
+                    width,
+                    wav_file.getnchannels(),
+                    samples,
+                )
+
+    def _rms(self, samples):
+        return math.sqrt(sum(s * s for s in samples) / max(1, len(samples)))
+
+    def test_convert(self):
+        """Check rate, width, and channel conversion."""
+        for (rate, width, channels), (new_rate, new_width, new_channels) in [
+            ((44100, 2, 2), (16000, 2, 1)),
+            ((48000, 4, 1), (16000, 2, 1)),
+            ((8000, 1, 1), (16000, 2, 1)),
+            ((16000, 2, 1), (16000, 3, 2)),
+            ((22050, 3, 2), (16000, 2, 2)),
+        ]:
+            with self.subTest((rate, width, channels)):
+                wav_bytes = self._make_wav(
+                    self._tone(440, rate, 0.5, channels=channels),
+                    rate,
+                    width,
+                    channels,
+                )
+                actual_rate, actual_width, actual_channels, samples = self._convert(
+                    wav_bytes, new_rate, new_width, new_channels
+                )
+
+                self.assertEqual(new_rate, actual_rate)
+                self.assertEqual(new_width, actual_width)
+                self.assertEqual(new_channels, actual_channels)
+                self.assertEqual(int(0.5 * new_rate), len(samples) // new_channels)
+
+                # Tone is kept (RMS of sine wave is amplitude / sqrt(2))
+                self.assertAlmostEqual(0.5 / math.sqrt(2), self._rms(samples), places=2)
+
+    def test_downsample_filter(self):
+        """Check that frequencies above the new Nyquist frequency are removed."""
+        wav_bytes = self._make_wav(self._tone(10000, 48000, 0.5), 48000, 2, 1)
+        _, _, _, samples = self._convert(wav_bytes, 16000, 2, 1)
+
+        # Aliased tone would be at 6 Khz
+        self.assertLess(self._rms(samples), 0.01)
+
+    def test_empty(self):
+        """Check that empty WAV files are converted."""
+        for rate in [8000, 16000, 44100]:
+            with self.subTest(rate):
+                wav_bytes = self._make_wav([], rate, 2, 2)
+                actual_rate, _, _, samples = self._convert(wav_bytes, 16000, 2, 1)
+                self.assertEqual(16000, actual_rate)
+                self.assertEqual([], samples)
+
 
 # -----------------------------------------------------------------------------
 
@@ -192,6 +953,9 @@ if __name__ == "__main__":
 
     voice2json_dir = Path(args.voice2json or os.getcwd())
 
+    # Import voice2json modules from source for unit tests
+    sys.path.insert(0, str(voice2json_dir))
+
     for profile_dir in args.profile:
         profile_dirs.append(Path(profile_dir))
 
@@ -15,19 +15,9 @@ import time
 import typing
 from pathlib import Path
 
-import pydash
-import yaml
-
 from .core import Voice2JsonCore
-from .generate import generate
-from .pronounce import pronounce
-from .recognize import recognize
-from .record import record_command, record_examples
-from .speak import speak
-from .test import test_examples
-from .transcribe import transcribe_stream, transcribe_wav
-from .utils import env_constructor, print_json, recursive_update
-from .wake import wake
+from .profile import explain_profile, load_profile
+from .utils import JsonLinesSink
 
 _LOGGER = logging.getLogger("voice2json")
 
@@ -37,8 +27,16 @@ _LOGGER = logging.getLogger("voice2json")
 
 async def main():
     """Called at startup."""
-    # Expand environment variables in string value
-    yaml.SafeLoader.add_constructor("!env", env_constructor)
+    # CPU time used by Python startup and imports so far
+    startup_cpu_seconds = time.process_time()
+    phase_times: typing.Dict[str, float] = {}
+    phase_start = time.perf_counter()
+
+    def end_phase(phase_name: str):
+        nonlocal phase_start
+        phase_end = time.perf_counter()
+        phase_times[phase_name] = phase_end - phase_start
+        phase_start = phase_end
 
     if len(sys.argv) > 1:
         if sys.argv[1] == "--version":
@@ -60,19 +58,68 @@ async def main():
         logging.basicConfig(level=logging.INFO)
 
     _LOGGER.debug(args)
+    end_phase("parse_args")
 
-    if args.command in ["print-downloads", "print-version"]:
-        # Special-case commands (no core loaded)
-        await args.func(args)
-    else:
-        # Load profile and create core
-        core = get_core(args)
+    try:
+        if args.command in ["print-downloads", "print-version"]:
+            # Special-case commands (no core loaded)
+            func = get_command_func(args.func)
+            end_phase("import_command")
+
+            await func(args)
+            end_phase("command")
+        else:
+            # Load profile and create core
+            core = get_core(args)
+            end_phase("load_profile")
+
+            # Sub-command module is only imported now
+            func = get_command_func(args.func)
+            end_phase("import_command")
+
+            # Call sub-commmand
+            try:
+                await func(args, core)
+            finally:
+                await core.stop()
+                end_phase("command")
+    finally:
+        if args.profile_startup:
+            print_startup_profile(startup_cpu_seconds, phase_times)
+
+
+def get_command_func(func: typing.Union[str, typing.Callable]) -> typing.Callable:
+    """Import sub-command function given as ".module:function" (if needed)."""
+    if callable(func):
+        return func
+
+    import importlib
+
+    module_name, func_name = func.split(":", maxsplit=1)
+    module = importlib.import_module(module_name, package=__package__)
+
+    return getattr(module, func_name)
 
-        # Call sub-commmand
-        try:
-            await args.func(args, core)
-        finally:
-            await core.stop()
+
+def print_startup_profile(
+    startup_cpu_seconds: float, phase_times: typing.Dict[str, float]
+):
+    """Print seconds spent in each startup phase to stderr as JSON."""
+    startup_seconds = sum(
+        phase_times.get(phase_name, 0.0)
+        for phase_name in ["parse_args", "load_profile", "import_command"]
+    )
+
+    json.dump(
+        {
+            "startup_cpu_seconds": startup_cpu_seconds,
+            "phase_seconds": phase_times,
+            "startup_seconds": startup_seconds,
+            "modules_loaded": len(sys.modules),
+        },
+        sys.stderr,
+    )
+    print("", file=sys.stderr)
 
 
 # -----------------------------------------------------------------------------
@@ -104,6 +151,16 @@ def get_args() -> argparse.Namespace:
     parser.add_argument(
         "--debug", action="store_true", help="Print DEBUG log to console"
     )
+    parser.add_argument(
+        "--no-profile-cache",
+        action="store_true",
+        help="Always parse profile YAML instead of using cached settings",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print seconds spent importing and loading profile to stderr",
+    )
 
     # Create subparsers for each sub-command
     sub_parsers = parser.add_subparsers()
@@ -124,6 +181,11 @@ def get_args() -> argparse.Namespace:
     print_parser = sub_parsers.add_parser(
         "print-profile", help="Print profile JSON to stdout"
     )
+    print_parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="Print value and source (file, platform, --setting) of each setting",
+    )
     print_parser.set_defaults(func=print_profile)
 
     # -------------
@@ -185,6 +247,11 @@ def get_args() -> argparse.Namespace:
     train_parser = sub_parsers.add_parser(
         "train-profile", help="Train voice2json profile"
     )
+    train_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-run all training stages, even if their inputs have not changed",
+    )
     train_parser.set_defaults(func=train)
 
     # --------------
@@ -193,7 +260,7 @@ def get_args() -> argparse.Namespace:
     transcribe_wav_parser = sub_parsers.add_parser(
         "transcribe-wav", help="Transcribe WAV file to text"
     )
-    transcribe_wav_parser.set_defaults(func=transcribe_wav)
+    transcribe_wav_parser.set_defaults(func=".transcribe:transcribe_wav")
     transcribe_wav_parser.add_argument(
         "--stdin-files",
         "-f",
@@ -214,6 +281,18 @@ def get_args() -> argparse.Namespace:
         action="store_true",
         help="WAV file byte size is sent on a separate line for each input WAV on stdin",
     )
+    transcribe_wav_parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of WAV files to transcribe at the same time (Pocketsphinx/Julius only, default=1)",
+    )
+    transcribe_wav_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="Number of WAV files per decoder run (Kaldi only, 0 for all, default=64)",
+    )
     transcribe_wav_parser.add_argument(
         "wav_file", nargs="*", default=[], help="Path(s) to WAV file(s)"
     )
@@ -224,7 +303,7 @@ def get_args() -> argparse.Namespace:
     transcribe_stream_parser = sub_parsers.add_parser(
         "transcribe-stream", help="Transcribe live stream of WAV chunks to text"
     )
-    transcribe_stream_parser.set_defaults(func=transcribe_stream)
+    transcribe_stream_parser.set_defaults(func=".transcribe:transcribe_stream")
     transcribe_stream_parser.add_argument(
         "--audio-source",
         "-a",
@@ -259,11 +338,32 @@ def get_args() -> argparse.Namespace:
     transcribe_stream_parser.add_argument(
         "--event-sink", "-e", help="File to write JSON voice command events to"
     )
+    transcribe_stream_parser.add_argument(
+        "--metrics-sink",
+        help="File to write JSON audio pipeline statistics to after each voice command",
+    )
+    transcribe_stream_parser.add_argument(
+        "--buffer-seconds",
+        type=float,
+        default=30.0,
+        help="Seconds of audio to buffer while waiting for the decoder (default: 30)",
+    )
     transcribe_stream_parser.add_argument(
         "--timeout",
         type=float,
         help="Seconds to wait for a transcription before exiting (default: None)",
     )
+    transcribe_stream_parser.add_argument(
+        "--partial",
+        action="store_true",
+        help="Print partial transcriptions while speech is ongoing (Pocketsphinx/Kaldi only)",
+    )
+    transcribe_stream_parser.add_argument(
+        "--partial-interval",
+        type=float,
+        default=0.5,
+        help="Seconds of audio between partial transcriptions (default: 0.5)",
+    )
 
     # ----------------
     # recognize-intent
@@ -271,7 +371,7 @@ def get_args() -> argparse.Namespace:
     recognize_parser = sub_parsers.add_parser(
         "recognize-intent", help="Recognize intent from JSON or text"
     )
-    recognize_parser.set_defaults(func=recognize)
+    recognize_parser.set_defaults(func=".recognize:recognize")
     recognize_parser.add_argument(
         "sentence", nargs="*", default=[], help="Sentences to recognize"
     )
@@ -303,6 +403,18 @@ def get_args() -> argparse.Namespace:
         default="text",
         help="JSON property containing transcription text (default: text)",
     )
+    recognize_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to recognize sentences with (default=1)",
+    )
+    recognize_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=100,
+        help="Number of sentences sent to a worker at a time (default=100)",
+    )
 
     # --------------
     # record-command
@@ -332,7 +444,7 @@ def get_args() -> argparse.Namespace:
     command_parser.add_argument(
         "--event-sink", "-e", help="File to write JSON events to instead of stdout"
     )
-    command_parser.set_defaults(func=record_command)
+    command_parser.set_defaults(func=".record:record_command")
 
     # ---------
     # wait-wake
@@ -356,7 +468,7 @@ def get_args() -> argparse.Namespace:
         type=int,
         help="Exit after the wake word has been spoken some number of times",
     )
-    wake_parser.set_defaults(func=wake)
+    wake_parser.set_defaults(func=".wake:wake")
 
     # --------------
     # pronounce-word
@@ -395,7 +507,7 @@ def get_args() -> argparse.Namespace:
         action="store_true",
         help="Print a blank line after the end of each word's pronunciations",
     )
-    pronounce_parser.set_defaults(func=pronounce)
+    pronounce_parser.set_defaults(func=".pronounce:pronounce")
 
     # -----------------
     # generate-examples
@@ -404,7 +516,18 @@ def get_args() -> argparse.Namespace:
         "generate-examples", help="Randomly generate example intents from profile"
     )
     generate_parser.add_argument(
-        "--number", "-n", type=int, required=True, help="Number of examples to generate"
+        "--number",
+        "-n",
+        type=int,
+        help="Number of examples to generate (0 for all possible sentences)",
+    )
+    generate_parser.add_argument(
+        "--seed", type=int, help="Seed for random number generator"
+    )
+    generate_parser.add_argument(
+        "--count",
+        action="store_true",
+        help="Print number of possible sentences and exit",
     )
     generate_parser.add_argument(
         "--raw-symbols",
@@ -414,7 +537,7 @@ def get_args() -> argparse.Namespace:
     generate_parser.add_argument(
         "--iob", action="store_true", help="Output IOB format instead of JSON"
     )
-    generate_parser.set_defaults(func=generate)
+    generate_parser.set_defaults(func=".generate:generate")
 
     # record-examples
     record_examples_parser = sub_parsers.add_parser(
@@ -435,7 +558,7 @@ def get_args() -> argparse.Namespace:
         default=1024,
         help="Number of bytes to read at a time from stdin",
     )
-    record_examples_parser.set_defaults(func=record_examples)
+    record_examples_parser.set_defaults(func=".record:record_examples")
 
     # -------------
     # test-examples
@@ -465,9 +588,89 @@ def get_args() -> argparse.Namespace:
         "--threads",
         type=int,
         default=1,
-        help="Maximum number of threads to use (default=1)",
+        help="Number of worker processes (or Julius decoders) to use (default=1)",
+    )
+    test_examples_parser.set_defaults(func=".test:test_examples")
+
+    # -----
+    # serve
+    # -----
+    serve_parser = sub_parsers.add_parser(
+        "serve", help="Answer requests over a local socket with profile kept loaded"
+    )
+    serve_parser.add_argument(
+        "--socket",
+        help="Path to Unix domain socket (default: <PROFILE_DIR>/voice2json.sock)",
+    )
+    serve_parser.add_argument(
+        "--port", type=int, help="Listen on TCP port instead of Unix socket"
+    )
+    serve_parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Host for TCP socket (default: 127.0.0.1)",
+    )
+    serve_parser.add_argument(
+        "--open",
+        "-o",
+        action="store_true",
+        help="Pre-load large pre-built model for transcription",
+    )
+    serve_parser.add_argument(
+        "--no-warm",
+        action="store_true",
+        help="Don't load transcriber/recognizer until first request",
+    )
+    serve_parser.set_defaults(func=".serve:serve")
+
+    # -------------
+    # serve-streams
+    # -------------
+    serve_streams_parser = sub_parsers.add_parser(
+        "serve-streams",
+        help="Transcribe many live audio streams over a socket with shared decoders",
+    )
+    serve_streams_parser.add_argument(
+        "--socket",
+        help="Path to Unix domain socket (default: <PROFILE_DIR>/voice2json-streams.sock)",
+    )
+    serve_streams_parser.add_argument(
+        "--port", type=int, help="Listen on TCP port instead of Unix socket"
     )
-    test_examples_parser.set_defaults(func=test_examples)
+    serve_streams_parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Host for TCP socket (default: 127.0.0.1)",
+    )
+    serve_streams_parser.add_argument(
+        "--open",
+        "-o",
+        action="store_true",
+        help="Use large pre-built model for transcription",
+    )
+    serve_streams_parser.add_argument(
+        "--decoders",
+        type=int,
+        default=2,
+        help="Number of decoders shared by all streams (default: 2)",
+    )
+    serve_streams_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=1024,
+        help="Number of bytes to read at a time from each stream",
+    )
+    serve_streams_parser.add_argument(
+        "--metrics-sink",
+        help="File to write JSON decoder/stream statistics to periodically",
+    )
+    serve_streams_parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between statistics written to metrics sink (default: 60)",
+    )
+    serve_streams_parser.set_defaults(func=".serve_streams:serve_streams")
 
     # ------------------
     # show-documentation
@@ -494,7 +697,7 @@ def get_args() -> argparse.Namespace:
     speak_parser.add_argument(
         "--marytts", action="store_true", help="Use MaryTTS instead of eSpeak"
     )
-    speak_parser.set_defaults(func=speak)
+    speak_parser.set_defaults(func=".speak:speak")
 
     return parser.parse_args()
 
@@ -544,61 +747,29 @@ def get_core(args: argparse.Namespace) -> Voice2JsonCore:
     # x86_64, armv7l, armv6l, ...
     os.environ["machine"] = args.machine
 
-    # Load profile defaults
-    defaults_yaml = args.base_directory / "etc" / "profile.defaults.yml"
-    if defaults_yaml.exists():
-        _LOGGER.debug("Loading profile defaults from %s", defaults_yaml)
-        with open(defaults_yaml, "r") as defaults_file:
-            profile = yaml.safe_load(defaults_file)
-    else:
-        # No defaults
-        profile = {}
-
-    # Load profile (YAML)
-    _LOGGER.debug("Loading profile from %s", profile_yaml)
-
     if profile_yaml.exists():
         os.environ["profile_file"] = str(profile_yaml)
 
-        with open(profile_yaml, "r") as profile_file:
-            recursive_update(profile, yaml.safe_load(profile_file) or {})
-    else:
-        _LOGGER.warning("%s does not exist. Using default settings.", profile_yaml)
-
-    # Override with platform-specific settings
-    platform_overrides = profile.get("platform", [])
-    for platform_settings in platform_overrides:
-        machines = platform_settings.get("machine")
-        machine_settings = platform_settings.get("settings", {})
-
-        if machines and machine_settings:
-            if isinstance(machines, str):
-                # Ensure list
-                machines = [machines]
-
-            if args.machine in machines:
-                # Machine match: override settings
-                for key, value in machine_settings.items():
-                    _LOGGER.debug("Overriding %s (machine=%s)", key, args.machine)
-                    recursive_update(profile[key], value)
-
-    # Override with user settings
-    for setting_path, setting_value in args.setting:
-        try:
-            setting_value = json.loads(setting_value)
-        except json.JSONDecodeError:
-            _LOGGER.warning(
-                "Interpreting setting for %s as a string. Surround with quotes to avoid this warning.",
-                setting_path,
-            )
-            pass
-
-        _LOGGER.debug("Overriding %s with %s", setting_path, setting_value)
-        pydash.set_(profile, setting_path, setting_value)
+    # Resolved profile is cached next to profile.yml
+    cache_path: typing.Optional[Path] = None
+    if not args.no_profile_cache:
+        cache_path = profile_dir / "profile_cache.pickle"
+
+    profile, profile_sources = load_profile(
+        args.base_directory / "etc" / "profile.defaults.yml",
+        profile_yaml,
+        args.machine,
+        settings=args.setting,
+        cache_path=cache_path,
+    )
 
     # Create core
     return Voice2JsonCore(
-        profile_yaml, profile, certfile=args.certfile, keyfile=args.keyfile
+        profile_yaml,
+        profile,
+        certfile=args.certfile,
+        keyfile=args.keyfile,
+        profile_sources=profile_sources,
     )
 
 
@@ -616,7 +787,13 @@ async def print_version(args: argparse.Namespace) -> None:
 
 async def print_profile(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Print all settings as JSON."""
-    json.dump(core.profile, sys.stdout, indent=4)
+    if args.explain:
+        # Value and source of each setting
+        json.dump(
+            explain_profile(core.profile, core.profile_sources), sys.stdout, indent=4
+        )
+    else:
+        json.dump(core.profile, sys.stdout, indent=4)
 
 
 # -----------------------------------------------------------------------------
@@ -646,6 +823,8 @@ async def print_files(args: argparse.Namespace, core: Voice2JsonCore) -> None:
 
 async def print_downloads(args: argparse.Namespace) -> None:
     """Print links to files for profiles."""
+    import yaml
+
     profiles_dir = args.base_directory / "etc" / "profiles"
 
     if args.list_profiles:
@@ -661,6 +840,8 @@ async def print_downloads(args: argparse.Namespace) -> None:
     # Names of profiles to check
     profile_names = set(args.profile_names)
 
+    sink = JsonLinesSink.for_batch()
+
     # Each YAML file is a profile name with required and optional files
     for yaml_path in profiles_dir.glob("*.yml"):
         profile_name = yaml_path.stem
@@ -733,7 +914,9 @@ async def print_downloads(args: argparse.Namespace) -> None:
                 )
                 file_info["profile-directory"] = str(profile_dir)
 
-                print_json(file_info)
+                sink.write(file_info)
+
+    sink.close()
 
 
 # -----------------------------------------------------------------------------
@@ -742,9 +925,13 @@ async def print_downloads(args: argparse.Namespace) -> None:
 async def train(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Create speech/intent artifacts for a profile."""
     start_time = time.perf_counter()
-    await core.train_profile()
+    stages = await core.train_profile(force=args.force)
     end_time = time.perf_counter()
 
+    for stage_name, stage in stages.items():
+        status = "ran" if stage["ran"] else "skipped"
+        print(f"{stage_name}: {status} in", stage["seconds"], "second(s)")
+
     print("Training completed in", end_time - start_time, "second(s)")
 
 
@@ -0,0 +1,316 @@
+"""On-disk cache of speech to text results, keyed by audio content."""
+import dataclasses
+import hashlib
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+import typing
+import wave
+from pathlib import Path
+
+from .utils import fingerprint, hash_file
+
+_LOGGER = logging.getLogger("voice2json.cache")
+
+# Bump when the cache schema changes
+CACHE_VERSION = 1
+
+# -----------------------------------------------------------------------------
+
+
+class TranscriptionCache:
+    """SQLite cache of transcriptions with least-recently-used eviction.
+
+    Entries are keyed by a hash of the audio data plus a fingerprint of the
+    transcriber (acoustic model, dictionary, language model, etc.). Retraining
+    changes the fingerprint, so old entries are never returned and eventually
+    age out.
+    """
+
+    def __init__(
+        self,
+        cache_path: typing.Union[str, Path],
+        max_size_bytes: int = 0,
+    ):
+        self.cache_path = Path(cache_path)
+        self.max_size_bytes = max_size_bytes
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+        # Connection may be shared between threads (serve)
+        self.lock = threading.Lock()
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(
+            str(self.cache_path), timeout=30, check_same_thread=False
+        )
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)"
+            )
+            version = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()
+
+            if (version is not None) and (int(version[0]) != CACHE_VERSION):
+                _LOGGER.debug("Clearing cache %s (old version)", self.cache_path)
+                self.connection.execute("DROP TABLE IF EXISTS transcriptions")
+                self.connection.execute("DROP TABLE IF EXISTS files")
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                (CACHE_VERSION,),
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS transcriptions "
+                + "(key TEXT PRIMARY KEY, result TEXT, size INTEGER, last_used REAL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS transcriptions_last_used "
+                + "ON transcriptions (last_used)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS files "
+                + "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)"
+            )
+
+    def get(self, key: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """Get cached result and mark it as recently used."""
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT result FROM transcriptions WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE transcriptions SET last_used = ? WHERE key = ?",
+                (time.time(), key),
+            )
+
+        return json.loads(row[0])
+
+    def put(self, key: str, result: typing.Dict[str, typing.Any]):
+        """Store result, evicting least-recently-used entries if necessary."""
+        result_json = json.dumps(result)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO transcriptions (key, result, size, last_used) "
+                + "VALUES (?, ?, ?, ?)",
+                (key, result_json, len(result_json), time.time()),
+            )
+
+            if self.max_size_bytes > 0:
+                self.evict()
+
+    def evict(self):
+        """Delete least-recently-used entries until cache fits in max size."""
+        (total_size,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM transcriptions"
+        ).fetchone()
+
+        if total_size <= self.max_size_bytes:
+            return
+
+        evict_keys: typing.List[str] = []
+        for key, size in self.connection.execute(
+            "SELECT key, size FROM transcriptions ORDER BY last_used"
+        ):
+            evict_keys.append(key)
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
+
+        _LOGGER.debug("Evicting %s cached transcription(s)", len(evict_keys))
+        self.connection.executemany(
+            "DELETE FROM transcriptions WHERE key = ?", [(k,) for k in evict_keys]
+        )
+
+    def hash_file(self, path: Path) -> str:
+        """Get SHA256 of file contents. Re-used while file size/mtime are the same."""
+        stat = path.stat()
+        path_key = str(path.absolute())
+
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (path_key,)
+            ).fetchone()
+
+            if row and (row[0] == stat.st_size) and (row[1] == stat.st_mtime_ns):
+                return row[2]
+
+            digest = hash_file(path)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) "
+                + "VALUES (?, ?, ?, ?)",
+                (path_key, stat.st_size, stat.st_mtime_ns, digest),
+            )
+
+        return digest
+
+    def fingerprint(self, *inputs: typing.Any) -> str:
+        """Combine file/directory contents and settings into a single hash."""
+        return fingerprint(*inputs, hash_file_func=self.hash_file)
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """Get hit/miss counts."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups > 0 else 0.0,
+        }
+
+    def close(self):
+        """Close database connection."""
+        self.connection.close()
+
+
+# -----------------------------------------------------------------------------
+
+
+class CachedTranscriber:
+    """Wraps a transcriber, returning cached results for audio seen before.
+
+    Only transcribe_wav is cached. Streams are always sent to the transcriber.
+    """
+
+    def __init__(self, transcriber, cache: TranscriptionCache, fingerprint: str):
+        self.transcriber = transcriber
+        self.cache = cache
+        self.fingerprint = fingerprint
+
+        # Number of utterances that can be transcribed at the same time
+        self.num_workers = getattr(transcriber, "num_workers", 1)
+
+        # True if transcriber can decode multiple WAVs at once
+        self.batch_decoding = getattr(transcriber, "batch_decoding", False)
+
+        # True if transcriber can report hypotheses during a stream
+        self.partial_results = getattr(transcriber, "partial_results", False)
+
+    def transcribe_wav(self, wav_bytes: bytes):
+        """Speech to text from WAV data (cached)."""
+        transcription = self.transcribe_cached(wav_bytes)
+        if transcription is None:
+            transcription = self.transcriber.transcribe_wav(wav_bytes)
+            self.store(wav_bytes, transcription)
+
+        return transcription
+
+    def transcribe_cached(self, wav_bytes: bytes):
+        """Get cached transcription for WAV data or None."""
+        from rhasspyasr import Transcription, TranscriptionToken
+
+        try:
+            result = self.cache.get(self.cache_key(wav_bytes))
+            if result is not None:
+                tokens = result.get("tokens")
+                if tokens is not None:
+                    result["tokens"] = [TranscriptionToken(**t) for t in tokens]
+
+                return Transcription(**result)
+        except Exception:
+            _LOGGER.exception("Failed to read from transcription cache")
+
+        return None
+
+    def store(self, wav_bytes: bytes, transcription):
+        """Save transcription of WAV data to cache."""
+        if transcription is None:
+            return
+
+        try:
+            self.cache.put(self.cache_key(wav_bytes), dataclasses.asdict(transcription))
+        except Exception:
+            _LOGGER.exception("Failed to write to transcription cache")
+
+    def transcribe_wavs(self, wavs: typing.Sequence[bytes]) -> typing.List[typing.Any]:
+        """Speech to text from multiple WAVs, only decoding those not cached."""
+        results = [self.transcribe_cached(wav_bytes) for wav_bytes in wavs]
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        if missing:
+            missing_wavs = [wavs[i] for i in missing]
+            if hasattr(self.transcriber, "transcribe_wavs"):
+                # Batch decoding
+                transcriptions = self.transcriber.transcribe_wavs(missing_wavs)
+            else:
+                transcriptions = [
+                    self.transcriber.transcribe_wav(wav_bytes)
+                    for wav_bytes in missing_wavs
+                ]
+
+            for i, transcription in zip(missing, transcriptions):
+                self.store(wavs[i], transcription)
+                results[i] = transcription
+
+        return results
+
+    def transcribe_stream(self, audio_stream, sample_rate, sample_width, channels):
+        """Speech to text from an audio stream (not cached)."""
+        return self.transcriber.transcribe_stream(
+            audio_stream, sample_rate, sample_width, channels
+        )
+
+    def transcribe_stream_partial(
+        self, audio_stream, sample_rate, sample_width, channels, on_partial=None
+    ):
+        """Speech to text from an audio stream with partial hypotheses (not cached)."""
+        if not self.partial_results:
+            return self.transcribe_stream(
+                audio_stream, sample_rate, sample_width, channels
+            )
+
+        return self.transcriber.transcribe_stream_partial(
+            audio_stream, sample_rate, sample_width, channels, on_partial
+        )
+
+    def start_decoder(self):
+        """Load decoder ahead of the first utterance (if supported)."""
+        start_decoder = getattr(self.transcriber, "start_decoder", None)
+        if start_decoder is not None:
+            start_decoder()
+
+    def cache_key(self, wav_bytes: bytes) -> str:
+        """Hash of transcriber fingerprint and audio samples."""
+        hasher = hashlib.sha256(self.fingerprint.encode())
+
+        try:
+            # Only audio format and samples matter, not other WAV chunks
+            with io.BytesIO(wav_bytes) as wav_io:
+                with wave.open(wav_io, "rb") as wav_file:
+                    hasher.update(
+                        repr(
+                            (
+                                wav_file.getframerate(),
+                                wav_file.getsampwidth(),
+                                wav_file.getnchannels(),
+                            )
+                        ).encode()
+                    )
+                    hasher.update(wav_file.readframes(wav_file.getnframes()))
+        except wave.Error:
+            # Not a WAV file we can read; hash everything
+            hasher.update(wav_bytes)
+
+        return hasher.hexdigest()
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """Get cache hit/miss counts."""
+        return self.cache.statistics()
+
+    def stop(self):
+        """Stop the transcriber and close cache."""
+        _LOGGER.debug("Transcription cache: %s", self.statistics())
+        self.transcriber.stop()
+        self.cache.close()
@@ -0,0 +1,23 @@
+"""Shared enums that are cheap to import."""
+from enum import Enum
+
+# -----------------------------------------------------------------------------
+
+
+class AcousticModelType(str, Enum):
+    """Support speech to text systems."""
+
+    DUMMY = "dummy"
+    POCKETSPHINX = "pocketsphinx"
+    KALDI = "kaldi"
+    JULIUS = "julius"
+    DEEPSPEECH = "deepspeech"
+
+
+class WordCasing(str, Enum):
+    """Word casing transformation types."""
+
+    DEFAULT = "default"
+    UPPER = "upper"
+    LOWER = "lower"
+    IGNORE = "ignore"
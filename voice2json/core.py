@@ -2,20 +2,26 @@
 Core voice2json command support.
 """
 import asyncio
+import functools
+import gzip
 import io
 import logging
 import os
 import queue
 import shlex
 import ssl
+import subprocess
 import sys
 import threading
+import time
 import typing
 import wave
 from pathlib import Path
 
 import pydash
 
+from .settings import ProfileSettings
+
 _LOGGER = logging.getLogger("voice2json.core")
 
 # -----------------------------------------------------------------------------
@@ -30,12 +36,19 @@ class Voice2JsonCore:
         profile: typing.Dict[str, typing.Any],
         certfile: typing.Optional[str] = None,
         keyfile: typing.Optional[str] = None,
+        profile_sources: typing.Optional[typing.Dict[str, str]] = None,
     ):
         """Initialize voice2json."""
         self.profile_file = profile_file
         self.profile_dir = profile_file.parent
         self.profile = profile
 
+        # setting path -> file/override the value came from
+        self.profile_sources = profile_sources or {}
+
+        # Settings used for every utterance/WAV
+        self.settings = ProfileSettings(profile, self.profile_dir)
+
         # Shared aiohttp client session (enable SSL)
         self.ssl_context = ssl.SSLContext()
         if certfile:
@@ -44,6 +57,9 @@ class Voice2JsonCore:
 
         self._http_session = None
 
+        # Conversion method -> count/timing
+        self.convert_statistics: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+
     @property
     def http_session(self):
         """Get or create async HTTP session."""
@@ -58,19 +74,34 @@ class Voice2JsonCore:
     # train-profile
     # -------------------------------------------------------------------------
 
-    async def train_profile(self):
+    async def train_profile(
+        self, force: bool = False
+    ) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
         """Generate speech/intent artifacts for a profile."""
         from . import train
 
-        await train.train_profile(self.profile_dir, self.profile)
+        return await train.train_profile(
+            self.profile_dir, self.profile, force=force, paths=self.settings.training
+        )
 
     # -------------------------------------------------------------------------
     # transcribe-wav
     # -------------------------------------------------------------------------
 
-    def get_transcriber(self, open_transcription=False, debug=False):
-        """Create Transcriber based on profile speech system."""
-        from .train import AcousticModelType
+    def get_transcriber(
+        self,
+        open_transcription=False,
+        debug=False,
+        num_workers=1,
+        partial_interval: typing.Optional[float] = None,
+    ):
+        """Create Transcriber based on profile speech system.
+
+        num_workers > 1 starts a pool of decoders (Pocketsphinx/Julius only).
+        partial_interval is the seconds of audio between partial hypotheses
+        during a stream (Pocketsphinx/Kaldi only).
+        """
+        from .const import AcousticModelType
 
         # Load settings
         acoustic_model_type = AcousticModelType(
@@ -81,33 +112,107 @@ class Voice2JsonCore:
 
         if acoustic_model_type == AcousticModelType.POCKETSPHINX:
             # Pocketsphinx
-            return self.get_pocketsphinx_transcriber(
-                open_transcription=open_transcription, debug=debug
+            transcriber = self.get_pocketsphinx_transcriber(
+                open_transcription=open_transcription,
+                debug=debug,
+                num_workers=num_workers,
+                partial_interval=partial_interval,
             )
-
-        if acoustic_model_type == AcousticModelType.KALDI:
+        elif acoustic_model_type == AcousticModelType.KALDI:
             # Kaldi
-            return self.get_kaldi_transcriber(
-                open_transcription=open_transcription, debug=debug
+            transcriber = self.get_kaldi_transcriber(
+                open_transcription=open_transcription,
+                debug=debug,
+                partial_interval=partial_interval,
             )
-
-        if acoustic_model_type == AcousticModelType.JULIUS:
+        elif acoustic_model_type == AcousticModelType.JULIUS:
             # Julius
-            return self.get_julius_transcriber(
-                open_transcription=open_transcription, debug=debug
+            transcriber = self.get_julius_transcriber(
+                open_transcription=open_transcription,
+                debug=debug,
+                num_workers=num_workers,
             )
-
-        if acoustic_model_type == AcousticModelType.DEEPSPEECH:
+        elif acoustic_model_type == AcousticModelType.DEEPSPEECH:
             # DeepSpeech
-            return self.get_deepspeech_transcriber(
+            transcriber = self.get_deepspeech_transcriber(
                 open_transcription=open_transcription, debug=debug
             )
+        else:
+            raise ValueError(f"Unsupported acoustic model type: {acoustic_model_type}")
+
+        if (num_workers > 1) and (
+            acoustic_model_type
+            not in [AcousticModelType.POCKETSPHINX, AcousticModelType.JULIUS]
+        ):
+            _LOGGER.warning(
+                "Multiple decoders not supported for %s. Using one.",
+                acoustic_model_type.value,
+            )
+
+        if pydash.get(self.profile, "speech-to-text.cache.enabled", False):
+            # Re-use transcriptions of WAV data that was seen before
+            return self.get_cached_transcriber(
+                transcriber, acoustic_model_type.value, open_transcription
+            )
 
-        raise ValueError(f"Unsupported acoustic model type: {acoustic_model_type}")
+        return transcriber
 
-    def get_pocketsphinx_transcriber(self, open_transcription=False, debug=False):
+    def get_cached_transcriber(
+        self, transcriber, acoustic_model_type: str, open_transcription=False
+    ):
+        """Wrap Transcriber with an on-disk cache of its results."""
+        from .cache import CachedTranscriber, TranscriptionCache
+
+        cache_path = self.ppath("speech-to-text.cache.file", "transcription_cache.db")
+        assert cache_path, "Missing transcription cache file"
+
+        cache = TranscriptionCache(
+            cache_path,
+            max_size_bytes=int(
+                pydash.get(self.profile, "speech-to-text.cache.max-size-bytes", 0)
+            ),
+        )
+
+        # Anything that could change a transcription (including re-training)
+        if open_transcription:
+            model_files = [
+                self.ppath("speech-to-text.base-dictionary", "base_dictionary.txt"),
+                self.ppath("speech-to-text.base-language-model"),
+                self.ppath("speech-to-text.kaldi.base-graph-directory"),
+                self.ppath("speech-to-text.deepspeech.base-language-model"),
+                self.ppath("speech-to-text.deepspeech.base-trie"),
+            ]
+        else:
+            model_files = [
+                self.ppath("speech-to-text.dictionary", "dictionary.txt"),
+                self.ppath("speech-to-text.language-model", "language_model.txt"),
+                self.ppath("speech-to-text.kaldi.graph-directory"),
+                self.ppath("speech-to-text.deepspeech.trie"),
+            ]
+
+        fingerprint = cache.fingerprint(
+            acoustic_model_type,
+            open_transcription,
+            self.ppath("speech-to-text.acoustic-model", "acoustic_model"),
+            self.ppath("speech-to-text.pocketsphinx.mllr-matrix", "mllr_matrix"),
+            *[p for p in model_files if p is not None],
+        )
+
+        _LOGGER.debug("Using transcription cache %s (%s)", cache_path, fingerprint)
+
+        return CachedTranscriber(transcriber, cache, fingerprint)
+
+    def get_pocketsphinx_transcriber(
+        self,
+        open_transcription=False,
+        debug=False,
+        num_workers=1,
+        partial_interval: typing.Optional[float] = None,
+    ):
         """Create Transcriber for Pocketsphinx."""
-        from rhasspyasr_pocketsphinx import PocketsphinxTranscriber
+        from .pocketsphinx import PocketsphinxStreamTranscriber
+        from .pocketsphinx import load_transcriber as load_pocketsphinx_transcriber
+        from .pool import ProcessPoolTranscriber
 
         # Load settings
         acoustic_model = self.ppath("speech-to-text.acoustic-model", "acoustic_model")
@@ -137,7 +242,7 @@ class Voice2JsonCore:
             "speech-to-text.pocketsphinx.mllr-matrix", "mllr_matrix"
         )
 
-        return PocketsphinxTranscriber(
+        transcriber = PocketsphinxStreamTranscriber(
             acoustic_model,
             dictionary,
             language_model,
@@ -145,9 +250,38 @@ class Voice2JsonCore:
             debug=debug,
         )
 
-    def get_kaldi_transcriber(self, open_transcription=False, debug=False):
+        if partial_interval is not None:
+            transcriber.partial_interval = partial_interval
+
+        if num_workers > 1:
+            # Load decoder once, then share it with forked worker processes
+            transcriber.decoder = transcriber.get_decoder()
+            return ProcessPoolTranscriber(
+                transcriber,
+                num_workers=num_workers,
+                transcriber_factory=functools.partial(
+                    load_pocketsphinx_transcriber,
+                    acoustic_model,
+                    dictionary,
+                    language_model,
+                    mllr_matrix=mllr_matrix,
+                    debug=debug,
+                    partial_interval=partial_interval,
+                ),
+            )
+
+        return transcriber
+
+    def get_kaldi_transcriber(
+        self,
+        open_transcription=False,
+        debug=False,
+        partial_interval: typing.Optional[float] = None,
+    ):
         """Create Transcriber for Kaldi."""
-        from rhasspyasr_kaldi import KaldiCommandLineTranscriber, KaldiModelType
+        from rhasspyasr_kaldi import KaldiModelType
+
+        from .kaldi import KaldiBatchTranscriber
 
         # Load settings
         model_type = KaldiModelType(
@@ -168,8 +302,13 @@ class Voice2JsonCore:
                 acoustic_model / "graph"
             )
 
-        # Use kaldi-decode script
-        return KaldiCommandLineTranscriber(model_type, acoustic_model, graph_dir)
+        # Use Kaldi command-line programs (can decode in batches)
+        transcriber = KaldiBatchTranscriber(model_type, acoustic_model, graph_dir)
+
+        if partial_interval is not None:
+            transcriber.partial_interval = partial_interval
+
+        return transcriber
 
     def get_deepspeech_transcriber(self, open_transcription=False, debug=False):
         """Create Transcriber for DeepSpeech."""
@@ -197,9 +336,11 @@ class Voice2JsonCore:
 
         return DeepSpeechTranscriber(acoustic_model, language_model, trie)
 
-    def get_julius_transcriber(self, open_transcription=False, debug=False):
+    def get_julius_transcriber(
+        self, open_transcription=False, debug=False, num_workers=1
+    ):
         """Create Transcriber for Julius."""
-        from .julius import JuliusTranscriber
+        from .julius import JuliusTranscriber, JuliusTranscriberPool
 
         # Load settings
         acoustic_model = self.ppath("speech-to-text.acoustic-model", "acoustic_model")
@@ -224,51 +365,200 @@ class Voice2JsonCore:
 
         assert dictionary and language_model, "Missing dictionary or language model"
 
+        if num_workers > 1:
+            # Multiple Julius processes
+            return JuliusTranscriberPool(
+                self,
+                acoustic_model,
+                dictionary,
+                language_model,
+                num_workers=num_workers,
+                debug=debug,
+            )
+
         return JuliusTranscriber(
             self, acoustic_model, dictionary, language_model, debug=debug
         )
 
     # -------------------------------------------------------------------------
-    # record-command
+    # recognize-intent
     # -------------------------------------------------------------------------
 
-    def get_command_recorder(self):
-        """Get voice command recorder based on profile settings."""
-        from rhasspysilence import WebRtcVadRecorder
+    def load_intent_graph(self):
+        """Load intent graph created during training.
+
+        Prefers the memory-mapped compact graph, falling back to the gzipped
+        networkx pickle if the compact graph is missing or out of date.
+        """
+        import networkx as nx
+
+        from .graph import load_compact_graph
+
+        intent_graph_path = self.ppath(
+            "intent-recognition.intent-graph", "intent.pickle.gz"
+        )
+        assert intent_graph_path, "Missing intent graph"
+
+        compact_graph_path = self.ppath(
+            "intent-recognition.compact-intent-graph", "intent.graph"
+        )
+
+        if (
+            compact_graph_path
+            and compact_graph_path.is_file()
+            and (
+                (not intent_graph_path.is_file())
+                or (
+                    compact_graph_path.stat().st_mtime
+                    >= intent_graph_path.stat().st_mtime
+                )
+            )
+        ):
+            try:
+                _LOGGER.debug("Loading %s", compact_graph_path)
+                return load_compact_graph(compact_graph_path)
+            except ValueError:
+                _LOGGER.warning(
+                    "Failed to load %s. Re-run train-profile.", compact_graph_path
+                )
+
+        _LOGGER.debug("Loading %s", intent_graph_path)
+        with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
+            return nx.readwrite.gpickle.read_gpickle(graph_gzip)
+
+    def load_fuzzy_index(self, intent_graph):
+        """Load fuzzy recognition index for a compact intent graph (if up to date)."""
+        from .fuzzy import load_fuzzy_index
+        from .graph import CompactGraph
+
+        if not isinstance(intent_graph, CompactGraph):
+            # Index only applies to compact graph
+            return None
+
+        fuzzy_index_path = self.ppath("intent-recognition.fuzzy-index", "intent.index")
+        compact_graph_path = self.ppath(
+            "intent-recognition.compact-intent-graph", "intent.graph"
+        )
+
+        if not (
+            fuzzy_index_path
+            and compact_graph_path
+            and fuzzy_index_path.is_file()
+            and (fuzzy_index_path.stat().st_mtime >= compact_graph_path.stat().st_mtime)
+        ):
+            _LOGGER.debug("No up to date fuzzy index at %s", fuzzy_index_path)
+            return None
+
+        try:
+            _LOGGER.debug("Loading %s", fuzzy_index_path)
+            return load_fuzzy_index(fuzzy_index_path, intent_graph)
+        except ValueError:
+            _LOGGER.warning(
+                "Failed to load %s. Re-run train-profile.", fuzzy_index_path
+            )
+
+        return None
+
+    def get_recognizer(self):
+        """Create intent recognizer from profile settings."""
+        from .const import WordCasing
+        from .recognize import (
+            IntentRecognizer,
+            RecognitionCache,
+            load_converters,
+            load_stop_words,
+        )
 
         # Load settings
-        vad_mode = int(pydash.get(self.profile, "voice-command.vad-mode", 3))
-        min_seconds = float(
-            pydash.get(self.profile, "voice-command.minimum-seconds", 1)
+        language_code = pydash.get(self.profile, "language.code", "en-US")
+        word_casing = WordCasing(
+            pydash.get(self.profile, "training.word-casing", "ignore").lower()
         )
-        max_seconds = float(
-            pydash.get(self.profile, "voice-command.maximum-seconds", 30)
+        converters_dir = self.ppath("training.converters-directory", "converters")
+        stop_words_path = self.ppath("intent-recognition.stop-words", "stop_words.txt")
+        fuzzy = pydash.get(self.profile, "intent-recognition.fuzzy", True)
+        persistent_converters = pydash.get(
+            self.profile, "intent-recognition.persistent-converters", []
         )
-        speech_seconds = float(
-            pydash.get(self.profile, "voice-command.speech-seconds", 0.3)
+        persistent_timeout = pydash.get(
+            self.profile, "intent-recognition.persistent-converter-timeout", 10
         )
-        silence_seconds = float(
-            pydash.get(self.profile, "voice-command.silence-seconds", 0.5)
+        nondeterministic_converters = pydash.get(
+            self.profile, "intent-recognition.nondeterministic-converters", []
         )
-        before_seconds = float(
-            pydash.get(self.profile, "voice-command.before-seconds", 0.5)
+        cache_size = int(
+            pydash.get(self.profile, "intent-recognition.cache.max-size", 1024)
         )
-        skip_seconds = float(pydash.get(self.profile, "voice-command.skip-seconds", 0))
-        chunk_size = int(pydash.get(self.profile, "voice-command.chunk-size", 960))
-        sample_rate = int(
-            pydash.get(self.profile, "audio.format.sample-rate-hertz", 16000)
+
+        # Load converters
+        extra_converters: typing.Optional[typing.Dict[str, typing.Any]] = {}
+        if converters_dir:
+            extra_converters = load_converters(
+                converters_dir,
+                persistent=persistent_converters,
+                persistent_timeout=persistent_timeout,
+            )
+
+        # Case transformation for input words
+        word_transform = None
+        if word_casing == WordCasing.UPPER:
+            word_transform = str.upper
+        elif word_casing == WordCasing.LOWER:
+            word_transform = str.lower
+
+        missing_converters = set(nondeterministic_converters) - set(
+            extra_converters or {}
         )
+        if missing_converters:
+            _LOGGER.warning(
+                "Missing non-deterministic converter(s): %s", missing_converters
+            )
+
+        # Modification times and sizes of intent graph files
+        graph_version = tuple(
+            (str(graph_path), graph_path.stat().st_mtime_ns, graph_path.stat().st_size)
+            for graph_path in [
+                self.ppath("intent-recognition.intent-graph", "intent.pickle.gz"),
+                self.ppath("intent-recognition.compact-intent-graph", "intent.graph"),
+            ]
+            if graph_path and graph_path.is_file()
+        )
+
+        intent_graph = self.load_intent_graph()
+
+        return IntentRecognizer(
+            intent_graph,
+            language_code=language_code,
+            fuzzy=fuzzy,
+            fuzzy_index=self.load_fuzzy_index(intent_graph) if fuzzy else None,
+            stop_words=load_stop_words(stop_words_path),
+            word_transform=word_transform,
+            extra_converters=extra_converters,
+            cache=RecognitionCache(cache_size) if cache_size > 0 else None,
+            graph_version=graph_version,
+            nondeterministic_converters=nondeterministic_converters,
+        )
+
+    # -------------------------------------------------------------------------
+    # record-command
+    # -------------------------------------------------------------------------
+
+    def get_command_recorder(self):
+        """Get voice command recorder based on profile settings."""
+        from rhasspysilence import WebRtcVadRecorder
+
+        voice_command = self.settings.voice_command
 
         return WebRtcVadRecorder(
-            vad_mode=vad_mode,
-            sample_rate=sample_rate,
-            chunk_size=chunk_size,
-            min_seconds=min_seconds,
-            max_seconds=max_seconds,
-            speech_seconds=speech_seconds,
-            silence_seconds=silence_seconds,
-            before_seconds=before_seconds,
-            skip_seconds=skip_seconds,
+            vad_mode=voice_command.vad_mode,
+            sample_rate=self.settings.audio.sample_rate,
+            chunk_size=voice_command.chunk_size,
+            min_seconds=voice_command.min_seconds,
+            max_seconds=voice_command.max_seconds,
+            speech_seconds=voice_command.speech_seconds,
+            silence_seconds=voice_command.silence_seconds,
+            before_seconds=voice_command.before_seconds,
+            skip_seconds=voice_command.skip_seconds,
         )
 
     # -------------------------------------------------------------------------
@@ -288,14 +578,52 @@ class Voice2JsonCore:
 
         return result
 
-    async def convert_wav(self, wav_data: bytes) -> bytes:
-        """Convert WAV data to expected audio format."""
-        convert_cmd_str = pydash.get(
-            self.profile,
-            "audio.convert-command",
-            "sox -t wav - -r 16000 -e signed-integer -b 16 -c 1 -t wav -",
+    async def convert_wav(
+        self,
+        wav_data: bytes,
+        sample_rate: int = 16000,
+        sample_width: int = 2,
+        channels: int = 1,
+    ) -> bytes:
+        """Convert WAV data to expected audio format.
+
+        Uses built-in conversion for PCM audio, and audio.convert-command for
+        everything else.
+        """
+        from .utils import convert_pcm_wav
+
+        start_time = time.perf_counter()
+        converted_data: typing.Optional[bytes] = None
+        method = "builtin"
+
+        if self.settings.audio.builtin_convert:
+            converted_data = convert_pcm_wav(
+                wav_data, sample_rate, sample_width, channels
+            )
+
+        if converted_data is None:
+            method = "command"
+            converted_data = await self.convert_wav_command(wav_data)
+
+        convert_seconds = time.perf_counter() - start_time
+        _LOGGER.debug(
+            "Converted %s byte(s) of WAV data in %s second(s) (%s)",
+            len(wav_data),
+            convert_seconds,
+            method,
+        )
+
+        method_stats = self.convert_statistics.setdefault(
+            method, {"count": 0, "total_seconds": 0.0}
         )
-        convert_cmd = shlex.split(convert_cmd_str)
+        method_stats["count"] += 1
+        method_stats["total_seconds"] += convert_seconds
+
+        return converted_data
+
+    async def convert_wav_command(self, wav_data: bytes) -> bytes:
+        """Convert WAV data to expected audio format with an external program."""
+        convert_cmd = shlex.split(self.settings.audio.convert_command)
         _LOGGER.debug(convert_cmd)
 
         convert_proc = await asyncio.create_subprocess_exec(
@@ -308,15 +636,10 @@ class Voice2JsonCore:
 
     async def maybe_convert_wav(self, wav_data: bytes) -> bytes:
         """Convert WAV data to expected audio format if necessary."""
-        expected_rate = int(
-            pydash.get(self.profile, "audio.format.sample-rate-hertz", 16000)
-        )
-        expected_width = (
-            int(pydash.get(self.profile, "audio.format.sample-width-bits", 16)) // 8
-        )
-        expected_channels = int(
-            pydash.get(self.profile, "audio.format.channel-count", 1)
-        )
+        audio = self.settings.audio
+        expected_rate = audio.sample_rate
+        expected_width = audio.sample_width
+        expected_channels = audio.channels
 
         with io.BytesIO(wav_data) as wav_io:
             with wave.open(wav_io, "rb") as wav_file:
@@ -349,60 +672,55 @@ class Voice2JsonCore:
                             expected_rate,
                         )
 
-                    return await self.convert_wav(wav_data)
+                    return await self.convert_wav(
+                        wav_data,
+                        sample_rate=expected_rate,
+                        sample_width=expected_width,
+                        channels=expected_channels,
+                    )
 
                 # Return original data
                 return wav_data
 
     def buffer_to_wav(self, buffer: bytes) -> bytes:
         """Wraps a buffer of raw audio data in a WAV"""
-        rate = int(pydash.get(self.profile, "audio.format.sample-rate-hertz", 16000))
-        width = int(pydash.get(self.profile, "audio.format.sample-width-bits", 16)) // 8
-        channels = int(pydash.get(self.profile, "audio.format.channel-count", 1))
+        audio = self.settings.audio
 
         with io.BytesIO() as wav_buffer:
             wav_file: wave.Wave_write = wave.open(wav_buffer, mode="wb")
             with wav_file:
-                wav_file.setframerate(rate)
-                wav_file.setsampwidth(width)
-                wav_file.setnchannels(channels)
+                wav_file.setframerate(audio.sample_rate)
+                wav_file.setsampwidth(audio.sample_width)
+                wav_file.setnchannels(audio.channels)
                 wav_file.writeframesraw(buffer)
 
             return wav_buffer.getvalue()
 
     async def get_audio_source(self):
         """Start a recording subprocess for expected audio format."""
-        record_cmd_str = pydash.get(
-            self.profile,
-            "audio.record-command",
-            "arecord -q -r 16000 -c 1 -f S16_LE -t raw",
-        )
-        record_cmd = shlex.split(record_cmd_str)
+        record_cmd = shlex.split(self.settings.audio.record_command)
         _LOGGER.debug(record_cmd)
-        record_proc = await asyncio.create_subprocess_exec(
-            record_cmd[0], *record_cmd[1:], stdout=asyncio.subprocess.PIPE
-        )
+        record_proc = subprocess.Popen(record_cmd, stdout=subprocess.PIPE)
 
-        class FakeBinaryIO:
+        class RecordProcessReader(AsyncPipeReader):
             """Terminate subprocess when closing stream."""
 
-            def __init__(self, proc):
-                self.proc = proc
-
-            async def read(self, n):
-                """Read n bytes from stream."""
-                assert self.proc, "Process not running"
-                return await self.proc.stdout.read(n)
+            def __init__(self, proc: subprocess.Popen):
+                assert proc.stdout, "No stdout"
+                super().__init__(pipe=typing.cast(typing.BinaryIO, proc.stdout))
+                self.proc: typing.Optional[subprocess.Popen] = proc
 
             async def close(self):
                 """Terminate process."""
+                await super().close()
+
                 if self.proc:
                     _proc = self.proc
                     self.proc = None
                     _proc.terminate()
-                    await _proc.wait()
+                    await self.loop.run_in_executor(None, _proc.wait)
 
-        return FakeBinaryIO(record_proc)
+        return RecordProcessReader(record_proc)
 
     # -------------------------------------------------------------------------
 
@@ -446,6 +764,12 @@ class Voice2JsonCore:
                     "Recording raw 16-bit 16Khz mono audio from stdin", file=sys.stderr
                 )
 
+            from .utils import is_pipe
+
+            if is_pipe(sys.stdin):
+                # Read on the event loop (no helper thread)
+                return AsyncPipeReader()
+
             return AsyncStdinReader()
 
         # File source
@@ -458,8 +782,148 @@ class Voice2JsonCore:
 # -----------------------------------------------------------------------------
 
 
+class AsyncPipeReader:
+    """Read a pipe (stdin by default) on the event loop into a ring buffer.
+
+    Data from the pipe is copied into a preallocated buffer, and reading is
+    paused while the buffer is full. read(n) returns exactly n bytes (except at
+    end of file), and readinto fills a caller's buffer without allocating.
+    """
+
+    def __init__(
+        self,
+        pipe: typing.Optional[typing.BinaryIO] = None,
+        buffer_size: int = 1024 * 1024,
+        loop: typing.Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.pipe = pipe or sys.stdin.buffer
+        self.loop = loop or asyncio.get_event_loop()
+        self.ring = bytearray(buffer_size)
+        self.ring_view = memoryview(self.ring)
+
+        # Position of first unread byte and number of unread bytes
+        self.start = 0
+        self.size = 0
+
+        self.transport: typing.Optional[asyncio.ReadTransport] = None
+        self.paused = False
+        self.eof = False
+        self.data_ready = asyncio.Event()
+
+        # Largest single read from the pipe transport
+        self.max_read = 256 * 1024
+        assert buffer_size >= (2 * self.max_read), "Buffer is too small"
+
+    async def read(self, n: int) -> bytes:
+        """Read n bytes (fewer at end of file)."""
+        await self._wait_for(n)
+
+        num_bytes = min(n, self.size)
+        end = self.start + num_bytes
+        if end <= len(self.ring):
+            data = bytes(self.ring_view[self.start : end])
+        else:
+            # Wraps around
+            data = bytes(self.ring_view[self.start :]) + bytes(
+                self.ring_view[: end - len(self.ring)]
+            )
+
+        self._consume(num_bytes)
+        return data
+
+    async def readinto(self, buffer: typing.Any) -> int:
+        """Fill buffer (fewer bytes at end of file). Returns number of bytes read."""
+        buffer_view = memoryview(buffer).cast("B")
+        await self._wait_for(len(buffer_view))
+
+        num_bytes = min(len(buffer_view), self.size)
+        first_bytes = min(num_bytes, len(self.ring) - self.start)
+        buffer_view[:first_bytes] = self.ring_view[
+            self.start : self.start + first_bytes
+        ]
+
+        if first_bytes < num_bytes:
+            # Wraps around
+            buffer_view[first_bytes:num_bytes] = self.ring_view[
+                : num_bytes - first_bytes
+            ]
+
+        self._consume(num_bytes)
+        return num_bytes
+
+    async def close(self):
+        """Stop reading from pipe."""
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+    async def _wait_for(self, n: int):
+        """Wait until n bytes are buffered or the pipe is closed."""
+        if (self.transport is None) and (not self.eof):
+            await self.loop.connect_read_pipe(
+                lambda: _PipeReaderProtocol(self), self.pipe
+            )
+
+        while (self.size < n) and (not self.eof):
+            self.data_ready.clear()
+            await self.data_ready.wait()
+
+    def _consume(self, num_bytes: int):
+        self.start = (self.start + num_bytes) % len(self.ring)
+        self.size -= num_bytes
+
+        if self.paused and ((len(self.ring) - self.size) >= self.max_read):
+            self.paused = False
+            if self.transport:
+                self.transport.resume_reading()
+
+    def data_received(self, data: bytes):
+        """Copy data from pipe into ring buffer."""
+        data_view = memoryview(data)
+        end = (self.start + self.size) % len(self.ring)
+        first_bytes = min(len(data_view), len(self.ring) - end)
+        self.ring_view[end : end + first_bytes] = data_view[:first_bytes]
+
+        if first_bytes < len(data_view):
+            # Wrap around
+            self.ring_view[: len(data_view) - first_bytes] = data_view[first_bytes:]
+
+        self.size += len(data_view)
+        self.data_ready.set()
+
+        if (len(self.ring) - self.size) < self.max_read:
+            # Next read might not fit
+            self.paused = True
+            if self.transport:
+                self.transport.pause_reading()
+
+    def eof_received(self):
+        """Pipe was closed."""
+        self.eof = True
+        self.data_ready.set()
+
+
+class _PipeReaderProtocol(asyncio.Protocol):
+    """Passes data from a pipe transport to an AsyncPipeReader."""
+
+    def __init__(self, reader: AsyncPipeReader):
+        self.reader = reader
+
+    def connection_made(self, transport):
+        self.reader.transport = transport
+
+    def data_received(self, data: bytes):
+        self.reader.data_received(data)
+
+    def eof_received(self):
+        self.reader.eof_received()
+
+    def connection_lost(self, exc):
+        self.reader.eof_received()
+
+
 class AsyncStdinReader:
-    """Wrap sys.stdin.buffer in an async reader."""
+    """Wrap sys.stdin.buffer in an async reader (terminals and regular files)."""
 
     def __init__(self, loop: typing.Optional[asyncio.AbstractEventLoop] = None):
         self.loop = loop or asyncio.get_event_loop()
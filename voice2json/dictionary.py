@@ -0,0 +1,233 @@
+"""Indexed pronunciation dictionary that is looked up lazily by word."""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import typing
+from collections.abc import MutableMapping
+from pathlib import Path
+
+from rhasspynlu.g2p import PronunciationAction
+
+from .utils import hash_file
+
+_LOGGER = logging.getLogger("voice2json.dictionary")
+
+# Bump when the index schema changes
+INDEX_VERSION = 1
+
+# -----------------------------------------------------------------------------
+
+
+class DictionaryIndex:
+    """SQLite index of a CMU-like pronunciation dictionary, keyed by word.
+
+    The index is built once from the text dictionary and re-built only when the
+    dictionary's contents change.
+    """
+
+    def __init__(
+        self,
+        dictionary_path: typing.Union[str, Path],
+        index_path: typing.Union[str, Path],
+    ):
+        self.dictionary_path = Path(dictionary_path)
+        self.index_path = Path(index_path)
+
+        if not self.is_current():
+            self.build()
+
+        # May be used from worker threads (serve), one at a time
+        self.connection = sqlite3.connect(str(self.index_path), check_same_thread=False)
+
+    def is_current(self) -> bool:
+        """True if index exists and matches the dictionary file."""
+        if not self.index_path.is_file():
+            return False
+
+        try:
+            with sqlite3.connect(str(self.index_path)) as connection:
+                meta = dict(connection.execute("SELECT key, value FROM meta"))
+
+            if int(meta.get("version", 0)) != INDEX_VERSION:
+                return False
+
+            stat = self.dictionary_path.stat()
+            if (int(meta["size"]) == stat.st_size) and (
+                int(meta["mtime_ns"]) == stat.st_mtime_ns
+            ):
+                return True
+
+            # File was touched. Only re-build if contents changed.
+            if meta["sha256"] == hash_file(self.dictionary_path):
+                with sqlite3.connect(str(self.index_path)) as connection:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        [("size", stat.st_size), ("mtime_ns", stat.st_mtime_ns)],
+                    )
+
+                return True
+        except Exception:
+            _LOGGER.exception("Failed to check index %s", self.index_path)
+
+        return False
+
+    def build(self):
+        """(Re-)build index from dictionary file."""
+        _LOGGER.debug("Indexing %s to %s", self.dictionary_path, self.index_path)
+        stat = self.dictionary_path.stat()
+        hasher = hashlib.sha256()
+
+        # Build under a temporary name so readers never see a partial index
+        temp_path = self.index_path.with_name(
+            f"{self.index_path.name}.{os.getpid()}.tmp"
+        )
+        if temp_path.exists():
+            temp_path.unlink()
+
+        try:
+            with sqlite3.connect(str(temp_path)) as connection:
+                connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value)")
+                connection.execute(
+                    "CREATE TABLE pronunciations (word TEXT, phonemes TEXT)"
+                )
+
+                def read_entries() -> typing.Iterable[typing.Tuple[str, str]]:
+                    with open(self.dictionary_path, "rb") as dict_file:
+                        for i, line_bytes in enumerate(dict_file):
+                            hasher.update(line_bytes)
+                            line = line_bytes.decode().strip()
+                            if not line:
+                                continue
+
+                            # Same parsing as rhasspynlu.g2p.read_pronunciations
+                            word, *pronounce = re.split(r"[ \t]+", line)
+                            word = word.split("(")[0]
+                            if not pronounce:
+                                _LOGGER.warning(
+                                    "No pronunciation for %s (line %s)", word, i + 1
+                                )
+
+                            yield (word, " ".join(pronounce))
+
+                connection.executemany(
+                    "INSERT INTO pronunciations (word, phonemes) VALUES (?, ?)",
+                    read_entries(),
+                )
+
+                connection.execute(
+                    "CREATE INDEX pronunciations_word ON pronunciations (word)"
+                )
+                connection.executemany(
+                    "INSERT INTO meta (key, value) VALUES (?, ?)",
+                    [
+                        ("version", INDEX_VERSION),
+                        ("size", stat.st_size),
+                        ("mtime_ns", stat.st_mtime_ns),
+                        ("sha256", hasher.hexdigest()),
+                    ],
+                )
+
+            os.replace(temp_path, self.index_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    def lookup(self, word: str) -> typing.List[typing.List[str]]:
+        """Get all pronunciations for a word (in dictionary order)."""
+        return [
+            phonemes.split()
+            for (phonemes,) in self.connection.execute(
+                "SELECT phonemes FROM pronunciations WHERE word = ? ORDER BY rowid",
+                (word,),
+            )
+        ]
+
+    def __contains__(self, word) -> bool:
+        return (
+            self.connection.execute(
+                "SELECT 1 FROM pronunciations WHERE word = ? LIMIT 1", (word,)
+            ).fetchone()
+            is not None
+        )
+
+    def words(self) -> typing.Iterable[str]:
+        """Iterate over all distinct words."""
+        for (word,) in self.connection.execute(
+            "SELECT DISTINCT word FROM pronunciations"
+        ):
+            yield word
+
+    def close(self):
+        """Close database connection."""
+        self.connection.close()
+
+
+# -----------------------------------------------------------------------------
+
+
+class LazyPronunciations(MutableMapping):
+    """Pronunciations dictionary backed by an index.
+
+    Words are only loaded from the index when they are accessed. Any changes
+    (e.g., from custom words) are kept in memory on top of the index.
+    """
+
+    def __init__(
+        self,
+        index: DictionaryIndex,
+        action: PronunciationAction = PronunciationAction.APPEND,
+    ):
+        self.index = index
+        self.action = action
+
+        # Words that have been loaded or modified
+        self.words: typing.Dict[str, typing.List[typing.List[str]]] = {}
+        self.deleted_words: typing.Set[str] = set()
+
+    def __getitem__(self, word: str) -> typing.List[typing.List[str]]:
+        word_prons = self.words.get(word)
+        if word_prons is not None:
+            return word_prons
+
+        if word not in self.deleted_words:
+            word_prons = self.index.lookup(word)
+            if word_prons:
+                if self.action == PronunciationAction.OVERWRITE_ALWAYS:
+                    # Only last pronunciation is kept
+                    word_prons = word_prons[-1:]
+
+                # Cache so that in-place changes are kept
+                self.words[word] = word_prons
+                return word_prons
+
+        raise KeyError(word)
+
+    def __setitem__(self, word: str, word_prons: typing.List[typing.List[str]]):
+        self.words[word] = word_prons
+        self.deleted_words.discard(word)
+
+    def __delitem__(self, word: str):
+        if word not in self:
+            raise KeyError(word)
+
+        self.words.pop(word, None)
+        self.deleted_words.add(word)
+
+    def __contains__(self, word) -> bool:
+        if word in self.words:
+            return True
+
+        return (word not in self.deleted_words) and (word in self.index)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        # Loads all words from the index (only needed for open vocabularies)
+        yield from self.words
+
+        for word in self.index.words():
+            if (word not in self.words) and (word not in self.deleted_words):
+                yield word
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
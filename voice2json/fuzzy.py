@@ -0,0 +1,531 @@
+"""Fuzzy intent recognition with a precomputed index over the compact graph.
+
+The index stores, for every node, the words that must appear on any path from
+that node to a final state, and each node's out edges sorted by one of those
+words. The search only visits edges whose required words are still in the
+remaining input, but is otherwise the same as rhasspynlu's fuzzy search, so
+it returns identical recognitions.
+"""
+import logging
+import mmap
+import struct
+import sys
+import time
+import typing
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from pathlib import Path
+
+from .graph import _NODE_FINAL, _NODE_START, CompactGraph
+
+_LOGGER = logging.getLogger("voice2json.fuzzy")
+
+# -----------------------------------------------------------------------------
+
+MAGIC = b"V2JINDEX"
+VERSION = 1
+
+# Detects files written on a machine with a different byte order
+BYTE_ORDER_MARK = 0x01020304
+
+# magic, version, byte order, graph nodes, graph edges, graph labels, required labels
+_HEADER = struct.Struct("=8s6I")
+
+# Required label of nodes that can't reach a final state
+_NEVER = 0xFFFFFFFF
+
+# Nodes with more out edges than this are searched with the edge index
+_MIN_INDEXED_EDGES = 4
+
+# Same as rhasspynlu.fsticuffs.PathType: (node, matching tokens) for each node
+_PathType = typing.List[typing.Union[int, typing.Tuple[int, typing.List[str]]]]
+
+# -----------------------------------------------------------------------------
+
+
+def write_fuzzy_index(graph: CompactGraph, index_path: typing.Union[str, Path]):
+    """Compute fuzzy recognition index for a compact graph and write it to a file."""
+    num_nodes = graph.num_nodes
+    edge_offsets = graph.edge_offsets
+    edge_targets = graph.edge_targets
+    edge_ilabels = graph.edge_ilabels
+
+    # node -> labels required on every path to a final state (None if none)
+    required: typing.List[typing.Optional[typing.FrozenSet[int]]] = [None] * num_nodes
+    empty: typing.FrozenSet[int] = frozenset()
+
+    for node in _post_order(graph):
+        if graph.node_flags[node] & _NODE_FINAL:
+            required[node] = empty
+            continue
+
+        node_required: typing.Optional[typing.FrozenSet[int]] = None
+        for edge in range(edge_offsets[node], edge_offsets[node + 1]):
+            next_required = required[edge_targets[edge]]
+            if next_required is None:
+                # Dead end
+                continue
+
+            ilabel = edge_ilabels[edge]
+            if ilabel:
+                next_required = next_required | {ilabel}
+
+            if node_required is None:
+                node_required = next_required
+            else:
+                node_required = node_required & next_required
+
+        required[node] = node_required
+
+    # Rarer labels make better edge keys
+    label_counts: typing.Dict[int, int] = defaultdict(int)
+    for ilabel in edge_ilabels:
+        label_counts[ilabel] += 1
+
+    def rarest(labels: typing.Iterable[int]) -> int:
+        return min(labels, key=lambda label: (label_counts[label], label))
+
+    required_offsets = array("I", [0])
+    required_labels = array("I")
+    for node_required in required:
+        if node_required is None:
+            required_labels.append(_NEVER)
+        else:
+            required_labels.extend(sorted(node_required))
+
+        required_offsets.append(len(required_labels))
+
+    # Out edges of each node, sorted by a label that must be in the input
+    # for the edge to be part of a result (0 for none).
+    edge_keys = array("I")
+    edge_order = array("I")
+    for node in range(num_nodes):
+        keyed_edges: typing.List[typing.Tuple[int, int]] = []
+        for edge in range(edge_offsets[node], edge_offsets[node + 1]):
+            next_required = required[edge_targets[edge]]
+            if next_required is None:
+                key = _NEVER
+            else:
+                ilabel = edge_ilabels[edge]
+                edge_required = (next_required | {ilabel}) if ilabel else next_required
+                key = rarest(edge_required) if edge_required else 0
+
+            keyed_edges.append((key, edge))
+
+        keyed_edges.sort()
+        edge_keys.extend(key for key, _ in keyed_edges)
+        edge_order.extend(edge for _, edge in keyed_edges)
+
+    with open(index_path, "wb") as index_file:
+        index_file.write(
+            _HEADER.pack(
+                MAGIC,
+                VERSION,
+                BYTE_ORDER_MARK,
+                num_nodes,
+                graph.num_edges,
+                graph.num_labels,
+                len(required_labels),
+            )
+        )
+
+        for values in [required_offsets, required_labels, edge_keys, edge_order]:
+            values.tofile(index_file)
+
+
+def load_fuzzy_index(
+    index_path: typing.Union[str, Path], graph: CompactGraph
+) -> "FuzzyIndex":
+    """Memory-map fuzzy recognition index for a compact graph from a file."""
+    with open(index_path, "rb") as index_file:
+        index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return FuzzyIndex(index_map, graph)
+
+
+def _post_order(graph: CompactGraph) -> typing.Iterable[int]:
+    """Yield nodes after all of their successors (graph must be acyclic)."""
+    edge_offsets = graph.edge_offsets
+    edge_targets = graph.edge_targets
+
+    # 0 = not visited, 1 = visiting, 2 = done
+    state = bytearray(graph.num_nodes)
+
+    for root in range(graph.num_nodes):
+        if state[root]:
+            continue
+
+        state[root] = 1
+        stack = [(root, edge_offsets[root])]
+        while stack:
+            node, edge = stack[-1]
+            if edge < edge_offsets[node + 1]:
+                stack[-1] = (node, edge + 1)
+                next_node = edge_targets[edge]
+                if state[next_node] == 0:
+                    state[next_node] = 1
+                    stack.append((next_node, edge_offsets[next_node]))
+                elif state[next_node] == 1:
+                    raise ValueError("Intent graph has a cycle")
+            else:
+                stack.pop()
+                state[node] = 2
+                yield node
+
+
+# -----------------------------------------------------------------------------
+
+
+class FuzzyIndex:
+    """Required words and keyed edges for each node of a compact intent graph."""
+
+    def __init__(self, buffer, graph: CompactGraph):
+        # Keep buffer (e.g., mmap) alive as long as the index
+        self.buffer = buffer
+        self.graph = graph
+
+        (
+            magic,
+            version,
+            byte_order,
+            num_nodes,
+            num_edges,
+            num_labels,
+            num_required,
+        ) = _HEADER.unpack_from(buffer, 0)
+
+        if magic != MAGIC:
+            raise ValueError("Not a fuzzy recognition index")
+
+        if version != VERSION:
+            raise ValueError(f"Unsupported fuzzy index version: {version}")
+
+        if byte_order != BYTE_ORDER_MARK:
+            raise ValueError(f"Fuzzy index has wrong byte order for {sys.byteorder}")
+
+        if (num_nodes, num_edges, num_labels) != (
+            graph.num_nodes,
+            graph.num_edges,
+            graph.num_labels,
+        ):
+            raise ValueError("Fuzzy index doesn't match intent graph")
+
+        view = memoryview(buffer)
+        offset = _HEADER.size
+
+        def take_ints(count: int) -> memoryview:
+            nonlocal offset
+            ints = view[offset : offset + (4 * count)].cast("I")
+            offset += 4 * count
+            return ints
+
+        self.required_offsets = take_ints(num_nodes + 1)
+        self.required_labels = take_ints(num_required)
+        self.edge_keys = take_ints(num_edges)
+        self.edge_order = take_ints(num_edges)
+
+        self.start_node = next(
+            node for node in range(num_nodes) if graph.node_flags[node] & _NODE_START
+        )
+
+        # word_transform -> transformed label -> label indexes
+        self._label_indexes: typing.Dict[
+            typing.Any, typing.Dict[str, typing.List[int]]
+        ] = {}
+
+        # olabel index -> (intent name or None, counts as output word)
+        self._olabel_kinds: typing.Dict[
+            int, typing.Tuple[typing.Optional[str], bool]
+        ] = {}
+
+    def label_indexes(
+        self, word_transform: typing.Optional[typing.Callable[[str], str]] = None
+    ) -> typing.Dict[str, typing.List[int]]:
+        """Map from (transformed) label to the label indexes it matches."""
+        label_indexes = self._label_indexes.get(word_transform)
+        if label_indexes is None:
+            transform = word_transform or (lambda x: x)
+            label_indexes = defaultdict(list)
+            for label_index in range(1, self.graph.num_labels):
+                label_indexes[transform(self.graph.label(label_index))].append(
+                    label_index
+                )
+
+            label_indexes = dict(label_indexes)
+            self._label_indexes[word_transform] = label_indexes
+
+        return label_indexes
+
+    def olabel_kind(self, olabel: int) -> typing.Tuple[typing.Optional[str], bool]:
+        """Get intent name (__label__) and whether an output label is a word."""
+        kind = self._olabel_kinds.get(olabel)
+        if kind is None:
+            out_label = self.graph.label(olabel)
+            if out_label[:9] == "__label__":
+                kind = (out_label[9:], False)
+            else:
+                kind = (None, bool(out_label) and (out_label[:2] != "__"))
+
+            self._olabel_kinds[olabel] = kind
+
+        return kind
+
+    # -------------------------------------------------------------------------
+
+    def paths_fuzzy(
+        self,
+        tokens: typing.List[str],
+        stop_words: typing.Optional[typing.Set[str]] = None,
+        intent_filter: typing.Optional[typing.Callable[[str], bool]] = None,
+        word_transform: typing.Optional[typing.Callable[[str], str]] = None,
+    ):
+        """Same as rhasspynlu.fsticuffs.paths_fuzzy with the default cost function.
+
+        Returns a dict from intent name to lists of FuzzyResult.
+        """
+        from rhasspynlu.fsticuffs import FuzzyResult
+
+        if not tokens:
+            return {}
+
+        intent_filter = intent_filter or (lambda x: True)
+        stop_words = stop_words or set()
+        transform = word_transform or (lambda x: x)
+        label_indexes = self.label_indexes(word_transform)
+
+        graph = self.graph
+        node_flags = graph.node_flags
+        edge_offsets = graph.edge_offsets
+        edge_targets = graph.edge_targets
+        edge_ilabels = graph.edge_ilabels
+        edge_olabels = graph.edge_olabels
+        required_offsets = self.required_offsets
+        required_labels = self.required_labels
+        edge_keys = self.edge_keys
+        edge_order = self.edge_order
+
+        # Input tokens are only ever consumed from the front, so the remaining
+        # tokens are always tokens[k:] for some k.
+        num_tokens = len(tokens)
+        transformed_tokens = [transform(token) for token in tokens]
+
+        # Cost of skipping each token
+        skip_costs = [0.1 if token in stop_words else 1 for token in transformed_tokens]
+
+        # label index -> positions of matching tokens
+        label_positions: typing.Dict[int, typing.List[int]] = defaultdict(list)
+        for position, token in enumerate(transformed_tokens):
+            for label_index in label_indexes.get(token, []):
+                label_positions[label_index].append(position)
+
+        # label index -> last position of a matching token
+        last_positions = {
+            label_index: positions[-1]
+            for label_index, positions in label_positions.items()
+        }
+
+        # k -> labels that match tokens[k:]
+        labels_after: typing.List[typing.List[int]] = [
+            [] for _ in range(num_tokens + 1)
+        ]
+        for label_index, last_position in last_positions.items():
+            for k in range(last_position + 1):
+                labels_after[k].append(label_index)
+
+        def can_finish(node: int, k: int) -> bool:
+            """True if tokens[k:] has all required labels for node."""
+            for label_index in required_labels[
+                required_offsets[node] : required_offsets[node + 1]
+            ]:
+                if last_positions.get(label_index, -1) < k:
+                    return False
+
+            return True
+
+        def next_edges(node: int, k: int) -> typing.Iterable[int]:
+            """Out edges of node (in graph order) that may be followed with tokens[k:]."""
+            start, end = edge_offsets[node], edge_offsets[node + 1]
+            if (end - start) <= _MIN_INDEXED_EDGES:
+                return range(start, end)
+
+            keys = edge_keys[start:end]
+            edges = list(edge_order[start : start + bisect_right(keys, 0)])
+            for label_index in labels_after[k]:
+                key_start = bisect_left(keys, label_index)
+                key_end = bisect_right(keys, label_index, key_start)
+                edges.extend(edge_order[start + key_start : start + key_end])
+
+            edges.sort()
+            return edges
+
+        # intent -> [FuzzyResult, FuzzyResult, ...]
+        intent_symbols_and_costs: typing.Dict[str, typing.List[typing.Any]] = {}
+
+        # Lowest cost so far
+        best_cost: float = float(graph.num_nodes)
+
+        # (node, k, out_path, out_count, cost, intent_name)
+        # out_path is a linked list: (node, matching tokens, previous out_path)
+        node_queue: typing.Deque[typing.Tuple[typing.Any, ...]] = deque(
+            [(self.start_node, 0, None, 0, 0.0, None)]
+        )
+
+        # BFS it up
+        while node_queue:
+            (
+                q_node,
+                q_k,
+                q_out_path,
+                q_out_count,
+                q_cost,
+                q_intent,
+            ) = node_queue.popleft()
+            is_final = bool(node_flags[q_node] & _NODE_FINAL)
+
+            # Update best intent cost on final state.
+            # Don't bother reporting intents that failed to consume any tokens.
+            if is_final and (q_cost < q_out_count):
+                q_intent = q_intent or ""
+                best_intent_cost: typing.Optional[float] = None
+                best_intent_costs = intent_symbols_and_costs.get(q_intent)
+                if best_intent_costs:
+                    best_intent_cost = best_intent_costs[0].cost
+
+                # Remaining tokens count against
+                final_cost = q_cost + (num_tokens - q_k)
+
+                if (best_intent_cost is None) or (final_cost <= best_intent_cost):
+                    final_result = FuzzyResult(
+                        intent_name=q_intent,
+                        node_path=_path_to_list(q_out_path),
+                        cost=final_cost,
+                    )
+
+                    if (best_intent_cost is None) or (final_cost < best_intent_cost):
+                        # Overwrite best cost
+                        intent_symbols_and_costs[q_intent] = [final_result]
+                    else:
+                        # Add to existing list
+                        intent_symbols_and_costs[q_intent].append(final_result)
+
+                if final_cost < best_cost:
+                    # Update best cost so far
+                    best_cost = final_cost
+
+            if q_cost > best_cost:
+                # Can't get any better
+                continue
+
+            # Process child edges
+            for edge in next_edges(q_node, q_k):
+                next_node = edge_targets[edge]
+                next_out_count = q_out_count
+                next_intent = q_intent
+
+                olabel = edge_olabels[edge]
+                if olabel:
+                    intent_name, is_word = self.olabel_kind(olabel)
+                    if intent_name is not None:
+                        next_intent = intent_name
+                        if not intent_filter(next_intent):
+                            # Skip intent
+                            continue
+                    elif is_word:
+                        next_out_count += 1
+
+                ilabel = edge_ilabels[edge]
+                edge_cost = 0.0
+                if ilabel:
+                    # Skip to next matching token
+                    positions = label_positions.get(ilabel)
+                    if not positions:
+                        continue
+
+                    position_index = bisect_left(positions, q_k)
+                    if position_index >= len(positions):
+                        continue
+
+                    match_position = positions[position_index]
+                    for skip_position in range(q_k, match_position):
+                        edge_cost += skip_costs[skip_position]
+
+                    next_k = match_position + 1
+                    matching_tokens = [tokens[match_position]]
+                else:
+                    next_k = q_k
+                    matching_tokens = []
+
+                if not can_finish(next_node, next_k):
+                    # No path to a final state with the remaining tokens
+                    continue
+
+                node_queue.append(
+                    (
+                        next_node,
+                        next_k,
+                        (q_node, matching_tokens, q_out_path),
+                        next_out_count,
+                        q_cost + edge_cost,
+                        next_intent,
+                    )
+                )
+
+        return intent_symbols_and_costs
+
+
+def _path_to_list(out_path) -> _PathType:
+    """Convert linked out path to a list of (node, matching tokens)."""
+    path_list: _PathType = []
+    while out_path is not None:
+        node, matching_tokens, out_path = out_path
+        path_list.append((node, matching_tokens))
+
+    path_list.reverse()
+    return path_list
+
+
+# -----------------------------------------------------------------------------
+
+
+def recognize_fuzzy(
+    tokens: typing.List[str],
+    index: FuzzyIndex,
+    stop_words: typing.Optional[typing.Set[str]] = None,
+    intent_filter: typing.Optional[typing.Callable[[str], bool]] = None,
+    word_transform: typing.Optional[typing.Callable[[str], str]] = None,
+    extra_converters: typing.Optional[
+        typing.Dict[str, typing.Callable[..., typing.Any]]
+    ] = None,
+):
+    """Same as rhasspynlu.recognize with fuzzy=True, using a fuzzy index."""
+    from rhasspynlu.fsticuffs import best_fuzzy_cost, path_to_recognition
+    from rhasspynlu.intent import RecognitionResult
+
+    start_time = time.perf_counter()
+    best_fuzzy = best_fuzzy_cost(
+        index.paths_fuzzy(
+            tokens,
+            stop_words=stop_words,
+            intent_filter=intent_filter,
+            word_transform=word_transform,
+        )
+    )
+
+    end_time = time.perf_counter()
+
+    # Gather all successful fuzzy paths
+    recognitions = []
+    for fuzzy_result in best_fuzzy:
+        result, recognition = path_to_recognition(
+            fuzzy_result.node_path,
+            index.graph,
+            cost=fuzzy_result.cost,
+            extra_converters=extra_converters,
+        )
+        if result == RecognitionResult.SUCCESS:
+            assert recognition is not None
+            recognition.recognize_seconds = end_time - start_time
+            recognitions.append(recognition)
+
+    return recognitions
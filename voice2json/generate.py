@@ -1,11 +1,11 @@
 """Methods for generating examples."""
 import argparse
 import dataclasses
-import gzip
 import logging
+import random
 
 from .core import Voice2JsonCore
-from .utils import dag_paths_random, itershuffle, print_json
+from .utils import JsonLinesSink, PathSampler
 
 _LOGGER = logging.getLogger("voice2json.generate")
 
@@ -14,39 +14,34 @@ _LOGGER = logging.getLogger("voice2json.generate")
 
 async def generate(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Generate randomish examples from intent graph."""
-    import networkx as nx
     import rhasspynlu
 
     # Make sure profile has been trained
     assert core.check_trained(), "Not trained"
 
-    # Load settings
-    intent_graph_path = core.ppath(
-        "intent-recognition.intent-graph", "intent.pickle.gz"
-    )
-
     # Load intent graph
-    _LOGGER.debug("Loading %s", intent_graph_path)
-    with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
-        intent_graph = nx.readwrite.gpickle.read_gpickle(graph_gzip)
+    intent_graph = core.load_intent_graph()
 
     start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(intent_graph)
     assert (start_node is not None) and (
         end_node is not None
     ), "Missing start/end node(s)"
 
-    paths_left = None
-    if args.number > 0:
-        paths_left = args.number
+    # Count paths through the graph (one per possible sentence)
+    sampler = PathSampler(intent_graph, start_node, end_node)
+    _LOGGER.debug("Grammar can produce %s sentence(s)", sampler.total)
+
+    if args.count:
+        print(sampler.total)
+        return
 
-    # Iterate through all paths
-    for path in itershuffle(dag_paths_random(intent_graph, start_node, end_node)):
-        if paths_left is not None:
-            paths_left -= 1
-            if paths_left < 0:
-                # Stop iterating
-                break
+    assert args.number is not None, "--number is required"
 
+    # Buffer output unless writing to a terminal
+    sink = JsonLinesSink.for_batch()
+
+    # Iterate through distinct, uniformly random paths
+    for path in sampler.sample(args.number, rng=random.Random(args.seed)):
         if args.raw_symbols:
             # Output labels directly from intent graph
             symbols = []
@@ -109,4 +104,6 @@ async def generate(args: argparse.Namespace, core: Voice2JsonCore) -> None:
             print(intent["intent"]["name"])
         else:
             # Write as jsonl
-            print_json(intent)
+            sink.write(intent)
+
+    sink.close()
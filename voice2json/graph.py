@@ -0,0 +1,330 @@
+"""Compact, memory-mapped intent graph format.
+
+Nodes/edges are stored as flat arrays of 32-bit integers with an interned label
+table, so loading is near instant and processes share pages of the same file.
+"""
+import mmap
+import struct
+import sys
+import typing
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+
+# -----------------------------------------------------------------------------
+
+MAGIC = b"V2JGRAPH"
+VERSION = 1
+
+# Detects files written on a machine with a different byte order
+BYTE_ORDER_MARK = 0x01020304
+
+# magic, version, byte order, nodes, edges, labels, label bytes
+_HEADER = struct.Struct("=8s6I")
+
+_NODE_START = 1
+_NODE_FINAL = 2
+
+# Label index of the empty string
+_EMPTY_LABEL = 0
+
+# -----------------------------------------------------------------------------
+
+
+def write_compact_graph(graph, graph_path: typing.Union[str, Path]) -> None:
+    """Write networkx intent graph to compact file."""
+    # Intern all strings. Index 0 is always the empty string.
+    label_index: typing.Dict[str, int] = {"": _EMPTY_LABEL}
+
+    def intern(label: typing.Optional[str]) -> int:
+        label = label or ""
+        index = label_index.get(label)
+        if index is None:
+            index = len(label_index)
+            label_index[label] = index
+
+        return index
+
+    # Nodes are renumbered by their order in the graph
+    node_index = {node: i for i, node in enumerate(graph.nodes)}
+
+    node_flags = array("I")
+    node_words = array("I")
+    edge_offsets = array("I", [0])
+    edge_targets = array("I")
+    edge_ilabels = array("I")
+    edge_olabels = array("I")
+
+    for node, node_data in graph.nodes(data=True):
+        flags = 0
+        if node_data.get("start", False):
+            flags |= _NODE_START
+
+        if node_data.get("final", False):
+            flags |= _NODE_FINAL
+
+        node_flags.append(flags)
+        node_words.append(intern(node_data.get("word")))
+
+        # Out edges in adjacency order (search order depends on it)
+        for next_node, edge_data in graph[node].items():
+            edge_targets.append(node_index[next_node])
+            edge_ilabels.append(intern(edge_data.get("ilabel")))
+            edge_olabels.append(intern(edge_data.get("olabel")))
+
+        edge_offsets.append(len(edge_targets))
+
+    # Label table
+    label_offsets = array("I", [0])
+    label_blob = bytearray()
+    for label in label_index:
+        label_blob.extend(label.encode())
+        label_offsets.append(len(label_blob))
+
+    # Pad blob so the file length is a multiple of 4
+    label_blob.extend(bytes(-len(label_blob) % 4))
+
+    with open(graph_path, "wb") as graph_file:
+        graph_file.write(
+            _HEADER.pack(
+                MAGIC,
+                VERSION,
+                BYTE_ORDER_MARK,
+                len(node_flags),
+                len(edge_targets),
+                len(label_index),
+                len(label_blob),
+            )
+        )
+
+        for values in [
+            node_flags,
+            node_words,
+            edge_offsets,
+            edge_targets,
+            edge_ilabels,
+            edge_olabels,
+            label_offsets,
+        ]:
+            values.tofile(graph_file)
+
+        graph_file.write(label_blob)
+
+
+def load_compact_graph(graph_path: typing.Union[str, Path]) -> "CompactGraph":
+    """Memory-map compact intent graph from a file."""
+    with open(graph_path, "rb") as graph_file:
+        graph_map = mmap.mmap(graph_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return CompactGraph(graph_map)
+
+
+# -----------------------------------------------------------------------------
+
+
+class CompactGraph:
+    """Read-only intent graph backed by flat integer arrays.
+
+    Implements the subset of the networkx DiGraph API used by rhasspynlu and
+    voice2json, so it can be used anywhere the intent graph is expected.
+    """
+
+    def __init__(self, buffer):
+        # Keep buffer (e.g., mmap) alive as long as the graph
+        self.buffer = buffer
+
+        (
+            magic,
+            version,
+            byte_order,
+            self.num_nodes,
+            self.num_edges,
+            self.num_labels,
+            blob_size,
+        ) = _HEADER.unpack_from(buffer, 0)
+
+        if magic != MAGIC:
+            raise ValueError("Not a compact intent graph")
+
+        if version != VERSION:
+            raise ValueError(f"Unsupported compact graph version: {version}")
+
+        if byte_order != BYTE_ORDER_MARK:
+            raise ValueError(f"Compact graph has wrong byte order for {sys.byteorder}")
+
+        view = memoryview(buffer)
+        offset = _HEADER.size
+
+        def take_ints(count: int) -> memoryview:
+            nonlocal offset
+            ints = view[offset : offset + (4 * count)].cast("I")
+            offset += 4 * count
+            return ints
+
+        self.node_flags = take_ints(self.num_nodes)
+        self.node_words = take_ints(self.num_nodes)
+        self.edge_offsets = take_ints(self.num_nodes + 1)
+        self.edge_targets = take_ints(self.num_edges)
+        self.edge_ilabels = take_ints(self.num_edges)
+        self.edge_olabels = take_ints(self.num_edges)
+        self.label_offsets = take_ints(self.num_labels + 1)
+        self.label_blob = view[offset : offset + blob_size]
+
+        # Labels are decoded on first use
+        self._labels: typing.List[typing.Optional[str]] = [None] * self.num_labels
+
+    # -------------------------------------------------------------------------
+
+    def label(self, index: int) -> str:
+        """Get interned string by index."""
+        label = self._labels[index]
+        if label is None:
+            label = str(
+                self.label_blob[
+                    self.label_offsets[index] : self.label_offsets[index + 1]
+                ],
+                "utf-8",
+            )
+            self._labels[index] = label
+
+        return label
+
+    def node_data(self, node: int) -> typing.Dict[str, typing.Any]:
+        """Get attributes of a node."""
+        data: typing.Dict[str, typing.Any] = {}
+        flags = self.node_flags[node]
+        if flags & _NODE_START:
+            data["start"] = True
+
+        if flags & _NODE_FINAL:
+            data["final"] = True
+
+        word = self.node_words[node]
+        if word != _EMPTY_LABEL:
+            data["word"] = self.label(word)
+
+        return data
+
+    def edge_data(self, edge: int) -> typing.Dict[str, str]:
+        """Get attributes of an edge by index."""
+        return {
+            "ilabel": self.label(self.edge_ilabels[edge]),
+            "olabel": self.label(self.edge_olabels[edge]),
+        }
+
+    def edge_index(self, from_node: int, to_node: int) -> int:
+        """Get index of edge between two nodes."""
+        start, end = self.edge_offsets[from_node], self.edge_offsets[from_node + 1]
+        for edge in range(start, end):
+            if self.edge_targets[edge] == to_node:
+                return edge
+
+        raise KeyError((from_node, to_node))
+
+    # -------------------------------------------------------------------------
+    # networkx DiGraph compatibility
+    # -------------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self.num_nodes
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(range(self.num_nodes))
+
+    def __contains__(self, node) -> bool:
+        return isinstance(node, int) and (0 <= node < self.num_nodes)
+
+    def __getitem__(self, node: int) -> "_AdjacencyView":
+        return _AdjacencyView(self, node)
+
+    def nodes(self, data: bool = False) -> "_NodeView":
+        """View of graph nodes (with attributes if data is True)."""
+        return _NodeView(self, data)
+
+    @property
+    def edges(self) -> "_EdgeView":
+        """View of graph edges, indexable by (from_node, to_node)."""
+        return _EdgeView(self)
+
+    def successors(self, node: int) -> typing.Iterator[int]:
+        """Nodes reachable by a single edge from node."""
+        return iter(_AdjacencyView(self, node))
+
+    def number_of_nodes(self) -> int:
+        """Total number of nodes."""
+        return self.num_nodes
+
+    def number_of_edges(self) -> int:
+        """Total number of edges."""
+        return self.num_edges
+
+
+class _NodeView:
+    """Iterable/indexable view of nodes, like networkx NodeView/NodeDataView."""
+
+    def __init__(self, graph: CompactGraph, data: bool):
+        self.graph = graph
+        self.data = data
+
+    def __len__(self) -> int:
+        return self.graph.num_nodes
+
+    def __iter__(self):
+        if self.data:
+            return (
+                (node, self.graph.node_data(node))
+                for node in range(self.graph.num_nodes)
+            )
+
+        return iter(range(self.graph.num_nodes))
+
+    def __getitem__(self, node: int) -> typing.Dict[str, typing.Any]:
+        return self.graph.node_data(node)
+
+    def __contains__(self, node) -> bool:
+        return node in self.graph
+
+
+class _AdjacencyView(Mapping):
+    """Mapping from successor nodes to edge attributes for a single node."""
+
+    def __init__(self, graph: CompactGraph, node: int):
+        self.graph = graph
+        self.start = graph.edge_offsets[node]
+        self.end = graph.edge_offsets[node + 1]
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(self.graph.edge_targets[self.start : self.end])
+
+    def __getitem__(self, next_node: int) -> typing.Dict[str, str]:
+        targets = self.graph.edge_targets
+        for edge in range(self.start, self.end):
+            if targets[edge] == next_node:
+                return self.graph.edge_data(edge)
+
+        raise KeyError(next_node)
+
+    def items(self):
+        """Yield (next_node, edge attributes) pairs without repeated searches."""
+        graph = self.graph
+        return (
+            (graph.edge_targets[edge], graph.edge_data(edge))
+            for edge in range(self.start, self.end)
+        )
+
+
+class _EdgeView:
+    """Edge attributes indexed by (from_node, to_node)."""
+
+    def __init__(self, graph: CompactGraph):
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return self.graph.num_edges
+
+    def __getitem__(self, edge: typing.Tuple[int, int]) -> typing.Dict[str, str]:
+        from_node, to_node = edge
+        return self.graph.edge_data(self.graph.edge_index(from_node, to_node))
@@ -1,14 +1,17 @@
 """Support for Julius speech to text engine."""
 import io
 import logging
-import os
 import shutil
+import socket
+import struct
 import subprocess
 import tempfile
+import threading
 import time
 import typing
 import wave
 from pathlib import Path
+from queue import Empty, Queue
 
 import networkx as nx
 import rhasspynlu
@@ -16,7 +19,7 @@ from rhasspyasr import Transcriber, Transcription
 from rhasspynlu.g2p import PronunciationsType
 
 from .core import Voice2JsonCore
-from .utils import get_wav_duration
+from .utils import get_free_port
 
 _LOGGER = logging.getLogger("voice2json.julius")
 
@@ -24,7 +27,18 @@ _LOGGER = logging.getLogger("voice2json.julius")
 
 
 class JuliusTranscriber(Transcriber):
-    """Transcriber for Julius speech to text engine."""
+    """Transcriber for Julius speech to text engine.
+
+    Julius is run once in adinnet mode, and raw audio is sent to it over a
+    socket. Each utterance ends with an empty packet, after which Julius prints
+    its result on stdout.
+    """
+
+    # Bytes of audio per adinnet packet
+    chunk_size = 4096
+
+    # Times to try starting Julius (on a new port each time)
+    start_attempts = 3
 
     def __init__(
         self,
@@ -33,24 +47,45 @@ class JuliusTranscriber(Transcriber):
         dictionary: typing.Union[str, Path],
         language_model: typing.Union[str, Path],
         debug: bool = False,
+        connect_timeout: float = 10.0,
+        result_timeout: float = 30.0,
     ):
         self.core = core
         self.model_dir = Path(model_dir)
         self.dictionary = Path(dictionary)
         self.language_model = Path(language_model)
         self.julius_proc: typing.Optional[subprocess.Popen] = None
-        self.temp_dir: typing.Optional[tempfile.TemporaryDirectory] = None
-        self.julius_in: typing.Optional[typing.TextIO] = None
-        self.julius_out: typing.Optional[typing.TextIO] = None
+        self.julius_lines: "Queue[typing.Optional[str]]" = Queue()
+        self.julius_socket: typing.Optional[socket.socket] = None
+        self.connect_timeout = connect_timeout
+        self.result_timeout = result_timeout
         self.debug = debug
 
     def start_julius(self):
-        """Start Julius process."""
+        """Start Julius process and connect to its audio port.
+
+        The port is picked before Julius starts, so another program may take it
+        first. Julius is restarted on a new port if it fails to start.
+        """
+        for attempt in range(1, self.start_attempts + 1):
+            try:
+                self._start_julius(get_free_port())
+                return
+            except Exception:
+                self.stop()
+
+                if attempt >= self.start_attempts:
+                    raise
+
+                _LOGGER.exception(
+                    "Failed to start Julius (attempt %s/%s)",
+                    attempt,
+                    self.start_attempts,
+                )
+
+    def _start_julius(self, adinnet_port: int):
+        """Start Julius process with audio input on adinnet_port and connect."""
         _LOGGER.debug("Starting Julius")
-        self.temp_dir = tempfile.TemporaryDirectory()
-
-        fifo_path = os.path.join(self.temp_dir.name, "filelist")
-        os.mkfifo(fifo_path)
 
         julius_cmd = [
             "julius",
@@ -58,9 +93,9 @@ class JuliusTranscriber(Transcriber):
             "-C",
             str(self.model_dir / "julius.jconf"),
             "-input",
-            "file",
-            "-filelist",
-            fifo_path,
+            "adinnet",
+            "-adport",
+            str(adinnet_port),
             "-nocutsilence",
             "-norealtime",
             "-v",
@@ -93,8 +128,6 @@ class JuliusTranscriber(Transcriber):
             julius_cmd, stdout=subprocess.PIPE, stderr=stderr, universal_newlines=True
         )
 
-        self.julius_out = open(fifo_path, "w")
-
         # -----
 
         # Read until Julius has started
@@ -113,19 +146,46 @@ class JuliusTranscriber(Transcriber):
             if "error" in line:
                 raise Exception(line)
 
-        self.julius_in = self.julius_proc.stdout
-
-        _LOGGER.debug("Julius started")
+            if (not line) and (self.julius_proc.poll() is not None):
+                raise Exception("Julius exited unexpectedly")
+
+        # Read output in a separate thread so Julius never blocks on stdout
+        self.julius_lines = Queue()
+        threading.Thread(
+            target=self._read_output,
+            args=(self.julius_proc.stdout, self.julius_lines),
+            daemon=True,
+        ).start()
+
+        # Connect as audio client
+        end_time = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                self.julius_socket = socket.create_connection(
+                    ("127.0.0.1", adinnet_port)
+                )
+                break
+            except ConnectionRefusedError:
+                if (time.monotonic() > end_time) or (
+                    self.julius_proc.poll() is not None
+                ):
+                    raise
+
+                time.sleep(0.05)
+
+        _LOGGER.debug("Julius started (adinnet port %s)", adinnet_port)
+
+    def start_decoder(self):
+        """Start Julius ahead of the first utterance."""
+        if (self.julius_proc is None) or (self.julius_proc.poll() is not None):
+            self.stop()
+            self.start_julius()
 
     def stop(self):
         """Stop transcriber."""
-        if self.julius_out is not None:
-            self.julius_out.close()
-            self.julius_out = None
-
-        if self.temp_dir is not None:
-            self.temp_dir.cleanup()
-            self.temp_dir = None
+        if self.julius_socket is not None:
+            self.julius_socket.close()
+            self.julius_socket = None
 
         if self.julius_proc is not None:
             _LOGGER.debug("Stopping Julius")
@@ -134,58 +194,164 @@ class JuliusTranscriber(Transcriber):
             self.julius_proc = None
             _LOGGER.debug("Stopped Julius")
 
-    def transcribe_wav(self, wav_bytes: bytes) -> typing.Optional[Transcription]:
-        """Transcribe WAV data."""
-        if not self.julius_proc:
-            self.start_julius()
-
-        assert self.julius_in and self.julius_out, "Julius not started"
-
-        # Compute WAV duration
-        wav_duration = get_wav_duration(wav_bytes)
-
-        # Write path to WAV file
-        _LOGGER.debug("Sending %s byte(s) to Julius", len(wav_bytes))
-        start_time = time.time()
-
-        with tempfile.NamedTemporaryFile(suffix=".wav", mode="wb+") as temp_file:
-            temp_file.write(wav_bytes)
-            temp_file.seek(0)
-
-            print(temp_file.name, file=self.julius_out)
-            self.julius_out.flush()
-
-            sentence_line = ""
-            line = self.julius_in.readline().strip()
-            _LOGGER.debug("Julius> %s", line)
+    def _read_output(
+        self, julius_out: typing.TextIO, lines: "Queue[typing.Optional[str]]"
+    ):
+        """Queue lines from Julius stdout (None at end)."""
+        try:
+            for line in julius_out:
+                lines.put(line)
+        finally:
+            lines.put(None)
+
+    def send_audio(self, audio: bytes):
+        """Send raw 16-bit audio to Julius in one or more packets."""
+        assert self.julius_socket, "Julius not started"
+
+        for offset in range(0, len(audio), self.chunk_size):
+            chunk = audio[offset : offset + self.chunk_size]
+            self.julius_socket.sendall(struct.pack("<i", len(chunk)) + chunk)
+
+    def read_result(self) -> str:
+        """Finish utterance and read transcription text from Julius."""
+        assert self.julius_socket, "Julius not started"
+
+        # Empty packet marks end of utterance
+        self.julius_socket.sendall(struct.pack("<i", 0))
+
+        end_time = time.monotonic() + self.result_timeout
+
+        def next_line() -> typing.Optional[str]:
+            return self.julius_lines.get(timeout=max(0.0, end_time - time.monotonic()))
+
+        sentence_line = ""
+        try:
+            line = next_line()
+            while line is not None:
+                line = line.strip()
+                _LOGGER.debug("Julius> %s", line)
 
-            while True:
                 if line.startswith("sentence1:"):
                     sentence_line = line.split(":", maxsplit=1)[1]
                     break
 
+                if "search failed" in line.lower():
+                    # Nothing recognized
+                    break
+
                 if "error" in line.lower():
                     # Give up with an empty transcription
                     _LOGGER.warning(line)
                     break
 
-                line = self.julius_in.readline().strip()
-                _LOGGER.debug("Julius> %s", line)
+                line = next_line()
+
+            if line is None:
+                # Julius exited; restart on next utterance
+                _LOGGER.warning("Julius stopped unexpectedly")
+                self.stop()
+        except Empty:
+            # Julius is stuck; restart on next utterance
+            _LOGGER.warning(
+                "No result from Julius after %s second(s)", self.result_timeout
+            )
+            self.stop()
+
+        # Exclude <s> and </s>
+        _LOGGER.debug(sentence_line)
+        return sentence_line.replace("<s>", "").replace("</s>", "").strip()
+
+    def transcribe_wav(self, wav_bytes: bytes) -> typing.Optional[Transcription]:
+        """Transcribe WAV data."""
+        with io.BytesIO(wav_bytes) as wav_io:
+            with wave.open(wav_io, "rb") as wav_file:
+                return self.transcribe_stream(
+                    [wav_file.readframes(wav_file.getnframes())],
+                    wav_file.getframerate(),
+                    wav_file.getsampwidth(),
+                    wav_file.getnchannels(),
+                )
+
+    def transcribe_stream(
+        self,
+        audio_stream: typing.Iterable[bytes],
+        sample_rate: int,
+        sample_width: int,
+        channels: int,
+    ) -> typing.Optional[Transcription]:
+        """Speech to text from an audio stream.
+
+        Audio is sent to Julius as it arrives, so decoding is mostly done by
+        the time the stream ends.
+        """
+        assert (sample_width == 2) and (channels == 1), "Expected 16-bit mono audio"
+
+        # Not started yet or exited
+        self.start_decoder()
 
-            # Exclude <s> and </s>
-            _LOGGER.debug(sentence_line)
-            result_text = sentence_line.replace("<s>", "").replace("</s>", "").strip()
-            end_time = time.time()
+        start_time = time.perf_counter()
+        num_bytes = 0
 
-        result_text = result_text.strip()
+        try:
+            for chunk in audio_stream:
+                if chunk:
+                    self.send_audio(chunk)
+                    num_bytes += len(chunk)
+
+            _LOGGER.debug("Sent %s byte(s) to Julius", num_bytes)
+            result_text = self.read_result()
+        except OSError:
+            # Connection lost; restart on next utterance
+            _LOGGER.exception("transcribe_stream")
+            self.stop()
+            result_text = ""
+
+        end_time = time.perf_counter()
 
         return Transcription(
             text=result_text,
             transcribe_seconds=end_time - start_time,
-            wav_seconds=wav_duration,
+            wav_seconds=num_bytes / (sample_width * channels * sample_rate),
             likelihood=1,
         )
 
+
+class JuliusTranscriberPool(Transcriber):
+    """Several Julius processes sharing the same model, dictionary, and LM.
+
+    Each call to transcribe_wav/transcribe_stream uses an idle worker, so up
+    to num_workers utterances can be decoded at the same time from different
+    threads. Workers that crash are restarted on their next utterance.
+    """
+
+    def __init__(
+        self,
+        core: Voice2JsonCore,
+        model_dir: typing.Union[str, Path],
+        dictionary: typing.Union[str, Path],
+        language_model: typing.Union[str, Path],
+        num_workers: int = 2,
+        debug: bool = False,
+    ):
+        assert num_workers > 0, "Need at least one worker"
+        self.num_workers = num_workers
+        self.workers = [
+            JuliusTranscriber(core, model_dir, dictionary, language_model, debug=debug)
+            for _ in range(num_workers)
+        ]
+
+        self.idle_workers: "Queue[JuliusTranscriber]" = Queue()
+        for worker in self.workers:
+            self.idle_workers.put(worker)
+
+    def transcribe_wav(self, wav_bytes: bytes) -> typing.Optional[Transcription]:
+        """Transcribe WAV data with the next idle worker."""
+        worker = self.idle_workers.get()
+        try:
+            return worker.transcribe_wav(wav_bytes)
+        finally:
+            self.idle_workers.put(worker)
+
     def transcribe_stream(
         self,
         audio_stream: typing.Iterable[bytes],
@@ -193,20 +359,24 @@ class JuliusTranscriber(Transcriber):
         sample_width: int,
         channels: int,
     ) -> typing.Optional[Transcription]:
-        """Speech to text from an audio stream."""
-        # No online streaming support.
-        # Re-package as a WAV.
-        with io.BytesIO() as wav_buffer:
-            wav_file: wave.Wave_write = wave.open(wav_buffer, "wb")
-            with wav_file:
-                wav_file.setframerate(sample_rate)
-                wav_file.setsampwidth(sample_width)
-                wav_file.setnchannels(channels)
-
-                for frame in audio_stream:
-                    wav_file.writeframes(frame)
-
-            return self.transcribe_wav(wav_buffer.getvalue())
+        """Speech to text from an audio stream with the next idle worker."""
+        worker = self.idle_workers.get()
+        try:
+            return worker.transcribe_stream(
+                audio_stream, sample_rate, sample_width, channels
+            )
+        finally:
+            self.idle_workers.put(worker)
+
+    def start_decoder(self):
+        """Start all Julius processes ahead of the first utterance."""
+        for worker in self.workers:
+            worker.start_decoder()
+
+    def stop(self):
+        """Stop all workers."""
+        for worker in self.workers:
+            worker.stop()
 
 
 # -----------------------------------------------------------------------------
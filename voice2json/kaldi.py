@@ -0,0 +1,475 @@
+"""Support for batch decoding with Kaldi."""
+import itertools
+import logging
+import re
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import typing
+from pathlib import Path
+
+from rhasspyasr import Transcription
+from rhasspyasr_kaldi import KaldiCommandLineTranscriber, KaldiModelType
+
+from .utils import get_free_port, get_wav_duration
+
+_LOGGER = logging.getLogger("voice2json.kaldi")
+
+# -----------------------------------------------------------------------------
+
+
+# Transcript from online decoder and its line ending
+_TRANSCRIPT_LINE = re.compile(rb"([^\r\n]*)([\r\n])")
+
+# -----------------------------------------------------------------------------
+
+
+class KaldiBatchTranscriber(KaldiCommandLineTranscriber):
+    """Kaldi transcriber that can decode many WAV files with one decoder run.
+
+    The graph and acoustic model are loaded once per batch instead of once per
+    WAV file. Single WAV files and streams are handled by the base class.
+    """
+
+    # Has transcribe_wavs
+    batch_decoding = True
+
+    # Has transcribe_stream_partial
+    partial_results = True
+
+    # Seconds of audio between temporary transcripts from online decoder
+    partial_interval: float = 1.0
+
+    # Times to try starting online decoder (on a new port each time)
+    start_attempts = 3
+
+    def start_decoder(self):
+        """Load online decoder ahead of the first voice command (nnet3 only)."""
+        if self.model_type == KaldiModelType.NNET3:
+            self.ensure_decode()
+
+    def ensure_decode(self):
+        """Start online decoder if it isn't running."""
+        if (self.decode_proc is None) or (self.decode_proc.poll() is not None):
+            self.stop()
+            self.start_decode()
+
+    def start_decode(self):
+        """Start online2-tcp-nnet3-decode-faster on a free port.
+
+        The decoder stays loaded between voice commands. Each connection is a
+        new utterance, so only the decoder state is reset.
+
+        The port is picked before the decoder starts, so another program may
+        take it first. The decoder is restarted on a new port if it exits
+        before it's ready.
+        """
+        for attempt in range(1, self.start_attempts + 1):
+            self.port_num = get_free_port()
+
+            try:
+                self._start_decode()
+                return
+            except RuntimeError:
+                if attempt >= self.start_attempts:
+                    raise
+
+                _LOGGER.warning(
+                    "Online decoder failed to start on port %s (attempt %s/%s)",
+                    self.port_num,
+                    attempt,
+                    self.start_attempts,
+                )
+
+    def _start_decode(self):
+        """Start online decoder on self.port_num and wait until it's ready."""
+        online_conf = self.model_dir / "online" / "conf" / "online.conf"
+        kaldi_cmd = [
+            str(self.kaldi_dir / "online2-tcp-nnet3-decode-faster"),
+            f"--port-num={self.port_num}",
+            f"--config={online_conf}",
+            f"--output-period={self.partial_interval}",
+            "--frame-subsampling-factor=3",
+            "--max-active=7000",
+            "--lattice-beam=8.0",
+            "--acoustic-scale=1.0",
+            "--beam=24.0",
+            str(self.model_dir / "model" / "final.mdl"),
+            str(self.graph_dir / "HCLG.fst"),
+            str(self.graph_dir / "words.txt"),
+        ]
+
+        # Add custom arguments
+        if self.kaldi_args:
+            for arg_name, arg_value in self.kaldi_args.items():
+                kaldi_cmd.append(f"--{arg_name}={arg_value}")
+
+        _LOGGER.debug(kaldi_cmd)
+
+        start_time = time.perf_counter()
+        self.decode_proc = subprocess.Popen(
+            kaldi_cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+
+        # Read until started
+        assert self.decode_proc.stdout
+        for line in self.decode_proc.stdout:
+            line = line.lower().strip()
+            if line:
+                _LOGGER.debug(line)
+
+            if "waiting for client" in line:
+                break
+        else:
+            self.stop()
+            raise RuntimeError("Online decoder exited before it was ready")
+
+        # Decoder output isn't read again; don't let it fill up the pipe
+        threading.Thread(
+            target=self._drain_output, args=(self.decode_proc.stdout,), daemon=True
+        ).start()
+
+        _LOGGER.debug(
+            "Online decoder started on port %s in %s second(s)",
+            self.port_num,
+            time.perf_counter() - start_time,
+        )
+
+    def _drain_output(self, decode_out: typing.TextIO):
+        """Read and discard online decoder log output."""
+        for line in decode_out:
+            _LOGGER.debug("Kaldi> %s", line.strip())
+
+    def transcribe_stream(
+        self,
+        audio_stream: typing.Iterable[bytes],
+        sample_rate: int,
+        sample_width: int,
+        channels: int,
+    ) -> typing.Optional[Transcription]:
+        """Speech to text from an audio stream (restarts online decoder if needed)."""
+        return self.transcribe_stream_partial(
+            audio_stream, sample_rate, sample_width, channels
+        )
+
+    def transcribe_stream_partial(
+        self,
+        audio_stream: typing.Iterable[bytes],
+        sample_rate: int,
+        sample_width: int,
+        channels: int,
+        on_partial: typing.Optional[
+            typing.Callable[[typing.List[str], float], None]
+        ] = None,
+    ) -> typing.Optional[Transcription]:
+        """Speech to text from an audio stream.
+
+        on_partial is called with the words of each temporary transcript from
+        the online decoder and the seconds of audio it covers (nnet3 only).
+        """
+        if self.model_type != KaldiModelType.NNET3:
+            return super().transcribe_stream(
+                audio_stream, sample_rate, sample_width, channels
+            )
+
+        # Copy audio in case it needs to be sent to a restarted decoder.
+        # Chunks may be re-used by the caller once the next one is requested.
+        audio_stream = iter(audio_stream)
+        kept_audio = bytearray()
+
+        def keep_chunks() -> typing.Iterable[bytes]:
+            for chunk in audio_stream:
+                kept_audio.extend(chunk)
+                yield chunk
+
+        self.ensure_decode()
+
+        try:
+            return self._transcribe_online(
+                keep_chunks(), sample_rate, sample_width, on_partial
+            )
+        except OSError:
+            # Decoder crashed or connection was lost
+            _LOGGER.exception("transcribe_stream")
+            self.stop()
+
+        # Try once more with a fresh decoder (no partial results)
+        self.ensure_decode()
+
+        return self._transcribe_online(
+            itertools.chain([bytes(kept_audio)], audio_stream),
+            sample_rate,
+            sample_width,
+        )
+
+    def _transcribe_online(
+        self,
+        audio_stream: typing.Iterable[bytes],
+        sample_rate: int,
+        sample_width: int,
+        on_partial: typing.Optional[
+            typing.Callable[[typing.List[str], float], None]
+        ] = None,
+    ) -> typing.Optional[Transcription]:
+        """Send audio to online decoder while reading its transcripts."""
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.settimeout(self.timeout_seconds)
+        client_socket.connect(("localhost", self.port_num))
+
+        # Temporary transcripts end with \r, final transcripts with \n.
+        # There is more than one final transcript if an endpoint was detected.
+        final_texts: typing.List[str] = []
+        partial_texts: typing.List[str] = []
+        read_errors: typing.List[OSError] = []
+        num_frames = 0
+
+        def read_transcripts():
+            buffer = b""
+            try:
+                while True:
+                    data = client_socket.recv(4096)
+                    if not data:
+                        break
+
+                    buffer += data
+                    line_start = 0
+                    for match in _TRANSCRIPT_LINE.finditer(buffer):
+                        text = match.group(1).decode().strip()
+                        line_start = match.end()
+
+                        if match.group(2) == b"\n":
+                            if text:
+                                final_texts.append(text)
+
+                            continue
+
+                        partial_texts.append(text)
+                        if text and on_partial:
+                            # Transcripts are output every partial_interval
+                            # seconds of audio.
+                            on_partial(
+                                text.split(),
+                                min(
+                                    len(partial_texts) * self.partial_interval,
+                                    num_frames / sample_rate,
+                                ),
+                            )
+
+                    buffer = buffer[line_start:]
+            except OSError as e:
+                read_errors.append(e)
+
+            if buffer.strip():
+                final_texts.append(buffer.decode().strip())
+
+        read_thread = threading.Thread(target=read_transcripts, daemon=True)
+        read_thread.start()
+
+        try:
+            start_time = time.perf_counter()
+            for chunk in audio_stream:
+                if chunk:
+                    client_socket.sendall(chunk)
+                    num_frames += len(chunk) // sample_width
+
+            # Partial shutdown of socket (write only).
+            # This should force the Kaldi server to finalize the output.
+            client_socket.shutdown(socket.SHUT_WR)
+
+            _LOGGER.debug("Finished stream. Getting transcription.")
+            read_thread.join()
+        finally:
+            client_socket.close()
+
+        if read_errors:
+            raise read_errors[0]
+
+        _LOGGER.debug(final_texts)
+
+        if final_texts:
+            text = " ".join(final_texts)
+        else:
+            # Use last temporary transcript
+            text = next((t for t in reversed(partial_texts) if t), "")
+
+        if text:
+            # Success
+            end_time = time.perf_counter()
+
+            return Transcription(
+                text=text,
+                likelihood=1,
+                transcribe_seconds=(end_time - start_time),
+                wav_seconds=(num_frames / sample_rate),
+            )
+
+        # Failure
+        return None
+
+    def transcribe_wavs(
+        self, wavs: typing.Sequence[bytes]
+    ) -> typing.List[typing.Optional[Transcription]]:
+        """Speech to text from multiple WAVs (results are in the same order)."""
+        if not wavs:
+            return []
+
+        start_time = time.perf_counter()
+
+        with tempfile.TemporaryDirectory() as temp_dir_str:
+            temp_dir = Path(temp_dir_str)
+
+            # Each utterance is its own speaker, so results are the same as
+            # decoding one WAV at a time.
+            utt_ids = [f"utt{i:06d}" for i in range(len(wavs))]
+            wav_scp = temp_dir / "wav.scp"
+            spk2utt = temp_dir / "spk2utt"
+
+            with open(wav_scp, "w") as wav_scp_file, open(spk2utt, "w") as spk2utt_file:
+                for utt_id, wav_bytes in zip(utt_ids, wavs):
+                    wav_path = temp_dir / f"{utt_id}.wav"
+                    wav_path.write_bytes(wav_bytes)
+
+                    print(utt_id, wav_path, file=wav_scp_file)
+                    print(utt_id, utt_id, file=spk2utt_file)
+
+            if self.model_type == KaldiModelType.NNET3:
+                lines = self._decode_nnet3(wav_scp, spk2utt)
+            elif self.model_type == KaldiModelType.GMM:
+                lines = self._decode_gmm(wav_scp, temp_dir)
+            else:
+                raise ValueError(self.model_type)
+
+        # utterance id -> text
+        texts: typing.Dict[str, str] = {}
+        utt_id_set = set(utt_ids)
+        for line in lines:
+            parts = line.strip().split(maxsplit=1)
+            if parts and (parts[0] in utt_id_set) and (parts[0] not in texts):
+                texts[parts[0]] = parts[1] if len(parts) > 1 else ""
+
+        # Decoding time is shared equally between utterances
+        end_time = time.perf_counter()
+        transcribe_seconds = (end_time - start_time) / len(wavs)
+        _LOGGER.debug(
+            "Decoded %s WAV(s) in %s second(s)", len(wavs), end_time - start_time
+        )
+
+        results: typing.List[typing.Optional[Transcription]] = []
+        for utt_id, wav_bytes in zip(utt_ids, wavs):
+            text = texts.get(utt_id, "").strip()
+            if text:
+                results.append(
+                    Transcription(
+                        text=text,
+                        likelihood=1,
+                        transcribe_seconds=transcribe_seconds,
+                        wav_seconds=get_wav_duration(wav_bytes),
+                    )
+                )
+            else:
+                # Failure
+                results.append(None)
+
+        return results
+
+    def _decode_nnet3(self, wav_scp: Path, spk2utt: Path) -> typing.List[str]:
+        """Decode all utterances with a single nnet3 decoder."""
+        words_txt = self.graph_dir / "words.txt"
+        online_conf = self.model_dir / "online" / "conf" / "online.conf"
+        kaldi_cmd = [
+            str(self.kaldi_dir / "online2-wav-nnet3-latgen-faster"),
+            "--online=false",
+            "--do-endpointing=false",
+            "--max-active=7000",
+            "--lattice-beam=8.0",
+            "--acoustic-scale=1.0",
+            "--beam=24.0",
+            f"--word-symbol-table={words_txt}",
+            f"--config={online_conf}",
+            str(self.model_dir / "model" / "final.mdl"),
+            str(self.graph_dir / "HCLG.fst"),
+            f"ark:{spk2utt}",
+            f"scp:{wav_scp}",
+            "ark:/dev/null",
+        ]
+
+        # Add custom arguments
+        if self.kaldi_args:
+            for arg_name, arg_value in self.kaldi_args.items():
+                kaldi_cmd.append(f"--{arg_name}={arg_value}")
+
+        _LOGGER.debug(kaldi_cmd)
+
+        try:
+            # Transcriptions are logged to stderr
+            return subprocess.check_output(
+                kaldi_cmd, stderr=subprocess.STDOUT, universal_newlines=True
+            ).splitlines()
+        except subprocess.CalledProcessError as e:
+            _LOGGER.exception("_decode_nnet3")
+            _LOGGER.error(e.output)
+
+        return []
+
+    def _decode_gmm(self, wav_scp: Path, temp_dir: Path) -> typing.List[str]:
+        """Decode all utterances with a single GMM pipeline."""
+        words_txt = self.graph_dir / "words.txt"
+        mfcc_conf = self.model_dir / "conf" / "mfcc.conf"
+
+        # CMVN stats are per utterance (no spk2utt), as with single WAV files
+        steps = [
+            [
+                str(self.kaldi_dir / "compute-mfcc-feats"),
+                f"--config={mfcc_conf}",
+                f"scp:{wav_scp}",
+                f"ark,scp:{temp_dir}/feats.ark,{temp_dir}/feats.scp",
+            ],
+            [
+                str(self.kaldi_dir / "compute-cmvn-stats"),
+                f"scp:{temp_dir}/feats.scp",
+                f"ark,scp:{temp_dir}/cmvn.ark,{temp_dir}/cmvn.scp",
+            ],
+            [
+                str(self.kaldi_dir / "apply-cmvn"),
+                f"scp:{temp_dir}/cmvn.scp",
+                f"scp:{temp_dir}/feats.scp",
+                f"ark,scp:{temp_dir}/feats_cmvn.ark,{temp_dir}/feats_cmvn.scp",
+            ],
+            [
+                str(self.kaldi_dir / "add-deltas"),
+                f"scp:{temp_dir}/feats_cmvn.scp",
+                f"ark,scp:{temp_dir}/deltas.ark,{temp_dir}/deltas.scp",
+            ],
+        ]
+
+        decode_cmd = [
+            str(self.kaldi_dir / "gmm-latgen-faster"),
+            f"--word-symbol-table={words_txt}",
+            f"{self.model_dir}/model/final.mdl",
+            f"{self.graph_dir}/HCLG.fst",
+            f"scp:{temp_dir}/deltas.scp",
+            f"ark,scp:{temp_dir}/lattices.ark,{temp_dir}/lattices.scp",
+        ]
+
+        try:
+            for step_cmd in steps:
+                _LOGGER.debug(step_cmd)
+                subprocess.check_call(step_cmd)
+
+            _LOGGER.debug(decode_cmd)
+
+            # Transcriptions are logged to stderr
+            return subprocess.check_output(
+                decode_cmd, stderr=subprocess.STDOUT, universal_newlines=True
+            ).splitlines()
+        except subprocess.CalledProcessError as e:
+            _LOGGER.exception("_decode_gmm")
+            if e.output:
+                _LOGGER.error(e.output)
+
+        return []
@@ -0,0 +1,78 @@
+"""Support for partial transcriptions with Pocketsphinx."""
+import logging
+import typing
+
+from rhasspyasr import Transcription
+from rhasspyasr_pocketsphinx import PocketsphinxTranscriber
+
+_LOGGER = logging.getLogger("voice2json.pocketsphinx")
+
+# -----------------------------------------------------------------------------
+
+
+class PocketsphinxStreamTranscriber(PocketsphinxTranscriber):
+    """Pocketsphinx transcriber that can report hypotheses during a stream."""
+
+    # Has transcribe_stream_partial
+    partial_results = True
+
+    # Seconds of audio between partial hypotheses
+    partial_interval: float = 1.0
+
+    def transcribe_stream_partial(
+        self,
+        audio_stream: typing.Iterable[bytes],
+        sample_rate: int,
+        sample_width: int,
+        channels: int,
+        on_partial: typing.Optional[
+            typing.Callable[[typing.List[str], float], None]
+        ] = None,
+    ) -> typing.Optional[Transcription]:
+        """Speech to text from an audio stream.
+
+        on_partial is called with the words of the current hypothesis and the
+        seconds of audio it covers, at most once every partial_interval seconds.
+        """
+        if on_partial is None:
+            return self.transcribe_stream(
+                audio_stream, sample_rate, sample_width, channels
+            )
+
+        bytes_per_second = sample_rate * sample_width * channels
+        partial_bytes = max(1, int(self.partial_interval * bytes_per_second))
+
+        def audio_with_partials() -> typing.Iterable[bytes]:
+            total_bytes = 0
+            next_partial = partial_bytes
+            for chunk in audio_stream:
+                yield chunk
+
+                # Chunk has been processed by the decoder
+                total_bytes += len(chunk)
+                if (total_bytes >= next_partial) and (self.decoder is not None):
+                    hyp = self.decoder.hyp()
+                    if hyp and hyp.hypstr.strip():
+                        on_partial(hyp.hypstr.split(), total_bytes / bytes_per_second)
+
+                    next_partial = total_bytes + partial_bytes
+
+        return self.transcribe_stream(
+            audio_with_partials(), sample_rate, sample_width, channels
+        )
+
+
+# -----------------------------------------------------------------------------
+
+
+def load_transcriber(
+    *args, partial_interval: typing.Optional[float] = None, **kwargs
+) -> PocketsphinxStreamTranscriber:
+    """Create transcriber with its decoder loaded (picklable for worker processes)."""
+    transcriber = PocketsphinxStreamTranscriber(*args, **kwargs)
+    if partial_interval is not None:
+        transcriber.partial_interval = partial_interval
+
+    transcriber.decoder = transcriber.get_decoder()
+
+    return transcriber
@@ -0,0 +1,147 @@
+"""Transcription with a pool of worker processes."""
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.util
+import threading
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_LOGGER = logging.getLogger("voice2json.pool")
+
+# Pool id -> transcriber used by worker processes of that pool
+_POOL_TRANSCRIBERS: typing.Dict[int, typing.Any] = {}
+_POOL_IDS = itertools.count()
+
+# -----------------------------------------------------------------------------
+
+
+class ProcessPoolTranscriber:
+    """Decodes WAV data in worker processes.
+
+    The transcriber's model should be loaded before this pool is created. If
+    this process has no other threads, each worker is forked from it, so model
+    memory is shared (copy on write) instead of being loaded again.
+
+    Forking a process with running threads can deadlock a child on a lock
+    another thread held at fork time. In that case, workers are started with
+    spawn instead, and each one loads its own model once with
+    transcriber_factory (a picklable callable).
+
+    Up to num_workers WAVs can be decoded at the same time from different
+    threads.
+    """
+
+    def __init__(
+        self,
+        transcriber,
+        num_workers: int = 2,
+        transcriber_factory: typing.Optional[typing.Callable[[], typing.Any]] = None,
+    ):
+        assert num_workers > 0, "Need at least one worker"
+        self.transcriber = transcriber
+        self.num_workers = num_workers
+        self.partial_results = getattr(transcriber, "partial_results", False)
+
+        # Streams are decoded in this process
+        self.stream_lock = threading.Lock()
+
+        self.transcriber_factory = transcriber_factory
+
+        # Each pool has its own entry, so a second pool doesn't replace the first
+        self.pool_id = next(_POOL_IDS)
+        _POOL_TRANSCRIBERS[self.pool_id] = transcriber
+
+        # Guards re-creating the pool after a worker dies
+        self.pool_lock = threading.Lock()
+        self.pool = self._start_pool()
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        """Start worker processes and wait until they're running."""
+        if threading.active_count() == 1:
+            # Share loaded model
+            pool = ProcessPoolExecutor(
+                self.num_workers, mp_context=multiprocessing.get_context("fork")
+            )
+            method = "Forked"
+        else:
+            assert (
+                self.transcriber_factory is not None
+            ), "Can't fork transcriber workers while threads are running"
+
+            pool = ProcessPoolExecutor(
+                self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.pool_id, self.transcriber_factory),
+            )
+            method = "Spawned"
+
+        # Workers are started by the first task, so start them now (before
+        # any other threads are).
+        pool.submit(_worker_ready).result()
+        _LOGGER.debug("%s %s transcriber worker(s)", method, self.num_workers)
+
+        return pool
+
+    def transcribe_wav(self, wav_bytes: bytes):
+        """Speech to text from WAV data in a worker process.
+
+        If a worker dies (crash, out of memory), BrokenProcessPool is raised
+        and the pool is re-created for the next WAV.
+        """
+        pool = self.pool
+        try:
+            return pool.submit(_worker_transcribe_wav, self.pool_id, wav_bytes).result()
+        except BrokenProcessPool:
+            with self.pool_lock:
+                if self.pool is pool:
+                    _LOGGER.error("Transcriber worker died. Restarting workers.")
+                    pool.shutdown(wait=False)
+                    self.pool = self._start_pool()
+
+            raise
+
+    def transcribe_stream(self, audio_stream, sample_rate, sample_width, channels):
+        """Speech to text from an audio stream (in this process)."""
+        with self.stream_lock:
+            return self.transcriber.transcribe_stream(
+                audio_stream, sample_rate, sample_width, channels
+            )
+
+    def transcribe_stream_partial(
+        self, audio_stream, sample_rate, sample_width, channels, on_partial=None
+    ):
+        """Speech to text from an audio stream with partial hypotheses (in this process)."""
+        with self.stream_lock:
+            return self.transcriber.transcribe_stream_partial(
+                audio_stream, sample_rate, sample_width, channels, on_partial
+            )
+
+    def stop(self):
+        """Stop worker processes and transcriber."""
+        self.pool.shutdown()
+        _POOL_TRANSCRIBERS.pop(self.pool_id, None)
+        self.transcriber.stop()
+
+
+def _init_worker(pool_id: int, transcriber_factory: typing.Callable[[], typing.Any]):
+    """Load transcriber once in a spawned worker process."""
+    transcriber = transcriber_factory()
+    _POOL_TRANSCRIBERS[pool_id] = transcriber
+
+    # Stop transcriber when worker exits
+    multiprocessing.util.Finalize(transcriber, transcriber.stop, exitpriority=10)
+
+
+def _worker_ready() -> bool:
+    """Check that a worker process is running."""
+    return True
+
+
+def _worker_transcribe_wav(pool_id: int, wav_bytes: bytes):
+    """Transcribe WAV data with the transcriber inherited or loaded by this worker."""
+    transcriber = _POOL_TRANSCRIBERS.get(pool_id)
+    assert transcriber is not None, "No transcriber in worker"
+    return transcriber.transcribe_wav(wav_bytes)
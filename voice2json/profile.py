@@ -0,0 +1,294 @@
+"""Profile loading with a cache of the fully resolved settings."""
+import collections.abc
+import json
+import logging
+import os
+import pickle
+import re
+import typing
+from pathlib import Path
+
+import pydash
+
+from .utils import recursive_update
+
+_LOGGER = logging.getLogger("voice2json.profile")
+
+# Bump when the cache format changes
+PROFILE_CACHE_VERSION = 1
+
+# Environment variables referenced by !env values ($name or ${name})
+_ENV_VARIABLE = re.compile(r"\$\{?(\w+)\}?")
+
+# setting path -> where its value came from
+ProfileSources = typing.Dict[str, str]
+
+# -----------------------------------------------------------------------------
+
+
+def load_profile(
+    defaults_yaml: Path,
+    profile_yaml: Path,
+    machine: str,
+    settings: typing.Sequence[typing.Tuple[str, str]] = (),
+    cache_path: typing.Optional[Path] = None,
+) -> typing.Tuple[typing.Dict[str, typing.Any], ProfileSources]:
+    """Load defaults, profile YAML, platform overrides, and user settings.
+
+    If cache_path is given, the resolved profile is stored there and re-used
+    until a YAML file, the machine, the settings, or a referenced environment
+    variable changes.
+
+    Returns the profile and the source of each setting.
+    """
+    cache_key = (
+        PROFILE_CACHE_VERSION,
+        _file_key(defaults_yaml),
+        _file_key(profile_yaml),
+        machine,
+        [tuple(setting) for setting in settings],
+    )
+
+    if cache_key[2] is None:
+        _LOGGER.warning("%s does not exist. Using default settings.", profile_yaml)
+
+    if cache_path is not None:
+        cached = _read_cache(cache_path, cache_key)
+        if cached is not None:
+            _LOGGER.debug("Loaded profile from cache %s", cache_path)
+            return cached
+
+    # environment variable name -> value when loaded
+    env_values: typing.Dict[str, typing.Optional[str]] = {}
+    profile, sources = _resolve_profile(
+        defaults_yaml, profile_yaml, machine, settings, env_values
+    )
+
+    if cache_path is not None:
+        _write_cache(cache_path, cache_key, env_values, profile, sources)
+
+    return profile, sources
+
+
+def explain_profile(
+    profile: typing.Dict[str, typing.Any], sources: ProfileSources
+) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """Get value and source of every setting in a profile, keyed by path."""
+    explained: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    for setting_path, value in _leaves(profile):
+        explained[setting_path] = {
+            "value": value,
+            "source": sources.get(setting_path, "unknown"),
+        }
+
+    return explained
+
+
+# -----------------------------------------------------------------------------
+
+
+def _resolve_profile(
+    defaults_yaml: Path,
+    profile_yaml: Path,
+    machine: str,
+    settings: typing.Sequence[typing.Tuple[str, str]],
+    env_values: typing.Dict[str, typing.Optional[str]],
+) -> typing.Tuple[typing.Dict[str, typing.Any], ProfileSources]:
+    """Parse YAML files and apply overrides."""
+    import yaml
+
+    from .utils import env_constructor
+
+    # Expand environment variables in string value
+    yaml.SafeLoader.add_constructor("!env", env_constructor)
+
+    def load_yaml(yaml_path: Path) -> typing.Any:
+        yaml_text = yaml_path.read_text()
+        for env_name in _ENV_VARIABLE.findall(yaml_text):
+            env_values[env_name] = os.environ.get(env_name)
+
+        return yaml.safe_load(yaml_text)
+
+    profile: typing.Dict[str, typing.Any] = {}
+    sources: ProfileSources = {}
+
+    # Load profile defaults
+    if defaults_yaml.exists():
+        _LOGGER.debug("Loading profile defaults from %s", defaults_yaml)
+        _update(profile, load_yaml(defaults_yaml) or {}, sources, str(defaults_yaml))
+
+    # Load profile (YAML)
+    _LOGGER.debug("Loading profile from %s", profile_yaml)
+
+    if profile_yaml.exists():
+        _update(profile, load_yaml(profile_yaml) or {}, sources, str(profile_yaml))
+
+    # Override with platform-specific settings
+    platform_overrides = profile.get("platform", [])
+    for platform_settings in platform_overrides:
+        machines = platform_settings.get("machine")
+        machine_settings = platform_settings.get("settings", {})
+
+        if machines and machine_settings:
+            if isinstance(machines, str):
+                # Ensure list
+                machines = [machines]
+
+            if machine in machines:
+                # Machine match: override settings
+                for key, value in machine_settings.items():
+                    _LOGGER.debug("Overriding %s (machine=%s)", key, machine)
+                    _update(
+                        profile[key],
+                        value,
+                        sources,
+                        f"platform (machine={machine})",
+                        prefix=key,
+                    )
+
+    # Override with user settings
+    for setting_path, setting_value in settings:
+        try:
+            setting_value = json.loads(setting_value)
+        except json.JSONDecodeError:
+            _LOGGER.warning(
+                "Interpreting setting for %s as a string. Surround with quotes to avoid this warning.",
+                setting_path,
+            )
+
+        _LOGGER.debug("Overriding %s with %s", setting_path, setting_value)
+        pydash.set_(profile, setting_path, setting_value)
+        _set_sources(sources, setting_path, setting_value, "--setting")
+
+    return profile, sources
+
+
+def _update(
+    base_dict: typing.Dict[typing.Any, typing.Any],
+    new_dict: typing.Mapping[typing.Any, typing.Any],
+    sources: ProfileSources,
+    source: str,
+    prefix: str = "",
+):
+    """recursive_update that also records the source of each new value."""
+    _update_sources(base_dict, new_dict, sources, source, prefix)
+    recursive_update(base_dict, new_dict)
+
+
+def _update_sources(
+    base_dict: typing.Mapping[typing.Any, typing.Any],
+    new_dict: typing.Mapping[typing.Any, typing.Any],
+    sources: ProfileSources,
+    source: str,
+    prefix: str,
+):
+    """Record sources of values that recursive_update will overwrite."""
+    for key, value in new_dict.items():
+        setting_path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, collections.abc.Mapping) and isinstance(
+            base_dict.get(key), collections.abc.Mapping
+        ):
+            # Merged
+            _update_sources(base_dict[key], value, sources, source, setting_path)
+        else:
+            # Replaced
+            _set_sources(sources, setting_path, value, source)
+
+
+def _set_sources(
+    sources: ProfileSources, setting_path: str, value: typing.Any, source: str
+):
+    """Record source of a value (and everything under it) that replaces setting_path."""
+    subtree_prefix = setting_path + "."
+    for old_path in [
+        p for p in sources if (p == setting_path) or p.startswith(subtree_prefix)
+    ]:
+        sources.pop(old_path)
+
+    for leaf_path, _ in _leaves(value, setting_path):
+        sources[leaf_path] = source
+
+
+def _leaves(
+    value: typing.Any, prefix: str = ""
+) -> typing.Iterable[typing.Tuple[str, typing.Any]]:
+    """Yield (dotted path, value) for each non-dictionary value."""
+    if isinstance(value, collections.abc.Mapping) and value:
+        for key, sub_value in value.items():
+            sub_path = f"{prefix}.{key}" if prefix else str(key)
+            yield from _leaves(sub_value, sub_path)
+    else:
+        yield prefix, value
+
+
+# -----------------------------------------------------------------------------
+
+
+def _file_key(file_path: Path) -> typing.Optional[typing.Tuple[str, int, int]]:
+    """Path, modification time, and size of a file (None if missing)."""
+    try:
+        file_stat = file_path.stat()
+    except OSError:
+        return None
+
+    return (str(file_path), file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def _read_cache(
+    cache_path: Path, cache_key: typing.Any
+) -> typing.Optional[typing.Tuple[typing.Dict[str, typing.Any], ProfileSources]]:
+    """Load resolved profile from cache if it's still up to date."""
+    try:
+        with open(cache_path, "rb") as cache_file:
+            cached = pickle.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        _LOGGER.debug("Ignoring unreadable profile cache %s", cache_path)
+        return None
+
+    if not isinstance(cached, dict) or (cached.get("key") != cache_key):
+        return None
+
+    for env_name, env_value in cached["env"].items():
+        if os.environ.get(env_name) != env_value:
+            _LOGGER.debug("Profile cache is stale ($%s changed)", env_name)
+            return None
+
+    return cached["profile"], cached["sources"]
+
+
+def _write_cache(
+    cache_path: Path,
+    cache_key: typing.Any,
+    env_values: typing.Dict[str, typing.Optional[str]],
+    profile: typing.Dict[str, typing.Any],
+    sources: ProfileSources,
+):
+    """Save resolved profile to cache (skipped if not writable)."""
+    if not cache_path.parent.is_dir():
+        return
+
+    temp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}")
+    try:
+        with open(temp_path, "wb") as cache_file:
+            pickle.dump(
+                {
+                    "key": cache_key,
+                    "env": env_values,
+                    "profile": profile,
+                    "sources": sources,
+                },
+                cache_file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+        # Atomic so concurrent commands never see a partial cache
+        os.replace(temp_path, cache_path)
+        _LOGGER.debug("Wrote profile cache %s", cache_path)
+    except OSError:
+        _LOGGER.debug("Unable to write profile cache %s", cache_path)
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
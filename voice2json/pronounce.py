@@ -31,7 +31,7 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         pydash.get(core.profile, "speech-to-text.phoneme-pronunciations", True)
     )
 
-    play_command = shlex.split(pydash.get(core.profile, "audio.play-command"))
+    play_command = shlex.split(core.settings.audio.play_command)
     word_casing = pydash.get(core.profile, "training.word-casing", "ignore").lower()
     g2p_exists = False
 
@@ -41,14 +41,6 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         # Make sure profile has been trained
         assert core.check_trained(), "Not trained"
 
-        base_dictionary_path = core.ppath(
-            "training.base_dictionary", "base_dictionary.txt"
-        )
-        custom_words_path = core.ppath("training.custom-words-file", "custom_words.txt")
-        custom_words_action = PronunciationAction(
-            pydash.get(core.profile, "training.custom-words-action", "append")
-        )
-        sounds_like_path = core.ppath("training.sounds-like-file", "sounds_like.txt")
         sounds_like_action = PronunciationAction(
             pydash.get(core.profile, "training.sounds-like-action", "append")
         )
@@ -59,14 +51,7 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         g2p_exists = bool(g2p_path and g2p_path.exists())
 
         # Load pronunciations
-        pronunciations, g2p_alignment = load_pronunciations(
-            base_dictionary=base_dictionary_path,
-            custom_words=custom_words_path,
-            custom_words_action=custom_words_action,
-            sounds_like=sounds_like_path,
-            sounds_like_action=sounds_like_action,
-            g2p_corpus=g2p_corpus_path,
-        )
+        pronunciations, g2p_alignment = load_profile_pronunciations(core)
 
     # True if audio will go to stdout.
     # In this case, printing will go to stderr.
@@ -374,6 +359,27 @@ def get_pronounce_marytts(
 # -----------------------------------------------------------------------------
 
 
+def load_profile_pronunciations(
+    core: Voice2JsonCore,
+) -> typing.Tuple[PronunciationsType, typing.Optional[G2PAlignmentType]]:
+    """Loads phonetic pronunciations using profile settings."""
+    return load_pronunciations(
+        base_dictionary=core.ppath("training.base-dictionary", "base_dictionary.txt"),
+        base_dictionary_index=core.ppath(
+            "training.base-dictionary-index", "base_dictionary.db"
+        ),
+        custom_words=core.ppath("training.custom-words-file", "custom_words.txt"),
+        custom_words_action=PronunciationAction(
+            pydash.get(core.profile, "training.custom-words-action", "append")
+        ),
+        sounds_like=core.ppath("training.sounds-like-file", "sounds_like.txt"),
+        sounds_like_action=PronunciationAction(
+            pydash.get(core.profile, "training.sounds-like-action", "append")
+        ),
+        g2p_corpus=core.ppath("training.grapheme-to-phoneme-corpus", "g2p.corpus"),
+    )
+
+
 def load_pronunciations(
     base_dictionary: typing.Optional[Path] = None,
     custom_words: typing.Optional[Path] = None,
@@ -381,11 +387,42 @@ def load_pronunciations(
     sounds_like: typing.Optional[Path] = None,
     sounds_like_action: PronunciationAction = PronunciationAction.APPEND,
     g2p_corpus: typing.Optional[Path] = None,
+    base_dictionary_index: typing.Optional[Path] = None,
 ) -> typing.Tuple[PronunciationsType, typing.Optional[G2PAlignmentType]]:
-    """Loads phonetic pronunciations from available dictionaries and sounds like file."""
+    """Loads phonetic pronunciations from available dictionaries and sounds like file.
+
+    If base_dictionary_index is given, the base dictionary is indexed once and
+    words are looked up lazily instead of reading the whole dictionary. The
+    whole dictionary is still read if the index can't be written (e.g., a
+    read-only profile).
+    """
     pronunciations: PronunciationsType = defaultdict(list)
+    dict_paths = [base_dictionary, custom_words]
+
+    if base_dictionary and base_dictionary.is_file() and base_dictionary_index:
+        import sqlite3
+
+        from .dictionary import DictionaryIndex, LazyPronunciations
+
+        try:
+            # Dict-like, so usable wherever pronunciations are expected
+            pronunciations = typing.cast(
+                PronunciationsType,
+                LazyPronunciations(
+                    DictionaryIndex(base_dictionary, base_dictionary_index),
+                    action=custom_words_action,
+                ),
+            )
+
+            dict_paths = [custom_words]
+        except (sqlite3.Error, OSError) as e:
+            _LOGGER.warning(
+                "Reading whole dictionary (failed to index %s: %s)",
+                base_dictionary_index,
+                e,
+            )
 
-    for dict_path in [base_dictionary, custom_words]:
+    for dict_path in dict_paths:
         if not dict_path:
             continue
 
@@ -1,20 +1,25 @@
 """Intent recognition methods."""
 import argparse
+import collections
 import dataclasses
-import gzip
 import io
 import json
 import logging
+import multiprocessing
+import multiprocessing.pool
+import multiprocessing.util
 import os
+import pickle
+import select
 import subprocess
 import sys
+import threading
+import time
 import typing
 from pathlib import Path
 
-import pydash
-
 from .core import Voice2JsonCore
-from .utils import print_json
+from .utils import JsonLinesSink, is_regular_file
 
 _LOGGER = logging.getLogger("voice2json.recognize")
 
@@ -23,45 +28,9 @@ _LOGGER = logging.getLogger("voice2json.recognize")
 
 async def recognize(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Recognize intent from sentence(s)."""
-    import networkx as nx
-    import rhasspynlu
-    from .train import WordCasing
-
     # Make sure profile has been trained
     assert core.check_trained(), "Not trained"
 
-    # Load settings
-    language_code = pydash.get(core.profile, "language.code", "en-US")
-    word_casing = WordCasing(
-        pydash.get(core.profile, "training.word-casing", "ignore").lower()
-    )
-    intent_graph_path = core.ppath("training.intent-graph", "intent.pickle.gz")
-    converters_dir = core.ppath("training.converters-directory", "converters")
-    stop_words_path = core.ppath("intent-recognition.stop-words", "stop_words.txt")
-    fuzzy = pydash.get(core.profile, "intent-recognition.fuzzy", True)
-
-    # Load stop words
-    stop_words: typing.Optional[typing.Set[str]] = None
-    if stop_words_path and stop_words_path.is_file():
-        stop_words = set()
-        with open(stop_words_path, "r") as stop_words_file:
-            for line in stop_words_file:
-                line = line.strip()
-                if line:
-                    stop_words.add(line)
-
-    # Load converters
-    extra_converters: typing.Optional[typing.Dict[str, typing.Any]] = {}
-    if converters_dir:
-        extra_converters = load_converters(converters_dir)
-
-    # Case transformation for input words
-    word_transform = None
-    if word_casing == WordCasing.UPPER:
-        word_transform = str.upper
-    elif word_casing == WordCasing.LOWER:
-        word_transform = str.lower
-
     if args.sentence:
         sentences = args.sentence
     else:
@@ -70,94 +39,488 @@ async def recognize(args: argparse.Namespace, core: Voice2JsonCore) -> None:
 
         sentences = sys.stdin
 
-    # Whitelist function for intents
+    # Whitelist for intents
+    intent_filter: typing.Optional[typing.Set[str]] = None
     if args.intent_filter:
-        args.intent_filter = set(args.intent_filter)
-
-    def intent_filter(intent_name: str) -> bool:
-        """Filter out intents."""
-        if args.intent_filter:
-            return intent_name in args.intent_filter
+        intent_filter = set(args.intent_filter)
 
-        return True
+    # Load intent graph, stop words, converters, etc.
+    recognizer = core.get_recognizer()
 
-    # Load intent graph
-    _LOGGER.debug("Loading %s", intent_graph_path)
-    with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
-        intent_graph = nx.readwrite.gpickle.read_gpickle(graph_gzip)
+    # Buffer output when sentences don't come from a pipe/terminal
+    sink = JsonLinesSink.for_batch(
+        batch=bool(args.sentence) or is_regular_file(sys.stdin)
+    )
 
     # Process sentences
     try:
-        for sentence in sentences:
-            if args.text_input:
-                # Input is plain text
-                text = sentence
-                sentence_object = {"text": text}
-            else:
-                # Input is JSON
-                sentence_object = json.loads(sentence)
-                text = sentence_object.get(args.transcription_property, "")
+        if args.workers > 1:
+            for sentence_object in recognize_parallel(
+                recognizer,
+                sentences,
+                args,
+                intent_filter=intent_filter,
+                num_workers=args.workers,
+                chunk_size=args.chunk_size,
+            ):
+                sink.write(sentence_object)
+        else:
+            for sentence in sentences:
+                sink.write(
+                    recognize_sentence(
+                        recognizer, sentence, args, intent_filter=intent_filter
+                    )
+                )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+        recognizer.stop()
+
+
+def recognize_sentence(
+    recognizer: "IntentRecognizer",
+    sentence: str,
+    args: argparse.Namespace,
+    intent_filter: typing.Optional[typing.Set[str]] = None,
+) -> typing.Dict[str, typing.Any]:
+    """Recognize intent from a single line of input (text or JSON)."""
+    import rhasspynlu
 
-            # Tokenize
-            text = text.strip()
-            tokens = text.split()
+    sentence_object: typing.Dict[str, typing.Any]
+    if args.text_input:
+        # Input is plain text
+        text = sentence
+        sentence_object = {"text": text}
+    else:
+        # Input is JSON
+        sentence_object = json.loads(sentence)
+        text = sentence_object.get(args.transcription_property, "")
+
+    # Recognize intent
+    text = text.strip()
+    recognition = recognizer.recognize(
+        text, intent_filter=intent_filter, replace_numbers=args.replace_numbers
+    )
+
+    merge_recognition(sentence_object, recognition, text)
 
-            if args.replace_numbers:
-                tokens = list(
-                    rhasspynlu.replace_numbers(tokens, language=language_code)
+    if args.perplexity:
+        # Compute perplexity of input text for one or more language
+        # models (stored in FST binary format).
+        perplexity = {}
+        for lm_fst_path in args.perplexity:
+            try:
+                perplexity[lm_fst_path] = rhasspynlu.arpa_lm.get_perplexity(
+                    text, lm_fst_path, debug=args.debug
                 )
+            except Exception:
+                _LOGGER.exception(lm_fst_path)
+
+        sentence_object["perplexity"] = perplexity
+
+    return sentence_object
+
+
+def merge_recognition(
+    sentence_object: typing.Dict[str, typing.Any], recognition, text: str
+) -> typing.Dict[str, typing.Any]:
+    """Merge a recognition into an input JSON object (modified in place)."""
+    result = dataclasses.asdict(recognition)
+
+    # Add slots
+    result["slots"] = {e.entity: e.value for e in recognition.entities}
+
+    # Merge with input object
+    for key, value in result.items():
+        if (key not in sentence_object) or (value is not None):
+            sentence_object[key] = value
+
+    if not sentence_object["text"]:
+        sentence_object["text"] = text
+
+    # Keep text from transcription
+    sentence_object["raw_text"] = text
+
+    return sentence_object
+
+
+# -----------------------------------------------------------------------------
+# Parallel recognition
+# -----------------------------------------------------------------------------
+
+# Recognizer and arguments inherited by forked worker processes
+_WORKER_RECOGNIZER: typing.Optional["IntentRecognizer"] = None
+_WORKER_ARGS: typing.Optional[argparse.Namespace] = None
+_WORKER_INTENT_FILTER: typing.Optional[typing.Set[str]] = None
+
+
+def recognize_parallel(
+    recognizer: "IntentRecognizer",
+    sentences: typing.Iterable[str],
+    args: argparse.Namespace,
+    intent_filter: typing.Optional[typing.Set[str]] = None,
+    num_workers: int = 2,
+    chunk_size: int = 100,
+) -> typing.Iterable[typing.Dict[str, typing.Any]]:
+    """Recognize sentences in chunks with forked worker processes.
+
+    The recognizer should be loaded before calling this, so the intent graph and
+    fuzzy index are shared with the workers (copy on write) instead of being
+    loaded again. Results are yielded in input order. Each worker starts its own
+    persistent converters.
+    """
+    global _WORKER_RECOGNIZER, _WORKER_ARGS, _WORKER_INTENT_FILTER
+
+    assert num_workers > 0, "Need at least one worker"
+    assert chunk_size > 0, "Chunk size must be positive"
+
+    _WORKER_RECOGNIZER = recognizer
+    _WORKER_ARGS = args
+    _WORKER_INTENT_FILTER = intent_filter
+
+    pool = multiprocessing.get_context("fork").Pool(
+        num_workers, initializer=_init_recognize_worker
+    )
+    _LOGGER.debug(
+        "Recognizing with %s worker(s) (chunk size=%s)", num_workers, chunk_size
+    )
+
+    # pid -> [sentences, seconds]
+    worker_stats: typing.Dict[int, typing.List[typing.Any]] = {}
+    start_time = time.perf_counter()
+
+    # Bound the number of chunks in flight so large inputs aren't read into memory
+    pending: typing.Deque[multiprocessing.pool.AsyncResult] = collections.deque()
+    max_pending = 2 * num_workers
+
+    def finish_chunk():
+        worker_pid, sentence_objects, chunk_seconds = pending.popleft().get()
+        stats = worker_stats.setdefault(worker_pid, [0, 0.0])
+        stats[0] += len(sentence_objects)
+        stats[1] += chunk_seconds
+
+        return sentence_objects
+
+    try:
+        for chunk in _chunks(sentences, chunk_size):
+            pending.append(pool.apply_async(_worker_recognize_chunk, (chunk,)))
+
+            if len(pending) >= max_pending:
+                yield from finish_chunk()
+
+        while pending:
+            yield from finish_chunk()
+
+        # Let workers exit normally so converters are stopped
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    total_seconds = time.perf_counter() - start_time
+    for worker_pid, (num_sentences, worker_seconds) in sorted(worker_stats.items()):
+        _LOGGER.info(
+            "Worker %s: %s sentence(s) in %0.3f second(s) (%0.1f sentence(s)/second)",
+            worker_pid,
+            num_sentences,
+            worker_seconds,
+            (num_sentences / worker_seconds) if worker_seconds > 0 else 0.0,
+        )
+
+    num_sentences = sum(stats[0] for stats in worker_stats.values())
+    _LOGGER.info(
+        "Recognized %s sentence(s) in %0.3f second(s) with %s worker(s) (%0.1f sentence(s)/second)",
+        num_sentences,
+        total_seconds,
+        num_workers,
+        (num_sentences / total_seconds) if total_seconds > 0 else 0.0,
+    )
+
+
+def _chunks(
+    sentences: typing.Iterable[str], chunk_size: int
+) -> typing.Iterable[typing.List[str]]:
+    """Split input lines into lists of at most chunk_size."""
+    chunk: typing.List[str] = []
+    for sentence in sentences:
+        chunk.append(sentence)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _init_recognize_worker():
+    """Prepare recognizer inherited from the parent process."""
+    assert _WORKER_RECOGNIZER is not None, "No recognizer in worker"
+
+    # Don't share converter programs with the parent
+    for converter in (_WORKER_RECOGNIZER.extra_converters or {}).values():
+        if isinstance(converter, PersistentCommandLineConverter):
+            converter.proc = None
+
+    # Stop converters when worker exits
+    multiprocessing.util.Finalize(
+        _WORKER_RECOGNIZER, _WORKER_RECOGNIZER.stop, exitpriority=10
+    )
+
+
+def _worker_recognize_chunk(
+    chunk: typing.List[str],
+) -> typing.Tuple[int, typing.List[typing.Dict[str, typing.Any]], float]:
+    """Recognize a chunk of input lines in a worker process."""
+    assert (_WORKER_RECOGNIZER is not None) and (
+        _WORKER_ARGS is not None
+    ), "Worker not initialized"
+
+    start_time = time.perf_counter()
+    sentence_objects = [
+        recognize_sentence(
+            _WORKER_RECOGNIZER,
+            sentence,
+            _WORKER_ARGS,
+            intent_filter=_WORKER_INTENT_FILTER,
+        )
+        for sentence in chunk
+    ]
+
+    return (os.getpid(), sentence_objects, time.perf_counter() - start_time)
 
-            # Recognize intent
+
+# -----------------------------------------------------------------------------
+
+
+class IntentRecognizer:
+    """Recognizes intents from sentences using a loaded intent graph."""
+
+    def __init__(
+        self,
+        intent_graph,
+        language_code: str = "en-US",
+        fuzzy: bool = True,
+        stop_words: typing.Optional[typing.Set[str]] = None,
+        word_transform: typing.Optional[typing.Callable[[str], str]] = None,
+        extra_converters: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        fuzzy_index=None,
+        cache: typing.Optional["RecognitionCache"] = None,
+        graph_version: typing.Any = None,
+        nondeterministic_converters: typing.Optional[typing.Collection[str]] = None,
+    ):
+        self.intent_graph = intent_graph
+        self.language_code = language_code
+        self.fuzzy = fuzzy
+
+        # Speeds up fuzzy recognition (see fuzzy.py)
+        self.fuzzy_index = fuzzy_index
+        self.stop_words = stop_words
+        self.word_transform = word_transform
+        self.extra_converters = extra_converters
+
+        # Recognitions of recently seen sentences.
+        # Part of the cache key, so entries are never re-used with a new graph.
+        self.cache = cache
+        self.graph_version = graph_version
+
+        # Recognitions that call these converters are never cached
+        self.nondeterministic_converters = [
+            converter
+            for name, converter in (extra_converters or {}).items()
+            if name in set(nondeterministic_converters or [])
+        ]
+
+    def recognize(
+        self,
+        text: str,
+        intent_filter: typing.Optional[typing.Set[str]] = None,
+        replace_numbers: bool = False,
+    ):
+        """Recognize a single sentence. Returns an empty recognition on failure."""
+        import rhasspynlu
+
+        start_time = time.perf_counter()
+
+        # Tokenize
+        tokens = text.strip().split()
+
+        if replace_numbers:
+            tokens = list(
+                rhasspynlu.replace_numbers(tokens, language=self.language_code)
+            )
+
+        if self.cache is None:
+            return self._recognize_tokens(tokens, intent_filter)
+
+        cache_key = (
+            self.graph_version,
+            tuple(tokens),
+            frozenset(intent_filter) if intent_filter else None,
+        )
+
+        recognition = self.cache.get(cache_key)
+        if recognition is not None:
+            recognition.recognize_seconds = time.perf_counter() - start_time
+            return recognition
+
+        converter_calls = [c.calls for c in self.nondeterministic_converters]
+        recognition = self._recognize_tokens(tokens, intent_filter)
+
+        if converter_calls == [c.calls for c in self.nondeterministic_converters]:
+            self.cache.put(cache_key, recognition)
+
+        return recognition
+
+    def _recognize_tokens(
+        self,
+        tokens: typing.List[str],
+        intent_filter: typing.Optional[typing.Set[str]] = None,
+    ):
+        """Recognize a tokenized sentence with the intent graph."""
+        import rhasspynlu
+
+        from .fuzzy import recognize_fuzzy
+
+        def filter_intent(intent_name: str) -> bool:
+            """Filter out intents."""
+            if intent_filter:
+                return intent_name in intent_filter
+
+            return True
+
+        if self.fuzzy and (self.fuzzy_index is not None):
+            recognitions = recognize_fuzzy(
+                tokens,
+                self.fuzzy_index,
+                stop_words=self.stop_words,
+                word_transform=self.word_transform,
+                extra_converters=self.extra_converters,
+                intent_filter=filter_intent,
+            )
+        else:
             recognitions = rhasspynlu.recognize(
                 tokens,
-                intent_graph,
-                fuzzy=fuzzy,
-                stop_words=stop_words,
-                word_transform=word_transform,
-                extra_converters=extra_converters,
-                intent_filter=intent_filter,
+                self.intent_graph,
+                fuzzy=self.fuzzy,
+                stop_words=self.stop_words,
+                word_transform=self.word_transform,
+                extra_converters=self.extra_converters,
+                intent_filter=filter_intent,
             )
 
-            if recognitions:
-                # Use first recognition
-                recognition = recognitions[0]
-            else:
-                # Recognition failure
-                recognition = rhasspynlu.intent.Recognition.empty()
+        if recognitions:
+            # Use first recognition
+            return recognitions[0]
 
-            result = dataclasses.asdict(recognition)
+        # Recognition failure
+        return rhasspynlu.intent.Recognition.empty()
 
-            # Add slots
-            result["slots"] = {e.entity: e.value for e in recognition.entities}
+    def converter_statistics(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Get call counts and timing for external converters that were used."""
+        return {
+            name: converter.statistics()
+            for name, converter in (self.extra_converters or {}).items()
+            if isinstance(converter, CommandLineConverter) and (converter.calls > 0)
+        }
 
-            # Merge with input object
-            for key, value in result.items():
-                if (key not in sentence_object) or (value is not None):
-                    sentence_object[key] = value
+    def cache_statistics(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """Get recognition cache hit/miss counts (None if not caching)."""
+        if self.cache is None:
+            return None
 
-            if not sentence_object["text"]:
-                sentence_object["text"] = text
+        return self.cache.statistics()
 
-            # Keep text from transcription
-            sentence_object["raw_text"] = text
+    def stop(self):
+        """Stop recognizer and any running converters."""
+        for name, stats in self.converter_statistics().items():
+            _LOGGER.debug("Converter %s: %s", name, stats)
 
-            if args.perplexity:
-                # Compute perplexity of input text for one or more language
-                # models (stored in FST binary format).
-                perplexity = {}
-                for lm_fst_path in args.perplexity:
-                    try:
-                        perplexity[lm_fst_path] = rhasspynlu.arpa_lm.get_perplexity(
-                            text, lm_fst_path, debug=args.debug
-                        )
-                    except Exception:
-                        _LOGGER.exception(lm_fst_path)
+        if self.cache is not None:
+            _LOGGER.debug("Recognition cache: %s", self.cache.statistics())
 
-                sentence_object["perplexity"] = perplexity
+        for converter in (self.extra_converters or {}).values():
+            if isinstance(converter, CommandLineConverter):
+                converter.stop()
 
-            print_json(sentence_object)
-    except KeyboardInterrupt:
-        pass
+
+class RecognitionCache:
+    """In-memory cache of recognitions with least-recently-used eviction.
+
+    Keys are built by IntentRecognizer from the intent graph version, the
+    sentence tokens, and the intent filter. Recognitions are stored pickled,
+    so each caller gets its own copy to modify (unpickling is several times
+    faster than copy.deepcopy).
+    """
+
+    def __init__(self, max_size: int = 1024):
+        assert max_size > 0, "Cache size must be positive"
+        self.max_size = max_size
+
+        # key -> pickled recognition (least recently used first)
+        self.recognitions: "collections.OrderedDict[typing.Any, bytes]" = (
+            collections.OrderedDict()
+        )
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+        # Recognizer may be shared between threads (serve)
+        self.lock = threading.Lock()
+
+    def get(self, key: typing.Hashable):
+        """Get copy of cached recognition and mark it as recently used."""
+        with self.lock:
+            recognition_bytes = self.recognitions.get(key)
+            if recognition_bytes is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.recognitions.move_to_end(key)
+
+        return pickle.loads(recognition_bytes)
+
+    def put(self, key: typing.Hashable, recognition):
+        """Store copy of recognition, evicting least-recently-used entries if full."""
+        recognition_bytes = pickle.dumps(recognition, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.recognitions[key] = recognition_bytes
+            self.recognitions.move_to_end(key)
+
+            while len(self.recognitions) > self.max_size:
+                self.recognitions.popitem(last=False)
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """Get hit/miss counts."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups > 0 else 0.0,
+            "size": len(self.recognitions),
+            "max_size": self.max_size,
+        }
+
+
+def load_stop_words(
+    stop_words_path: typing.Optional[Path],
+) -> typing.Optional[typing.Set[str]]:
+    """Load stop words (one per line) if file exists."""
+    if not (stop_words_path and stop_words_path.is_file()):
+        return None
+
+    stop_words: typing.Set[str] = set()
+    with open(stop_words_path, "r") as stop_words_file:
+        for line in stop_words_file:
+            line = line.strip()
+            if line:
+                stop_words.add(line)
+
+    return stop_words
 
 
 # -----------------------------------------------------------------------------
@@ -170,8 +533,13 @@ class CommandLineConverter:
         self.name = name
         self.command_path = Path(command_path)
 
+        # Statistics
+        self.calls = 0
+        self.total_seconds = 0.0
+
     def __call__(self, *args, converter_args=None):
         """Runs external program to convert JSON values"""
+        start_time = time.perf_counter()
         converter_args = converter_args or []
         proc = subprocess.Popen(
             [str(self.command_path)] + converter_args,
@@ -186,15 +554,145 @@ class CommandLineConverter:
 
             stdout, _ = proc.communicate(input=input_file.getvalue())
 
-            return [json.loads(line) for line in stdout.splitlines() if line.strip()]
+        self.calls += 1
+        self.total_seconds += time.perf_counter() - start_time
+
+        return [json.loads(line) for line in stdout.splitlines() if line.strip()]
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """Get call count and timing."""
+        return {
+            "calls": self.calls,
+            "total_seconds": self.total_seconds,
+            "average_seconds": (self.total_seconds / self.calls)
+            if self.calls > 0
+            else 0.0,
+        }
+
+    def stop(self):
+        """Stop converter (nothing to do for one-shot programs)."""
+
+
+class PersistentCommandLineConverter(CommandLineConverter):
+    """Command-line converter that is started once and serves many requests.
+
+    Each request is a single line of JSON on stdin:
+    {"args": [value, ...], "converter_args": [arg, ...]}
+
+    The program must answer with a single line on stdout containing a JSON list
+    of converted values. It is restarted if it exits, sends invalid output, or
+    doesn't answer within read_timeout seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        command_path: typing.Union[str, Path],
+        max_attempts: int = 2,
+        read_timeout: typing.Optional[float] = 10.0,
+    ):
+        super().__init__(name, command_path)
+        self.max_attempts = max_attempts
+        self.read_timeout = read_timeout
+        self.proc: typing.Optional[subprocess.Popen] = None
+        self.restarts = 0
+
+        # Requests/responses must not be interleaved
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, converter_args=None):
+        """Send JSON values to running program and read converted values"""
+        start_time = time.perf_counter()
+        request = json.dumps(
+            {"args": list(args), "converter_args": list(converter_args or [])}
+        )
+
+        with self.lock:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    proc = self.start()
+                    assert proc.stdin and proc.stdout
+                    print(request, file=proc.stdin, flush=True)
+
+                    # Don't wait forever on a hung program
+                    ready, _, _ = select.select(
+                        [proc.stdout], [], [], self.read_timeout
+                    )
+                    if not ready:
+                        raise TimeoutError(f"Converter {self.name} timed out")
+
+                    line = proc.stdout.readline()
+                    if not line:
+                        raise EOFError(f"Converter {self.name} exited")
+
+                    values = json.loads(line)
+                    assert isinstance(values, list), "Expected JSON list"
+                    break
+                except (OSError, EOFError, ValueError, AssertionError):
+                    # Program crashed or is out of sync; start a fresh one
+                    _LOGGER.exception(
+                        "%s (attempt %s/%s)", self.name, attempt, self.max_attempts
+                    )
+                    self.stop()
+
+                    if attempt >= self.max_attempts:
+                        raise
+
+                    self.restarts += 1
+
+            self.calls += 1
+            self.total_seconds += time.perf_counter() - start_time
+
+        return values
+
+    def start(self) -> subprocess.Popen:
+        """Start converter program if it isn't already running."""
+        if (self.proc is None) or (self.proc.poll() is not None):
+            _LOGGER.debug("Starting persistent converter %s", self.command_path)
+            self.proc = subprocess.Popen(
+                [str(self.command_path)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            )
+
+        return self.proc
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """Get call count, timing, and number of restarts."""
+        stats = super().statistics()
+        stats["restarts"] = self.restarts
+
+        return stats
+
+    def stop(self):
+        """Terminate converter program."""
+        if self.proc is None:
+            return
+
+        proc = self.proc
+        if proc.poll() is None:
+            try:
+                # Closing stdin asks the program to exit
+                assert proc.stdin
+                proc.stdin.close()
+                proc.wait(timeout=1)
+            except Exception:
+                proc.terminate()
+                proc.wait()
+
+        self.proc = None
 
 
 def load_converters(
-    converters_dir: typing.Union[str, Path]
+    converters_dir: typing.Union[str, Path],
+    persistent: typing.Optional[typing.Collection[str]] = None,
+    persistent_timeout: typing.Optional[float] = 10.0,
 ) -> typing.Dict[str, CommandLineConverter]:
     """Load user-defined converters"""
     converters: typing.Dict[str, CommandLineConverter] = {}
     converters_dir = Path(converters_dir)
+    persistent = set(persistent or [])
 
     if converters_dir.is_dir():
         _LOGGER.debug("Loading converters from %s", converters_dir)
@@ -207,14 +705,25 @@ def load_converters(
                 converter_path.relative_to(converters_dir).with_suffix("")
             )
 
-            # Run converter as external program.
-            # Input arguments are encoded as JSON on individual lines.
-            # Output values should be encoded as JSON on individual lines.
-            converter = CommandLineConverter(converter_name, converter_path)
+            if converter_name in persistent:
+                # Run converter once as a long-lived external program.
+                # Requests and responses are JSON objects on individual lines.
+                converter: CommandLineConverter = PersistentCommandLineConverter(
+                    converter_name, converter_path, read_timeout=persistent_timeout
+                )
+            else:
+                # Run converter as external program.
+                # Input arguments are encoded as JSON on individual lines.
+                # Output values should be encoded as JSON on individual lines.
+                converter = CommandLineConverter(converter_name, converter_path)
 
             # Key off name without file extension
             converters[converter_name] = converter
 
             _LOGGER.debug("Loaded converter %s from %s", converter_name, converter_path)
 
+    missing_converters = persistent - set(converters)
+    if missing_converters:
+        _LOGGER.warning("Missing persistent converter(s): %s", missing_converters)
+
     return converters
@@ -2,8 +2,6 @@
 import argparse
 import asyncio
 import dataclasses
-import gzip
-import itertools
 import logging
 import os
 import re
@@ -12,10 +10,9 @@ import typing
 from pathlib import Path
 
 import aioconsole
-import jsonlines
 
 from .core import Voice2JsonCore
-from .utils import dag_paths_random, itershuffle, print_json
+from .utils import PathSampler, print_json
 
 _LOGGER = logging.getLogger("voice2json.record")
 
@@ -95,7 +92,6 @@ async def record_command(args: argparse.Namespace, core: Voice2JsonCore) -> None
 
 async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Record example voice commands."""
-    import networkx as nx
     import rhasspynlu
 
     # Make sure profile has been trained
@@ -112,15 +108,8 @@ async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> Non
 
     examples_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load settings
-    intent_graph_path = core.ppath(
-        "intent-recognition.intent-graph", "intent.pickle.gz"
-    )
-
     # Load intent graph
-    _LOGGER.debug("Loading %s", intent_graph_path)
-    with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
-        intent_graph = nx.readwrite.gpickle.read_gpickle(graph_gzip)
+    intent_graph = core.load_intent_graph()
 
     start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(intent_graph)
     assert (start_node is not None) and (
@@ -128,9 +117,7 @@ async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> Non
     ), "Missing start/end node(s)"
 
     # Iterable that yields random paths through the graph forever
-    random_paths = itertools.cycle(
-        itershuffle(dag_paths_random(intent_graph, start_node, end_node))
-    )
+    random_paths = PathSampler(intent_graph, start_node, end_node).sample_forever()
 
     def generate_intent() -> typing.Dict[str, typing.Any]:
         # Generate sample intent
@@ -204,9 +191,7 @@ async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> Non
             # Save intent
             intent_path = examples_dir / f"{wav_path.stem}.json"
             with open(intent_path, "w") as intent_file:
-                with jsonlines.Writer(intent_file) as out:
-                    # pylint: disable=E1101
-                    out.write(random_intent)
+                print_json(random_intent, out_file=intent_file)
 
             # Response
             print("Wrote", wav_path)
@@ -0,0 +1,388 @@
+"""Long-running daemon that answers requests with a warm profile."""
+import argparse
+import asyncio
+import base64
+import dataclasses
+import json
+import logging
+import os
+import sys
+import time
+import typing
+from pathlib import Path
+
+import pydash
+from rhasspynlu.g2p import PronunciationsType
+
+from .cache import CachedTranscriber
+from .core import Voice2JsonCore
+
+_LOGGER = logging.getLogger("voice2json.serve")
+
+# -----------------------------------------------------------------------------
+
+
+@dataclasses.dataclass
+class RequestStatistics:
+    """Count and timing for a single request type."""
+
+    count: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    # stage name -> total seconds
+    stage_seconds: typing.Dict[str, float] = dataclasses.field(default_factory=dict)
+
+    def add(self, seconds: float, stages: typing.Dict[str, float]):
+        """Record a completed request."""
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+        for stage_name, stage_seconds in stages.items():
+            self.stage_seconds[stage_name] = (
+                self.stage_seconds.get(stage_name, 0.0) + stage_seconds
+            )
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """Convert to JSON-friendly dictionary."""
+        result = dataclasses.asdict(self)
+        result["average_seconds"] = (
+            (self.total_seconds / self.count) if self.count > 0 else 0.0
+        )
+
+        return result
+
+
+# -----------------------------------------------------------------------------
+
+
+class Voice2JsonServer:
+    """Keeps profile, intent graph, and transcriber(s) loaded between requests."""
+
+    def __init__(self, core: Voice2JsonCore, debug: bool = False):
+        self.core = core
+        self.debug = debug
+        self.start_time = time.perf_counter()
+
+        # request type -> statistics
+        self.statistics: typing.Dict[str, RequestStatistics] = {}
+
+        # Loaded lazily, but kept for the lifetime of the server.
+        # Keyed by open transcription flag.
+        self.transcribers: typing.Dict[bool, typing.Any] = {}
+        self.recognizer = None
+        self.pronunciations: typing.Optional[PronunciationsType] = None
+
+        # Transcribers/recognizer are not re-entrant
+        self.transcribe_lock = asyncio.Lock()
+        self.recognize_lock = asyncio.Lock()
+        self.pronounce_lock = asyncio.Lock()
+
+        self.handlers: typing.Dict[
+            str,
+            typing.Callable[
+                [typing.Dict[str, typing.Any], typing.Dict[str, float]],
+                typing.Awaitable[typing.Dict[str, typing.Any]],
+            ],
+        ] = {
+            "transcribe-wav": self.handle_transcribe,
+            "recognize-intent": self.handle_recognize,
+            "pronounce-word": self.handle_pronounce,
+            "statistics": self.handle_statistics,
+        }
+
+    # -------------------------------------------------------------------------
+
+    async def warm(self, open_transcription: bool = False):
+        """Load recognizer and transcriber ahead of the first request."""
+        start_time = time.perf_counter()
+        self.get_recognizer()
+
+        # Decode a short burst of silence to force the decoder to load
+        silence_wav = self.core.buffer_to_wav(bytes(3200))
+        transcriber = self.get_transcriber(open_transcription)
+        if isinstance(transcriber, CachedTranscriber):
+            # Silence may already be cached
+            transcriber = transcriber.transcriber
+
+        await asyncio.get_running_loop().run_in_executor(
+            None, transcriber.transcribe_wav, silence_wav
+        )
+
+        _LOGGER.debug("Warmed up in %s second(s)", time.perf_counter() - start_time)
+
+    def get_transcriber(self, open_transcription: bool):
+        """Get cached transcriber for open/closed transcription."""
+        transcriber = self.transcribers.get(open_transcription)
+        if transcriber is None:
+            transcriber = self.core.get_transcriber(
+                open_transcription=open_transcription, debug=self.debug
+            )
+            self.transcribers[open_transcription] = transcriber
+
+        return transcriber
+
+    def get_recognizer(self):
+        """Get cached intent recognizer."""
+        if self.recognizer is None:
+            self.recognizer = self.core.get_recognizer()
+
+        return self.recognizer
+
+    def stop(self):
+        """Stop transcriber(s) and recognizer."""
+        for transcriber in self.transcribers.values():
+            transcriber.stop()
+
+        self.transcribers.clear()
+
+        if self.recognizer is not None:
+            self.recognizer.stop()
+            self.recognizer = None
+
+    # -------------------------------------------------------------------------
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Answer JSON requests (one per line) until client disconnects."""
+        try:
+            line = await reader.readline()
+            while line:
+                line = line.strip()
+                if line:
+                    response = await self.handle_request(line)
+                    writer.write(json.dumps(response, ensure_ascii=False).encode())
+                    writer.write(b"\n")
+                    await writer.drain()
+
+                line = await reader.readline()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line: bytes) -> typing.Dict[str, typing.Any]:
+        """Dispatch a single JSON request and time it."""
+        request_type = ""
+        request: typing.Dict[str, typing.Any] = {}
+        start_time = time.perf_counter()
+
+        try:
+            request_object = json.loads(line)
+            if not isinstance(request_object, dict):
+                raise ValueError("Request must be a JSON object")
+
+            request = request_object
+            request_type = str(request.get("type", ""))
+            handler = self.handlers.get(request_type)
+            if handler is None:
+                raise ValueError(f"Unknown request type: {request_type}")
+
+            stages: typing.Dict[str, float] = {}
+            response = await handler(request, stages)
+
+            end_time = time.perf_counter()
+            self.statistics.setdefault(request_type, RequestStatistics()).add(
+                end_time - start_time, stages
+            )
+        except Exception as e:
+            _LOGGER.exception("handle_request")
+            self.statistics.setdefault(
+                request_type or "unknown", RequestStatistics()
+            ).errors += 1
+            response = {"error": str(e)}
+
+        if "id" in request:
+            # Echo request id back to client
+            response["id"] = request["id"]
+
+        return response
+
+    # -------------------------------------------------------------------------
+
+    async def handle_transcribe(
+        self, request: typing.Dict[str, typing.Any], stages: typing.Dict[str, float]
+    ) -> typing.Dict[str, typing.Any]:
+        """Transcribe WAV from a file path or base64-encoded data."""
+        from rhasspyasr import Transcription
+
+        wav_path: typing.Optional[Path] = None
+        if "wav_path" in request:
+            wav_path = Path(request["wav_path"])
+            wav_data = wav_path.read_bytes()
+        else:
+            wav_data = base64.b64decode(request["wav_base64"])
+
+        start_time = time.perf_counter()
+        wav_data = await self.core.maybe_convert_wav(wav_data)
+        stages["convert_seconds"] = time.perf_counter() - start_time
+
+        transcriber = self.get_transcriber(bool(request.get("open", False)))
+
+        start_time = time.perf_counter()
+        async with self.transcribe_lock:
+            transcription = await asyncio.get_running_loop().run_in_executor(
+                None, transcriber.transcribe_wav, wav_data
+            )
+
+        stages["transcribe_seconds"] = time.perf_counter() - start_time
+
+        result = dataclasses.asdict(transcription or Transcription.empty())
+        if wav_path is not None:
+            result["wav_name"] = wav_path.name
+
+        return result
+
+    async def handle_recognize(
+        self, request: typing.Dict[str, typing.Any], stages: typing.Dict[str, float]
+    ) -> typing.Dict[str, typing.Any]:
+        """Recognize intent from text."""
+        from .recognize import merge_recognition
+
+        text = str(request.get("text", "")).strip()
+
+        intent_filter: typing.Optional[typing.Set[str]] = None
+        if request.get("intent_filter"):
+            intent_filter = set(request["intent_filter"])
+
+        recognizer = self.get_recognizer()
+
+        start_time = time.perf_counter()
+        async with self.recognize_lock:
+            recognition = await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: recognizer.recognize(
+                    text,
+                    intent_filter=intent_filter,
+                    replace_numbers=bool(request.get("replace_numbers", False)),
+                ),
+            )
+
+        stages["recognize_seconds"] = time.perf_counter() - start_time
+
+        return merge_recognition({"text": text}, recognition, text)
+
+    async def handle_pronounce(
+        self, request: typing.Dict[str, typing.Any], stages: typing.Dict[str, float]
+    ) -> typing.Dict[str, typing.Any]:
+        """Look up or guess pronunciations for a word."""
+        import rhasspynlu
+
+        from .pronounce import load_profile_pronunciations
+
+        word = str(request["word"]).strip()
+        word_casing = pydash.get(
+            self.core.profile, "training.word-casing", "ignore"
+        ).lower()
+        if word_casing == "upper":
+            word = word.upper()
+        elif word_casing == "lower":
+            word = word.lower()
+
+        g2p_path = self.core.ppath("training.g2p-model", "g2p.fst")
+        num_guesses = int(request.get("nbest", 5))
+        loop = asyncio.get_running_loop()
+
+        def pronounce() -> typing.Tuple[typing.List[str], bool]:
+            """Look up word in dictionary or guess with phonetisaurus."""
+            assert self.pronunciations is not None
+            phonemes = [" ".join(p) for p in self.pronunciations.get(word, [])]
+            if phonemes or (not g2p_path) or (not g2p_path.exists()):
+                return phonemes, False
+
+            guesses = rhasspynlu.g2p.guess_pronunciations(
+                [word], g2p_path, num_guesses=num_guesses
+            )
+            return [" ".join(guess_phonemes) for _, guess_phonemes in guesses], True
+
+        # Dictionary index and phonetisaurus block
+        async with self.pronounce_lock:
+            if self.pronunciations is None:
+                start_time = time.perf_counter()
+                self.pronunciations, _ = await loop.run_in_executor(
+                    None, load_profile_pronunciations, self.core
+                )
+                stages["load_seconds"] = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            phonemes, guessed = await loop.run_in_executor(None, pronounce)
+
+        stages["pronounce_seconds"] = time.perf_counter() - start_time
+
+        return {"word": word, "pronunciations": phonemes, "guessed": guessed}
+
+    async def handle_statistics(
+        self, request: typing.Dict[str, typing.Any], stages: typing.Dict[str, float]
+    ) -> typing.Dict[str, typing.Any]:
+        """Report request counts and per-stage timing."""
+        converters: typing.Dict[str, typing.Any] = {}
+        recognition_cache: typing.Optional[typing.Dict[str, typing.Any]] = None
+        if self.recognizer is not None:
+            converters = self.recognizer.converter_statistics()
+            recognition_cache = self.recognizer.cache_statistics()
+
+        transcription_cache = {
+            ("open" if open_transcription else "closed"): transcriber.statistics()
+            for open_transcription, transcriber in self.transcribers.items()
+            if isinstance(transcriber, CachedTranscriber)
+        }
+
+        return {
+            "uptime_seconds": time.perf_counter() - self.start_time,
+            "requests": {
+                request_type: request_stats.to_dict()
+                for request_type, request_stats in self.statistics.items()
+            },
+            "converters": converters,
+            "transcription_cache": transcription_cache,
+            "recognition_cache": recognition_cache,
+            "conversion": self.core.convert_statistics,
+        }
+
+
+# -----------------------------------------------------------------------------
+
+
+async def serve(args: argparse.Namespace, core: Voice2JsonCore) -> None:
+    """Run daemon that answers requests over a local socket."""
+    # Make sure profile has been trained
+    assert core.check_trained(), "Not trained"
+
+    server = Voice2JsonServer(core, debug=args.debug)
+
+    if not args.no_warm:
+        await server.warm(open_transcription=args.open)
+
+    if args.port is not None:
+        # TCP socket
+        socket_server = await asyncio.start_server(
+            server.handle_client, host=args.host, port=args.port
+        )
+        _LOGGER.debug("Listening on %s:%s", args.host, args.port)
+    else:
+        # Unix domain socket
+        socket_path = Path(args.socket or (core.profile_dir / "voice2json.sock"))
+        if socket_path.exists():
+            socket_path.unlink()
+
+        socket_server = await asyncio.start_unix_server(
+            server.handle_client, path=str(socket_path)
+        )
+        _LOGGER.debug("Listening on %s", socket_path)
+
+    print("Ready", file=sys.stderr)
+
+    try:
+        async with socket_server:
+            await socket_server.serve_forever()
+    finally:
+        server.stop()
+
+        if args.port is None:
+            try:
+                os.unlink(str(socket_path))
+            except OSError:
+                pass
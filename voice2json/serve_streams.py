@@ -0,0 +1,373 @@
+"""Daemon that transcribes many live audio streams with a shared pool of decoders."""
+import argparse
+import asyncio
+import concurrent.futures
+import dataclasses
+import logging
+import os
+import queue
+import sys
+import time
+import typing
+from pathlib import Path
+
+from .core import Voice2JsonCore
+from .utils import json_dumps, print_json
+
+_LOGGER = logging.getLogger("voice2json.serve_streams")
+
+# -----------------------------------------------------------------------------
+
+
+@dataclasses.dataclass
+class StreamStatistics:
+    """Voice command count and latency for a single audio stream."""
+
+    voice_commands: int = 0
+    timeouts: int = 0
+    total_latency_seconds: float = 0.0
+    max_latency_seconds: float = 0.0
+    total_wait_seconds: float = 0.0
+
+    def add(self, latency_seconds: float, wait_seconds: float, is_timeout: bool):
+        """Record a transcribed voice command."""
+        self.voice_commands += 1
+        if is_timeout:
+            self.timeouts += 1
+
+        self.total_latency_seconds += latency_seconds
+        self.max_latency_seconds = max(self.max_latency_seconds, latency_seconds)
+        self.total_wait_seconds += wait_seconds
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """Convert to JSON-friendly dictionary."""
+        result = dataclasses.asdict(self)
+        result["average_latency_seconds"] = (
+            (self.total_latency_seconds / self.voice_commands)
+            if self.voice_commands > 0
+            else 0.0
+        )
+
+        return result
+
+
+# -----------------------------------------------------------------------------
+
+
+class StreamServer:
+    """Runs voice activity detection per stream and shares decoders between streams.
+
+    A decoder is only taken from the pool once speech has started in a stream.
+    Audio is buffered until a decoder is free, then sent to it as it arrives.
+    """
+
+    def __init__(
+        self,
+        core: Voice2JsonCore,
+        num_decoders: int = 2,
+        open_transcription=False,
+        chunk_size: int = 1024,
+    ):
+        assert num_decoders > 0, "Need at least one decoder"
+
+        self.core = core
+        self.num_decoders = num_decoders
+        self.chunk_size = chunk_size
+        self.start_time = time.perf_counter()
+
+        # Audio settings
+        self.sample_rate = core.settings.audio.sample_rate
+        self.sample_width = core.settings.audio.sample_width
+        self.channels = core.settings.audio.channels
+
+        # Each decoder is only used by one voice command at a time
+        self.transcribers = [
+            core.get_transcriber(open_transcription=open_transcription)
+            for _ in range(num_decoders)
+        ]
+        self.idle_transcribers: "asyncio.Queue[typing.Any]" = asyncio.Queue()
+        for transcriber in self.transcribers:
+            self.idle_transcribers.put_nowait(transcriber)
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_decoders)
+
+        # Statistics
+        self.decoder_busy_seconds = 0.0
+        self.num_streams = 0
+        self.waiting_commands = 0
+
+        # stream id -> statistics (connected streams only)
+        self.stream_stats: typing.Dict[str, StreamStatistics] = {}
+        self.total_stats = StreamStatistics()
+
+    def start_decoders(self):
+        """Load decoders ahead of the first voice command (if supported)."""
+        for transcriber in self.transcribers:
+            start_decoder = getattr(transcriber, "start_decoder", None)
+            if start_decoder is not None:
+                start_decoder()
+
+    def stop(self):
+        """Stop all decoders."""
+        self.executor.shutdown(wait=False)
+        for transcriber in self.transcribers:
+            transcriber.stop()
+
+    # -------------------------------------------------------------------------
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Transcribe voice commands from one raw audio stream until it closes.
+
+        The first line sent by the client is the stream id (empty for automatic).
+        """
+        from rhasspysilence import VoiceCommandEventType, VoiceCommandResult
+
+        self.num_streams += 1
+        stream_id = (await reader.readline()).decode().strip() or str(self.num_streams)
+
+        if stream_id in self.stream_stats:
+            # Keep ids unique among connected streams
+            stream_id = f"{stream_id}-{self.num_streams}"
+
+        self.stream_stats[stream_id] = StreamStatistics()
+        _LOGGER.debug("Stream %s connected", stream_id)
+
+        recorder = self.core.get_command_recorder()
+        recorder.start()
+
+        # Audio for the decoder of the current voice command, followed by
+        # (is_timeout, end_time).
+        command_queue: "typing.Optional[queue.Queue[typing.Any]]" = None
+        command_bytes = 0
+        decode_tasks: typing.Set[asyncio.Future] = set()
+
+        try:
+            chunk = await reader.read(self.chunk_size)
+            while chunk:
+                voice_command = recorder.process_chunk(chunk)
+
+                if (command_queue is None) and any(
+                    event.type == VoiceCommandEventType.STARTED
+                    for event in recorder.events
+                ):
+                    # Speech started; include audio from just before
+                    command_queue = queue.Queue()
+                    for before_chunk in recorder.before_phrase_chunks:
+                        command_queue.put(before_chunk)
+
+                    command_bytes = 0
+                    decode_task = asyncio.ensure_future(
+                        self.transcribe_command(stream_id, command_queue, writer)
+                    )
+                    decode_tasks.add(decode_task)
+                    decode_task.add_done_callback(decode_tasks.discard)
+
+                if command_queue is not None:
+                    # Send new audio from voice command
+                    phrase_buffer = recorder.phrase_buffer
+                    if len(phrase_buffer) > command_bytes:
+                        command_queue.put(phrase_buffer[command_bytes:])
+                        command_bytes = len(phrase_buffer)
+
+                if voice_command:
+                    if command_queue is not None:
+                        # End of voice command
+                        command_queue.put(
+                            (
+                                voice_command.result == VoiceCommandResult.FAILURE,
+                                time.perf_counter(),
+                            )
+                        )
+                        command_queue = None
+
+                    # Timeouts without speech are ignored
+                    recorder.stop()
+                    recorder.start()
+
+                chunk = await reader.read(self.chunk_size)
+
+            if command_queue is not None:
+                # Stream closed during voice command
+                command_queue.put((False, time.perf_counter()))
+                command_queue = None
+
+            if decode_tasks:
+                await asyncio.wait(decode_tasks)
+        except ConnectionError:
+            pass
+        finally:
+            if command_queue is not None:
+                command_queue.put((False, time.perf_counter()))
+
+            _LOGGER.debug("Stream %s disconnected", stream_id)
+            self.stream_stats.pop(stream_id, None)
+            writer.close()
+
+    async def transcribe_command(
+        self,
+        stream_id: str,
+        command_queue: "queue.Queue[typing.Any]",
+        writer: asyncio.StreamWriter,
+    ):
+        """Transcribe a single voice command with the next free decoder."""
+        from rhasspyasr import Transcription
+
+        # Set when the end of the voice command is read: (is_timeout, end_time)
+        command_end: typing.List[typing.Tuple[bool, float]] = []
+
+        def audio_stream() -> typing.Iterable[bytes]:
+            item = command_queue.get()
+            while isinstance(item, bytes):
+                yield item
+                item = command_queue.get()
+
+            command_end.append(item)
+
+        wait_start_time = time.perf_counter()
+        self.waiting_commands += 1
+        try:
+            transcriber = await self.idle_transcribers.get()
+        finally:
+            self.waiting_commands -= 1
+
+        decode_start_time = time.perf_counter()
+        wait_seconds = decode_start_time - wait_start_time
+
+        try:
+            transcription = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                transcriber.transcribe_stream,
+                audio_stream(),
+                self.sample_rate,
+                self.sample_width,
+                self.channels,
+            )
+        except Exception:
+            _LOGGER.exception("transcribe_command (stream=%s)", stream_id)
+            transcription = None
+        finally:
+            self.decoder_busy_seconds += time.perf_counter() - decode_start_time
+            self.idle_transcribers.put_nowait(transcriber)
+
+        if not command_end:
+            # Skip audio the transcriber didn't read
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: list(audio_stream())
+            )
+
+        is_timeout, end_time = command_end[0]
+        latency_seconds = time.perf_counter() - end_time
+
+        result = dataclasses.asdict(transcription or Transcription.empty())
+        result["timeout"] = is_timeout
+        result["stream_id"] = stream_id
+        result["latency_seconds"] = latency_seconds
+        result["wait_seconds"] = wait_seconds
+
+        for stats in [self.stream_stats.get(stream_id), self.total_stats]:
+            if stats is not None:
+                stats.add(latency_seconds, wait_seconds, is_timeout)
+
+        print_json(result)
+
+        try:
+            writer.write(json_dumps(result).encode() + b"\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    # -------------------------------------------------------------------------
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """Get decoder utilization and per-stream latency."""
+        uptime_seconds = time.perf_counter() - self.start_time
+        return {
+            "uptime_seconds": uptime_seconds,
+            "decoders": self.num_decoders,
+            "idle_decoders": self.idle_transcribers.qsize(),
+            "decoder_utilization": (
+                self.decoder_busy_seconds / (self.num_decoders * uptime_seconds)
+            )
+            if uptime_seconds > 0
+            else 0.0,
+            "waiting_voice_commands": self.waiting_commands,
+            "total_streams": self.num_streams,
+            "total": self.total_stats.to_dict(),
+            "streams": {
+                stream_id: stream_stats.to_dict()
+                for stream_id, stream_stats in self.stream_stats.items()
+            },
+        }
+
+    async def write_statistics(self, out_file: typing.TextIO, interval: float):
+        """Write statistics to a file every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            print_json(self.statistics(), out_file=out_file)
+
+
+# -----------------------------------------------------------------------------
+
+
+async def serve_streams(args: argparse.Namespace, core: Voice2JsonCore) -> None:
+    """Run daemon that transcribes raw audio streams from many clients."""
+    # Make sure profile has been trained
+    assert core.check_trained(), "Not trained"
+
+    server = StreamServer(
+        core,
+        num_decoders=args.decoders,
+        open_transcription=args.open,
+        chunk_size=args.chunk_size,
+    )
+    server.start_decoders()
+
+    metrics_task: typing.Optional[asyncio.Future] = None
+    if args.metrics_sink:
+        if args.metrics_sink == "-":
+            metrics_sink = sys.stdout
+        else:
+            metrics_sink = open(args.metrics_sink, "w")
+
+        metrics_task = asyncio.ensure_future(
+            server.write_statistics(metrics_sink, args.metrics_interval)
+        )
+
+    if args.port is not None:
+        # TCP socket
+        socket_server = await asyncio.start_server(
+            server.handle_client, host=args.host, port=args.port
+        )
+        _LOGGER.debug("Listening on %s:%s", args.host, args.port)
+    else:
+        # Unix domain socket
+        socket_path = Path(
+            args.socket or (core.profile_dir / "voice2json-streams.sock")
+        )
+        if socket_path.exists():
+            socket_path.unlink()
+
+        socket_server = await asyncio.start_unix_server(
+            server.handle_client, path=str(socket_path)
+        )
+        _LOGGER.debug("Listening on %s", socket_path)
+
+    print("Ready", file=sys.stderr)
+
+    try:
+        async with socket_server:
+            await socket_server.serve_forever()
+    finally:
+        if metrics_task is not None:
+            metrics_task.cancel()
+
+        _LOGGER.debug("Statistics: %s", server.statistics())
+        server.stop()
+
+        if args.port is None:
+            try:
+                os.unlink(str(socket_path))
+            except OSError:
+                pass
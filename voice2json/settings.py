@@ -0,0 +1,157 @@
+"""Typed views of profile settings that are read once instead of on every use."""
+import typing
+from pathlib import Path
+
+import pydash
+
+from .utils import ppath
+
+# -----------------------------------------------------------------------------
+
+
+class AudioSettings:
+    """Expected audio format and audio commands (audio.*)."""
+
+    __slots__ = (
+        "sample_rate",
+        "sample_width",
+        "channels",
+        "builtin_convert",
+        "convert_command",
+        "record_command",
+        "play_command",
+    )
+
+    def __init__(self, profile: typing.Dict[str, typing.Any]):
+        audio = profile.get("audio") or {}
+
+        self.sample_rate = int(pydash.get(audio, "format.sample-rate-hertz", 16000))
+
+        # bytes per sample
+        self.sample_width = int(pydash.get(audio, "format.sample-width-bits", 16)) // 8
+        self.channels = int(pydash.get(audio, "format.channel-count", 1))
+
+        self.builtin_convert = bool(audio.get("builtin-convert", True))
+        self.convert_command: str = audio.get(
+            "convert-command",
+            "sox -t wav - -r 16000 -e signed-integer -b 16 -c 1 -t wav -",
+        )
+        self.record_command: str = audio.get(
+            "record-command", "arecord -q -r 16000 -c 1 -f S16_LE -t raw"
+        )
+        self.play_command: typing.Optional[str] = audio.get("play-command")
+
+    @property
+    def bytes_per_second(self) -> int:
+        """Bytes in one second of raw audio."""
+        return self.sample_rate * self.sample_width * self.channels
+
+
+class VoiceCommandSettings:
+    """Voice activity detection settings (voice-command.*)."""
+
+    __slots__ = (
+        "vad_mode",
+        "min_seconds",
+        "max_seconds",
+        "speech_seconds",
+        "silence_seconds",
+        "before_seconds",
+        "skip_seconds",
+        "chunk_size",
+    )
+
+    def __init__(self, profile: typing.Dict[str, typing.Any]):
+        voice_command = profile.get("voice-command") or {}
+
+        self.vad_mode = int(voice_command.get("vad-mode", 3))
+        self.min_seconds = float(voice_command.get("minimum-seconds", 1))
+        self.max_seconds = float(voice_command.get("maximum-seconds", 30))
+        self.speech_seconds = float(voice_command.get("speech-seconds", 0.3))
+        self.silence_seconds = float(voice_command.get("silence-seconds", 0.5))
+        self.before_seconds = float(voice_command.get("before-seconds", 0.5))
+        self.skip_seconds = float(voice_command.get("skip-seconds", 0))
+        self.chunk_size = int(voice_command.get("chunk-size", 960))
+
+
+class TrainingPaths:
+    """Input and output paths for train-profile (training.*)."""
+
+    __slots__ = (
+        "sentences_ini",
+        "slots_dir",
+        "slot_programs",
+        "base_dictionary",
+        "base_dictionary_index",
+        "custom_words",
+        "sounds_like",
+        "acoustic_model",
+        "base_language_model_fst",
+        "g2p_model",
+        "g2p_corpus",
+        "dictionary",
+        "language_model",
+        "language_model_fst",
+        "mixed_language_model_fst",
+        "intent_graph",
+        "compact_intent_graph",
+        "fuzzy_index",
+        "vocab",
+        "unknown_words",
+        "cache_file",
+    )
+
+    def __init__(self, profile: typing.Dict[str, typing.Any], profile_dir: Path):
+        def path(query: str, default: str) -> Path:
+            result = ppath(profile, profile_dir, query, default)
+            assert result is not None
+            return result
+
+        self.sentences_ini = path("training.sentences-file", "sentences.ini")
+        self.slots_dir = path("training.slots-directory", "slots")
+        self.slot_programs = path("training.slot-programs-directory", "slot_programs")
+
+        self.base_dictionary = path("training.base-dictionary", "base_dictionary.txt")
+        self.base_dictionary_index = path(
+            "training.base-dictionary-index", "base_dictionary.db"
+        )
+        self.custom_words = path("training.custom-words-file", "custom_words.txt")
+        self.sounds_like = path("training.sounds-like-file", "sounds_like.txt")
+        self.acoustic_model = path("training.acoustic-model", "acoustic_model")
+        self.base_language_model_fst = path(
+            "training.base-language-model-fst", "base_language_model.fst"
+        )
+        self.g2p_model = path("training.grapheme-to-phoneme-model", "g2p.fst")
+        self.g2p_corpus = path("training.grapheme-to-phoneme-corpus", "g2p.corpus")
+
+        # Outputs
+        self.dictionary = path("training.dictionary", "dictionary.txt")
+        self.language_model = path("training.language-model", "language_model.txt")
+        self.language_model_fst = path(
+            "training.language-model-fst", "language_model.fst"
+        )
+        self.mixed_language_model_fst = path(
+            "training.mixed-language-model-fst", "mixed_language_model.fst"
+        )
+        self.intent_graph = path("training.intent-graph", "intent.pickle.gz")
+        self.compact_intent_graph = path(
+            "intent-recognition.compact-intent-graph", "intent.graph"
+        )
+        self.fuzzy_index = path("intent-recognition.fuzzy-index", "intent.index")
+        self.vocab = path("training.vocabulary-file", "vocab.txt")
+        self.unknown_words = path("training.unknown-words-file", "unknown_words.txt")
+        self.cache_file = path("training.cache-file", "training_cache.json")
+
+
+# -----------------------------------------------------------------------------
+
+
+class ProfileSettings:
+    """Settings used per utterance/WAV, resolved once per profile."""
+
+    __slots__ = ("audio", "voice_command", "training")
+
+    def __init__(self, profile: typing.Dict[str, typing.Any], profile_dir: Path):
+        self.audio = AudioSettings(profile)
+        self.voice_command = VoiceCommandSettings(profile)
+        self.training = TrainingPaths(profile, profile_dir)
@@ -32,7 +32,7 @@ async def speak_espeak(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Speak one or more sentences using eSpeak."""
     voice = pydash.get(core.profile, "text-to-speech.espeak.voice")
     espeak_cmd_format = pydash.get(core.profile, "text-to-speech.espeak.speak-command")
-    play_command = shlex.split(pydash.get(core.profile, "audio.play-command"))
+    play_command = shlex.split(core.settings.audio.play_command)
 
     # Process sentence(s)
     if len(args.sentence) > 0:
@@ -83,7 +83,7 @@ async def speak_marytts(
     args: argparse.Namespace, core: Voice2JsonCore, marytts_voice: str
 ) -> None:
     """Speak one or more sentences using MaryTTS."""
-    play_command = shlex.split(pydash.get(core.profile, "audio.play-command"))
+    play_command = shlex.split(core.settings.audio.play_command)
 
     marytts_locale = pydash.get(
         core.profile,
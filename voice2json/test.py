@@ -4,14 +4,15 @@ import asyncio
 import dataclasses
 import json
 import logging
-import shlex
-import shutil
-import tempfile
+import multiprocessing
+import multiprocessing.util
 import typing
 from pathlib import Path
 
+import pydash
+
 from .core import Voice2JsonCore
-from .utils import print_json
+from .utils import map_ordered, print_json
 
 _LOGGER = logging.getLogger("voice2json.test")
 
@@ -66,99 +67,31 @@ async def test_examples(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         _LOGGER.fatal("No expected examples provided")
         return
 
-    temp_dir = None
-    try:
-        if not args.actual:
-            # Generate actual results from examples directory
-            assert args.directory, "Examples directory required if no --expected"
-            examples_dir = Path(args.directory)
-            _LOGGER.debug("Generating actual intents from %s", examples_dir)
-
-            # Use voice2json and GNU parallel
-            assert shutil.which("parallel"), "GNU parallel is required"
-            if args.results:
-                # Save results to user-specified directory
-                results_dir = Path(args.results)
-                results_dir.mkdir(parents=True, exist_ok=True)
-                _LOGGER.debug("Saving results to %s", results_dir)
-            else:
-                # Save resuls to temporary directory
-                temp_dir = tempfile.TemporaryDirectory()
-                results_dir = Path(temp_dir.name)
-                _LOGGER.debug(
-                    "Saving results to temporary directory (use --results to specify)"
-                )
-
-            # Transcribe WAV files
-            actual_wavs_path = results_dir / "actual_wavs.txt"
-            actual_transcriptions_path = results_dir / "actual_transcriptions.jsonl"
-
-            # Write list of WAV files to a text file
-            with open(actual_wavs_path, "w") as actual_wavs_file:
-                for wav_path in examples_dir.glob("*.wav"):
-                    print(str(wav_path.absolute()), file=actual_wavs_file)
-
-            # Transcribe in parallel
-            transcribe_args = ["--stdin-files"]
-            if args.open:
-                transcribe_args.append("--open")
-
-            transcribe_command = (
-                [
-                    "parallel",
-                    "-k",
-                    "--pipe",
-                    "-n",
-                    str(args.threads),
-                    "voice2json",
-                    "-p",
-                    shlex.quote(str(core.profile_file)),
-                    "transcribe-wav",
-                ]
-                + transcribe_args
-                + ["<", str(actual_wavs_path), ">", str(actual_transcriptions_path)]
-            )
-
-            _LOGGER.debug(transcribe_command)
-
-            transcribe_process = await asyncio.create_subprocess_shell(
-                " ".join(transcribe_command)
-            )
-
-            await transcribe_process.wait()
-            assert transcribe_process.returncode == 0, "Transcription failed"
-
-            # Recognize intents from transcriptions in parallel
-            actual_intents_path = results_dir / "actual_intents.jsonl"
-            recognize_command = [
-                "parallel",
-                "-k",
-                "--pipe",
-                "-n",
-                str(args.threads),
-                "voice2json",
-                "-p",
-                shlex.quote(str(core.profile_file)),
-                "recognize-intent",
-                "<",
-                str(actual_transcriptions_path),
-                ">",
-                str(actual_intents_path),
-            ]
-
-            _LOGGER.debug(recognize_command)
-
-            recognize_process = await asyncio.create_subprocess_shell(
-                " ".join(recognize_command)
-            )
-
-            await recognize_process.wait()
-            assert recognize_process.returncode == 0, "Recognition failed"
+    if not args.actual:
+        # Generate actual results from examples directory
+        assert args.directory, "Examples directory required if no --expected"
+        examples_dir = Path(args.directory)
+        _LOGGER.debug("Generating actual intents from %s", examples_dir)
 
-            # Load actual intents
-            args.actual = actual_intents_path
+        results_dir: typing.Optional[Path] = None
+        if args.results:
+            # Save results to user-specified directory
+            results_dir = Path(args.results)
+            results_dir.mkdir(parents=True, exist_ok=True)
+            _LOGGER.debug("Saving results to %s", results_dir)
 
-        assert args.actual, "No actual intents to load"
+        wav_paths = list(examples_dir.glob("*.wav"))
+        async for wav_path, _wav_transcription, intent in test_wavs(
+            wav_paths,
+            core,
+            num_workers=args.threads,
+            open_transcription=args.open,
+            debug=args.debug,
+            results_dir=results_dir,
+        ):
+            actual_intent = Recognition.from_dict(intent)
+            actual[wav_path.name] = actual_intent
+    else:
         _LOGGER.debug("Loading actual intents from %s", args.actual)
 
         # Load actual results from jsonl file
@@ -168,13 +101,198 @@ async def test_examples(args: argparse.Namespace, core: Voice2JsonCore) -> None:
                 assert actual_intent.wav_name, f"No wav_name for {line}"
                 actual[actual_intent.wav_name] = actual_intent
 
-        if not actual:
-            _LOGGER.fatal("No actual examples provided")
-            return
+    if not actual:
+        _LOGGER.fatal("No actual examples provided")
+        return
+
+    report = evaluate_intents(expected, actual)
+    print_json(dataclasses.asdict(report))
+
+
+# -----------------------------------------------------------------------------
+
+
+async def test_wavs(
+    wav_paths: typing.List[Path],
+    core: Voice2JsonCore,
+    num_workers: int = 1,
+    open_transcription: bool = False,
+    debug: bool = False,
+    results_dir: typing.Optional[Path] = None,
+) -> typing.AsyncIterable[
+    typing.Tuple[Path, typing.Dict[str, typing.Any], typing.Dict[str, typing.Any]]
+]:
+    """Transcribe WAV files and recognize intents. Yields results in order."""
+    from .const import AcousticModelType
+
+    transcriptions_file = None
+    intents_file = None
+    if results_dir is not None:
+        transcriptions_file = open(results_dir / "actual_transcriptions.jsonl", "w")
+        intents_file = open(results_dir / "actual_intents.jsonl", "w")
+
+    num_workers = max(1, min(num_workers, len(wav_paths)))
+    _LOGGER.debug(
+        "Testing %s WAV file(s) with %s worker(s)", len(wav_paths), num_workers
+    )
+
+    # Julius can run a pool of decoders in this process instead
+    acoustic_model_type = AcousticModelType(
+        pydash.get(
+            core.profile, "speech-to-text.acoustic-model-type", "pocketsphinx"
+        ).lower()
+    )
+    use_processes = (num_workers > 1) and (
+        acoustic_model_type != AcousticModelType.JULIUS
+    )
+
+    try:
+        if use_processes:
+            # Each worker process loads the transcriber/recognizer once
+            pool = multiprocessing.Pool(
+                num_workers,
+                initializer=_init_worker,
+                initargs=(core.profile_file, core.profile, open_transcription, debug),
+            )
+
+            try:
+                results = pool.imap(_worker_test_wav, wav_paths)
+                for wav_path, (transcription, intent) in zip(wav_paths, results):
+                    _write_results(
+                        transcription, intent, transcriptions_file, intents_file
+                    )
+                    yield (wav_path, transcription, intent)
+            finally:
+                # Let workers exit normally so transcribers are stopped
+                pool.close()
+                pool.join()
+        else:
+            # Test in this process
+            tester = ExampleTester(
+                core,
+                open_transcription=open_transcription,
+                debug=debug,
+                num_workers=num_workers,
+            )
 
-        report = evaluate_intents(expected, actual)
-        print_json(dataclasses.asdict(report))
+            try:
+                async for wav_path, (transcription, intent) in map_ordered(
+                    tester.test_wav, wav_paths, max_pending=tester.num_workers
+                ):
+                    _write_results(
+                        transcription, intent, transcriptions_file, intents_file
+                    )
+                    yield (wav_path, transcription, intent)
+            finally:
+                tester.stop()
     finally:
-        # Delete temporary directory
-        if temp_dir:
-            temp_dir.cleanup()
+        for results_file in [transcriptions_file, intents_file]:
+            if results_file is not None:
+                results_file.close()
+
+
+def _write_results(
+    transcription: typing.Dict[str, typing.Any],
+    intent: typing.Dict[str, typing.Any],
+    transcriptions_file: typing.Optional[typing.TextIO],
+    intents_file: typing.Optional[typing.TextIO],
+):
+    """Write transcription/intent as JSON lines if saving results."""
+    if transcriptions_file is not None:
+        print(json.dumps(transcription, ensure_ascii=False), file=transcriptions_file)
+
+    if intents_file is not None:
+        print(json.dumps(intent, ensure_ascii=False), file=intents_file)
+
+
+class ExampleTester:
+    """Transcribes WAV files and recognizes intents with a loaded profile."""
+
+    def __init__(
+        self,
+        core: Voice2JsonCore,
+        open_transcription: bool = False,
+        debug: bool = False,
+        num_workers: int = 1,
+    ):
+        self.core = core
+        self.transcriber = core.get_transcriber(
+            open_transcription=open_transcription, debug=debug, num_workers=num_workers
+        )
+        self.recognizer = core.get_recognizer()
+
+        # Number of WAV files that can be transcribed at the same time
+        self.num_workers = getattr(self.transcriber, "num_workers", 1)
+
+    async def test_wav(
+        self, wav_path: Path
+    ) -> typing.Tuple[typing.Dict[str, typing.Any], typing.Dict[str, typing.Any]]:
+        """Get transcription and intent for a single WAV file."""
+        from rhasspyasr import Transcription
+
+        from .recognize import merge_recognition
+
+        _LOGGER.debug("Testing %s", wav_path)
+
+        # Transcribe
+        wav_data = await self.core.maybe_convert_wav(wav_path.read_bytes())
+        if self.num_workers > 1:
+            # Decode in a separate thread while other files are loaded
+            transcription_result = await asyncio.get_running_loop().run_in_executor(
+                None, self.transcriber.transcribe_wav, wav_data
+            )
+        else:
+            transcription_result = self.transcriber.transcribe_wav(wav_data)
+
+        transcription = dataclasses.asdict(
+            transcription_result or Transcription.empty()
+        )
+        transcription["wav_name"] = wav_path.name
+
+        # Recognize
+        text = (transcription.get("text") or "").strip()
+        recognition = self.recognizer.recognize(text)
+        intent = merge_recognition(dict(transcription), recognition, text)
+
+        return (transcription, intent)
+
+    def stop(self):
+        """Stop transcriber and recognizer."""
+        self.transcriber.stop()
+        self.recognizer.stop()
+
+
+# -----------------------------------------------------------------------------
+# Worker process state (see test_wavs)
+# -----------------------------------------------------------------------------
+
+_WORKER_TESTER: typing.Optional[ExampleTester] = None
+_WORKER_LOOP: typing.Optional[asyncio.AbstractEventLoop] = None
+
+
+def _init_worker(
+    profile_file: Path,
+    profile: typing.Dict[str, typing.Any],
+    open_transcription: bool,
+    debug: bool,
+):
+    """Load transcriber/recognizer once per worker process."""
+    global _WORKER_TESTER, _WORKER_LOOP
+
+    _WORKER_LOOP = asyncio.new_event_loop()
+    _WORKER_TESTER = ExampleTester(
+        Voice2JsonCore(profile_file, profile),
+        open_transcription=open_transcription,
+        debug=debug,
+    )
+
+    # Stop transcriber (and any external processes) when worker exits
+    multiprocessing.util.Finalize(_WORKER_TESTER, _WORKER_TESTER.stop, exitpriority=10)
+
+
+def _worker_test_wav(
+    wav_path: Path,
+) -> typing.Tuple[typing.Dict[str, typing.Any], typing.Dict[str, typing.Any]]:
+    """Test a single WAV file in a worker process."""
+    assert _WORKER_TESTER and _WORKER_LOOP, "Worker not initialized"
+    return _WORKER_LOOP.run_until_complete(_WORKER_TESTER.test_wav(wav_path))
@@ -1,8 +1,11 @@
 """Methods to train a voice2json profile."""
 import asyncio
+import gzip
+import json
 import logging
+import os
+import time
 import typing
-from enum import Enum
 from pathlib import Path
 
 import pydash
@@ -10,7 +13,12 @@ import rhasspynlu
 from rhasspynlu.g2p import PronunciationAction, PronunciationsType
 from rhasspynlu.jsgf import Expression, Word
 
+from .const import AcousticModelType, WordCasing
+from .fuzzy import write_fuzzy_index
+from .graph import load_compact_graph, write_compact_graph
 from .pronounce import load_pronunciations
+from .settings import TrainingPaths
+from .utils import fingerprint, hash_file
 from .utils import ppath as utils_ppath
 
 _LOGGER = logging.getLogger("voice2json.train")
@@ -18,32 +26,17 @@ _LOGGER = logging.getLogger("voice2json.train")
 # -----------------------------------------------------------------------------
 
 
-class AcousticModelType(str, Enum):
-    """Support speech to text systems."""
-
-    DUMMY = "dummy"
-    POCKETSPHINX = "pocketsphinx"
-    KALDI = "kaldi"
-    JULIUS = "julius"
-    DEEPSPEECH = "deepspeech"
-
-
-class WordCasing(str, Enum):
-    """Word casing transformation types."""
-
-    DEFAULT = "default"
-    UPPER = "upper"
-    LOWER = "lower"
-    IGNORE = "ignore"
-
-
-# -----------------------------------------------------------------------------
-
-
 async def train_profile(
-    profile_dir: Path, profile: typing.Dict[str, typing.Any]
-) -> None:
-    """Re-generate speech/intent artifacts for profile."""
+    profile_dir: Path,
+    profile: typing.Dict[str, typing.Any],
+    force: bool = False,
+    paths: typing.Optional[TrainingPaths] = None,
+) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """Re-generate speech/intent artifacts for profile.
+
+    Stages whose inputs have not changed since the last training are skipped
+    unless force is True. Returns whether each stage ran and how long it took.
+    """
 
     # Compact
     def ppath(query, default=None):
@@ -51,9 +44,12 @@ async def train_profile(
 
     language_code = pydash.get(profile, "language.code", "en-US")
 
-    sentences_ini = ppath("training.sentences-file", "sentences.ini")
-    slots_dir = ppath("training.slots-directory", "slots")
-    slot_programs = ppath("training.slot-programs-directory", "slot_programs")
+    # Input/output paths
+    paths = paths or TrainingPaths(profile, profile_dir)
+
+    sentences_ini = paths.sentences_ini
+    slots_dir = paths.slots_dir
+    slot_programs = paths.slot_programs
 
     # Profile files that are split into parts and gzipped
     large_paths = [Path(p) for p in pydash.get(profile, "training.large-files", [])]
@@ -61,17 +57,18 @@ async def train_profile(
     # -------------------
     # Speech to text
     # -------------------
-    base_dictionary = ppath("training.base-dictionary", "base_dictionary.txt")
-    custom_words = ppath("training.custom-words-file", "custom_words.txt")
+    base_dictionary = paths.base_dictionary
+    base_dictionary_index = paths.base_dictionary_index
+    custom_words = paths.custom_words
     custom_words_action = PronunciationAction(
         pydash.get(profile, "training.custom-words-action", "append")
     )
-    sounds_like = ppath("training.sounds-like-file", "sounds_like.txt")
+    sounds_like = paths.sounds_like
     sounds_like_action = PronunciationAction(
         pydash.get(profile, "training.sounds-like-action", "append")
     )
 
-    acoustic_model = ppath("training.acoustic-model", "acoustic_model")
+    acoustic_model = paths.acoustic_model
     acoustic_model_type = AcousticModelType(
         pydash.get(profile, "training.acoustic-model-type", AcousticModelType.DUMMY)
     )
@@ -83,9 +80,7 @@ async def train_profile(
     word_casing = pydash.get(profile, "training.word-casing", WordCasing.IGNORE)
 
     # Large pre-built language model
-    base_language_model_fst = ppath(
-        "training.base-language-model-fst", "base_language_model.fst"
-    )
+    base_language_model_fst = paths.base_language_model_fst
     base_language_model_weight = float(
         pydash.get(profile, "training.base-language-model-weight", 0)
     )
@@ -93,8 +88,8 @@ async def train_profile(
     # -------------------
     # Grapheme to phoneme
     # -------------------
-    g2p_model = ppath("training.grapheme-to-phoneme-model", "g2p.fst")
-    g2p_corpus = ppath("training.grapheme-to-phoneme-corpus", "g2p.corpus")
+    g2p_model = paths.g2p_model
+    g2p_corpus = paths.g2p_corpus
 
     # default/ignore/upper/lower
     g2p_word_casing = pydash.get(profile, "training.g2p-word-casing", word_casing)
@@ -102,15 +97,24 @@ async def train_profile(
     # -------
     # Outputs
     # -------
-    dictionary_path = ppath("training.dictionary", "dictionary.txt")
-    language_model_path = ppath("training.language-model", "language_model.txt")
-    language_model_fst_path = ppath("training.language-model-fst", "language_model.fst")
-    mixed_language_model_fst_path = ppath(
-        "training.mixed-language-model-fst", "mixed_language_model.fst"
-    )
-    intent_graph_path = ppath("training.intent-graph", "intent.pickle.gz")
-    vocab_path = ppath("training.vocabulary-file", "vocab.txt")
-    unknown_words_path = ppath("training.unknown-words-file", "unknown_words.txt")
+    dictionary_path = paths.dictionary
+    language_model_path = paths.language_model
+    language_model_fst_path = paths.language_model_fst
+    mixed_language_model_fst_path = paths.mixed_language_model_fst
+    intent_graph_path = paths.intent_graph
+    compact_intent_graph_path = paths.compact_intent_graph
+    fuzzy_index_path = paths.fuzzy_index
+    vocab_path = paths.vocab
+    unknown_words_path = paths.unknown_words
+    cache_path = paths.cache_file
+
+    # Fingerprints of inputs from the last training
+    cache = TrainingCache(cache_path)
+    if force:
+        cache.stages.clear()
+
+    # stage name -> { ran, seconds }
+    stages: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
 
     async def run(command: typing.List[str], **kwargs):
         """Run a command asynchronously."""
@@ -122,6 +126,9 @@ async def train_profile(
     # 1. Reassemble large files
     # -------------------------------------------------------------------------
 
+    stage_start = time.perf_counter()
+    reassembled = False
+
     for target_path in large_paths:
         gzip_path = Path(str(target_path) + ".gz")
         part_paths = sorted(list(gzip_path.parent.glob(f"{gzip_path.name}.part-*")))
@@ -143,21 +150,22 @@ async def train_profile(
 
             # Delete zip file
             gzip_path.unlink()
+            reassembled = True
 
         # Delete unneeded .gz-part files
         for part_path in part_paths:
             part_path.unlink()
 
+    stages["large_files"] = {
+        "ran": reassembled,
+        "seconds": time.perf_counter() - stage_start,
+    }
+
     # -------------------------------------------------------------------------
     # 2. Generate intent graph
     # -------------------------------------------------------------------------
 
-    # Parse JSGF sentences
-    _LOGGER.debug("Parsing %s", sentences_ini)
-    intents = rhasspynlu.parse_ini(sentences_ini)
-
-    # Split into sentences and rule/slot replacements
-    sentences, replacements = rhasspynlu.ini_jsgf.split_rules(intents)
+    stage_start = time.perf_counter()
 
     word_transform = None
     if word_casing == WordCasing.UPPER:
@@ -187,55 +195,194 @@ async def train_profile(
 
         word_visitor = transform_visitor
 
-    # Apply case/number transforms
-    if word_visitor or replace_numbers:
-        for intent_sentences in sentences.values():
-            for sentence in intent_sentences:
-                if replace_numbers:
-                    # Replace number ranges with slot references
-                    # type: ignore
-                    rhasspynlu.jsgf.walk_expression(
-                        sentence, rhasspynlu.number_range_transform, replacements
-                    )
+    # Only settings this stage reads, so unrelated changes don't rebuild the graph
+    graph_inputs: typing.List[typing.Any] = [
+        sentences_ini,
+        slots_dir,
+        slot_programs,
+        {
+            "language-code": language_code,
+            "word-casing": word_casing,
+            "replace-numbers": replace_numbers,
+        },
+    ]
+
+    intents = None
+    slot_replacements = None
+    if slot_programs and any(p.is_file() for p in slot_programs.rglob("*")):
+        # Slot program output can change even if the programs don't,
+        # so they have to be run and their values fingerprinted.
+        _LOGGER.debug("Parsing %s", sentences_ini)
+        intents = rhasspynlu.parse_ini(sentences_ini)
+        slot_replacements = rhasspynlu.get_slot_replacements(
+            intents,
+            slots_dirs=[slots_dir],
+            slot_programs_dirs=[slot_programs],
+            slot_visitor=word_visitor,
+        )
+
+        graph_inputs.append(repr(sorted(slot_replacements.items())))
 
-                if word_visitor:
-                    # Do case transformation
-                    # type: ignore
+    graph_fingerprint = cache.fingerprint(*graph_inputs)
+    intent_graph = None
+
+    graph_outputs = [intent_graph_path, compact_intent_graph_path]
+    if cache.stages.get("fuzzy_index") == graph_fingerprint:
+        # Index was written for this graph (graphs with cycles can't be indexed)
+        graph_outputs.append(fuzzy_index_path)
+
+    if cache.is_fresh("intent_graph", graph_fingerprint, graph_outputs):
+        _LOGGER.debug("Intent graph is up to date")
+    else:
+        if intents is None:
+            # Parse JSGF sentences
+            _LOGGER.debug("Parsing %s", sentences_ini)
+            intents = rhasspynlu.parse_ini(sentences_ini)
+
+        # Split into sentences and rule/slot replacements
+        sentences, replacements = rhasspynlu.ini_jsgf.split_rules(intents)
+
+        # Apply case/number transforms
+        if word_visitor or replace_numbers:
+            for intent_sentences in sentences.values():
+                for sentence in intent_sentences:
+                    if replace_numbers:
+                        # Replace number ranges with slot references
+                        # type: ignore
+                        rhasspynlu.jsgf.walk_expression(
+                            sentence, rhasspynlu.number_range_transform, replacements
+                        )
+
+                    if word_visitor:
+                        # Do case transformation
+                        # type: ignore
+                        rhasspynlu.jsgf.walk_expression(
+                            sentence, word_visitor, replacements
+                        )
+
+        if slot_replacements is None:
+            # Load slot values
+            slot_replacements = rhasspynlu.get_slot_replacements(
+                intents,
+                slots_dirs=[slots_dir],
+                slot_programs_dirs=[slot_programs],
+                slot_visitor=word_visitor,
+            )
+
+        # Merge with existing replacements
+        for slot_key, slot_values in slot_replacements.items():
+            replacements[slot_key] = slot_values
+
+        if replace_numbers:
+            # Do single number transformations
+            for intent_sentences in sentences.values():
+                for sentence in intent_sentences:
                     rhasspynlu.jsgf.walk_expression(
-                        sentence, word_visitor, replacements
+                        sentence,
+                        lambda w: rhasspynlu.number_transform(w, language_code),
+                        replacements,
                     )
 
-    # Load slot values
-    slot_replacements = rhasspynlu.get_slot_replacements(
-        intents,
-        slots_dirs=[slots_dir],
-        slot_programs_dirs=[slot_programs],
-        slot_visitor=word_visitor,
-    )
+        # Convert to directed graph
+        intent_graph = rhasspynlu.sentences_to_graph(
+            sentences, replacements=replacements
+        )
+
+        # Convert to gzipped pickle
+        intent_graph_path.parent.mkdir(exist_ok=True)
+        with open(intent_graph_path, mode="wb") as intent_graph_file:
+            rhasspynlu.graph_to_gzip_pickle(intent_graph, intent_graph_file)
+
+        _LOGGER.debug("Wrote intent graph to %s", intent_graph_path)
+
+        # Convert to memory-mappable arrays
+        write_compact_graph(intent_graph, compact_intent_graph_path)
+        _LOGGER.debug("Wrote compact intent graph to %s", compact_intent_graph_path)
+
+        # Index for fuzzy recognition
+        try:
+            write_fuzzy_index(
+                load_compact_graph(compact_intent_graph_path), fuzzy_index_path
+            )
+            _LOGGER.debug("Wrote fuzzy recognition index to %s", fuzzy_index_path)
+            cache.stages["fuzzy_index"] = graph_fingerprint
+        except ValueError:
+            _LOGGER.exception("Not writing fuzzy recognition index")
+            cache.stages.pop("fuzzy_index", None)
+
+            # Don't leave an index for an older graph
+            if fuzzy_index_path.is_file():
+                fuzzy_index_path.unlink()
+
+        cache.stages["intent_graph"] = graph_fingerprint
+        cache.save()
+
+    stages["intent_graph"] = {
+        "ran": intent_graph is not None,
+        "seconds": time.perf_counter() - stage_start,
+    }
 
-    # Merge with existing replacements
-    for slot_key, slot_values in slot_replacements.items():
-        replacements[slot_key] = slot_values
+    # -------------------------------------------------------------------------
+    # 3. Speech to text
+    # -------------------------------------------------------------------------
+
+    if acoustic_model_type == AcousticModelType.DUMMY:
+        _LOGGER.warning("Not training speech to text system (%s)", acoustic_model_type)
+        cache.save()
+        return stages
+
+    stage_start = time.perf_counter()
+
+    # Kaldi writes its outputs inside the acoustic model directory
+    acoustic_model_inputs = acoustic_model
+    speech_outputs = [language_model_path]
+    graph_dir: typing.Optional[Path] = None
+    trie_path: typing.Optional[Path] = None
+
+    if acoustic_model_type == AcousticModelType.KALDI:
+        acoustic_model_inputs = acoustic_model / "model"
+        graph_dir = ppath("training.kaldi.graph-directory") or (
+            acoustic_model / "graph"
+        )
+        speech_outputs.append(graph_dir / "HCLG.fst")
+
+    if acoustic_model_type == AcousticModelType.DEEPSPEECH:
+        # DeepSpeech writes a trie instead of a pronunciation dictionary
+        trie_path = ppath("training.deepspeech.trie", "trie")
+        speech_outputs.append(trie_path)
+    else:
+        speech_outputs.append(dictionary_path)
+
+    speech_fingerprint = cache.fingerprint(
+        graph_fingerprint,
+        acoustic_model_type.value,
+        acoustic_model_inputs,
+        base_dictionary,
+        custom_words,
+        sounds_like,
+        g2p_model,
+        g2p_corpus,
+        base_language_model_fst,
+        pydash.get(profile, "training"),
+    )
 
-    if replace_numbers:
-        # Do single number transformations
-        for intent_sentences in sentences.values():
-            for sentence in intent_sentences:
-                rhasspynlu.jsgf.walk_expression(
-                    sentence,
-                    lambda w: rhasspynlu.number_transform(w, language_code),
-                    replacements,
-                )
+    if cache.is_fresh("speech_to_text", speech_fingerprint, speech_outputs):
+        _LOGGER.debug("Speech to text system is up to date")
+        stages["speech_to_text"] = {
+            "ran": False,
+            "seconds": time.perf_counter() - stage_start,
+        }
 
-    # Convert to directed graph
-    intent_graph = rhasspynlu.sentences_to_graph(sentences, replacements=replacements)
+        cache.save()
+        return stages
 
-    # Convert to gzipped pickle
-    intent_graph_path.parent.mkdir(exist_ok=True)
-    with open(intent_graph_path, mode="wb") as intent_graph_file:
-        rhasspynlu.graph_to_gzip_pickle(intent_graph, intent_graph_file)
+    if intent_graph is None:
+        # Re-use graph from previous training
+        import networkx as nx
 
-    _LOGGER.debug("Wrote intent graph to %s", intent_graph_path)
+        _LOGGER.debug("Loading %s", intent_graph_path)
+        with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
+            intent_graph = nx.readwrite.gpickle.read_gpickle(graph_gzip)
 
     g2p_word_transform = None
     if g2p_word_casing == WordCasing.UPPER:
@@ -257,6 +404,7 @@ async def train_profile(
             sounds_like=sounds_like,
             sounds_like_action=sounds_like_action,
             g2p_corpus=g2p_corpus,
+            base_dictionary_index=base_dictionary_index,
         )
 
     # -------------------------------------------------------------------------
@@ -287,9 +435,7 @@ async def train_profile(
         import rhasspyasr_kaldi
         from rhasspyasr_kaldi.train import LanguageModelType
 
-        graph_dir = ppath("training.kaldi.graph-directory") or (
-            acoustic_model / "graph"
-        )
+        assert graph_dir is not None
 
         # Type of language model to generate
         language_model_type = LanguageModelType(
@@ -318,7 +464,7 @@ async def train_profile(
         # DeepSpeech
         import rhasspyasr_deepspeech
 
-        trie_path = ppath("training.deepspeech.trie", "trie")
+        assert trie_path, "Missing DeepSpeech trie path"
         alphabet_path = ppath("training.deepspeech.alphabet", "model/alphabet.txt")
 
         rhasspyasr_deepspeech.train(
@@ -352,5 +498,83 @@ async def train_profile(
             base_language_model_weight=base_language_model_weight,
             mixed_language_model_fst=mixed_language_model_fst_path,
         )
-    else:
-        _LOGGER.warning("Not training speech to text system (%s)", acoustic_model_type)
+
+    cache.stages["speech_to_text"] = speech_fingerprint
+    cache.save()
+
+    stages["speech_to_text"] = {
+        "ran": True,
+        "seconds": time.perf_counter() - stage_start,
+    }
+
+    return stages
+
+
+# -----------------------------------------------------------------------------
+
+
+class TrainingCache:
+    """Fingerprints of training inputs, used to skip stages that are up to date."""
+
+    def __init__(self, cache_path: typing.Optional[Path]):
+        self.cache_path = cache_path
+
+        # path -> { size, mtime_ns, sha256 }
+        self.files: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+
+        # stage name -> fingerprint
+        self.stages: typing.Dict[str, str] = {}
+
+        if cache_path and cache_path.is_file():
+            try:
+                with open(cache_path, "r") as cache_file:
+                    cache = json.load(cache_file)
+
+                self.files = cache.get("files", {})
+                self.stages = cache.get("stages", {})
+            except Exception:
+                _LOGGER.exception("Failed to load training cache from %s", cache_path)
+
+    def hash_file(self, path: Path) -> str:
+        """Get SHA256 of file contents. Re-used while file size/mtime are the same."""
+        stat = path.stat()
+        path_key = str(path.absolute())
+        cached = self.files.get(path_key)
+        if (
+            cached
+            and (cached["size"] == stat.st_size)
+            and (cached["mtime_ns"] == stat.st_mtime_ns)
+        ):
+            return cached["sha256"]
+
+        digest = hash_file(path)
+        self.files[path_key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest,
+        }
+
+        return digest
+
+    def fingerprint(self, *inputs: typing.Any) -> str:
+        """Combine file/directory contents and settings into a single hash."""
+        return fingerprint(*inputs, hash_file_func=self.hash_file)
+
+    def is_fresh(
+        self, stage: str, fingerprint: str, outputs: typing.Iterable[Path]
+    ) -> bool:
+        """True if stage inputs are unchanged and its outputs still exist."""
+        return (self.stages.get(stage) == fingerprint) and all(
+            p.exists() for p in outputs
+        )
+
+    def save(self):
+        """Write fingerprints to cache file."""
+        if not self.cache_path:
+            return
+
+        temp_path = self.cache_path.with_suffix(".tmp")
+        with open(temp_path, "w") as cache_file:
+            json.dump({"files": self.files, "stages": self.stages}, cache_file)
+
+        os.replace(temp_path, self.cache_path)
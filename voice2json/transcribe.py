@@ -1,5 +1,8 @@
 """Speech to text transcriptions methods."""
 import argparse
+import asyncio
+import bisect
+import collections
 import dataclasses
 import itertools
 import logging
@@ -8,18 +11,27 @@ import threading
 import time
 import typing
 from pathlib import Path
-from queue import Queue
-
-import pydash
 
 from .core import Voice2JsonCore
-from .utils import print_json
+from .utils import AudioChunkBuffer, is_regular_file, map_ordered, print_json
 
 _LOGGER = logging.getLogger("voice2json.transcribe")
 
 # -----------------------------------------------------------------------------
 
 
+@dataclasses.dataclass
+class VoiceCommandEnd:
+    """Marks the end of a voice command in the audio sent to the decoder."""
+
+    is_timeout: bool
+    end_time: float
+    printed: asyncio.Future
+
+
+# -----------------------------------------------------------------------------
+
+
 async def transcribe_wav(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Speech to text from WAV file(s)."""
     from rhasspyasr import Transcription
@@ -28,7 +40,12 @@ async def transcribe_wav(args: argparse.Namespace, core: Voice2JsonCore) -> None
     assert core.check_trained(), "Not trained"
 
     # Get speech to text transcriber for profile
-    transcriber = core.get_transcriber(open_transcription=args.open, debug=args.debug)
+    transcriber = core.get_transcriber(
+        open_transcription=args.open, debug=args.debug, num_workers=args.threads
+    )
+
+    # Number of WAV files that can be transcribed at the same time
+    num_workers = getattr(transcriber, "num_workers", 1)
 
     # Directory to report WAV file names relative to
     relative_dir = (
@@ -43,20 +60,38 @@ async def transcribe_wav(args: argparse.Namespace, core: Voice2JsonCore) -> None
                 _LOGGER.debug("Reading file paths from stdin")
                 wav_files = itertools.chain(wav_files, sys.stdin)
 
-            for wav_path_str in wav_files:
-                wav_path_str = wav_path_str.strip()
-
-                # Load and convert
-                wav_path = Path(wav_path_str)
+            async def transcribe_wav_file(wav_path: Path):
+                """Load, convert, and transcribe a single WAV file."""
                 _LOGGER.debug("Transcribing %s", wav_path)
-
                 wav_data = await core.maybe_convert_wav(wav_path.read_bytes())
 
-                # Transcribe
-                transcription = (
-                    transcriber.transcribe_wav(wav_data) or Transcription.empty()
+                if num_workers > 1:
+                    # Decode in a separate thread while other files are loaded
+                    return await asyncio.get_running_loop().run_in_executor(
+                        None, transcriber.transcribe_wav, wav_data
+                    )
+
+                return transcriber.transcribe_wav(wav_data)
+
+            # Results are printed in input order
+            wav_paths = (
+                Path(wav_path_str.strip())
+                for wav_path_str in wav_files
+                if wav_path_str.strip()
+            )
+
+            if getattr(transcriber, "batch_decoding", False) and (args.batch_size != 1):
+                # Decode many WAV files with each decoder run (Kaldi)
+                results = transcribe_wav_batches(
+                    wav_paths, transcriber, core, batch_size=args.batch_size
+                )
+            else:
+                results = map_ordered(
+                    transcribe_wav_file, wav_paths, max_pending=num_workers
                 )
-                result = dataclasses.asdict(transcription)
+
+            async for wav_path, transcription in results:
+                result = dataclasses.asdict(transcription or Transcription.empty())
 
                 if relative_dir is None:
                     # Add name of WAV file to result
@@ -115,6 +150,35 @@ async def transcribe_wav(args: argparse.Namespace, core: Voice2JsonCore) -> None
         transcriber.stop()
 
 
+async def transcribe_wav_batches(
+    wav_paths: typing.Iterable[Path],
+    transcriber,
+    core: Voice2JsonCore,
+    batch_size: int = 0,
+) -> typing.AsyncIterable[typing.Tuple[Path, typing.Any]]:
+    """Transcribe WAV files in batches (0 = all). Yields results in input order."""
+    wav_paths = iter(wav_paths)
+    while True:
+        if batch_size > 0:
+            batch_paths = list(itertools.islice(wav_paths, batch_size))
+        else:
+            batch_paths = list(wav_paths)
+
+        if not batch_paths:
+            break
+
+        _LOGGER.debug("Transcribing batch of %s WAV file(s)", len(batch_paths))
+        batch_wavs = [
+            await core.maybe_convert_wav(wav_path.read_bytes())
+            for wav_path in batch_paths
+        ]
+
+        for wav_path, transcription in zip(
+            batch_paths, transcriber.transcribe_wavs(batch_wavs)
+        ):
+            yield (wav_path, transcription)
+
+
 # -----------------------------------------------------------------------------
 
 
@@ -144,6 +208,13 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
         else:
             event_sink = open(args.event_sink, "w")
 
+    metrics_sink = None
+    if args.metrics_sink:
+        if args.metrics_sink == "-":
+            metrics_sink = sys.stdout
+        else:
+            metrics_sink = open(args.metrics_sink, "w")
+
     # Record command
     recorder = core.get_command_recorder()
     recorder.start()
@@ -154,49 +225,212 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
     audio_source = await core.make_audio_source(args.audio_source)
 
     # Audio settings
-    sample_rate = int(pydash.get(core.profile, "audio.format.sample-rate-hertz", 16000))
-    sample_width = (
-        int(pydash.get(core.profile, "audio.format.sample-width-bits", 16)) // 8
-    )
-    channels = int(pydash.get(core.profile, "audio.format.channel-count", 1))
+    sample_rate = core.settings.audio.sample_rate
+    sample_width = core.settings.audio.sample_width
+    channels = core.settings.audio.channels
 
     # Get speech to text transcriber for profile
-    transcriber = core.get_transcriber(open_transcription=args.open, debug=args.debug)
+    transcriber = core.get_transcriber(
+        open_transcription=args.open,
+        debug=args.debug,
+        partial_interval=args.partial_interval if args.partial else None,
+    )
+
+    partial_results = args.partial and getattr(transcriber, "partial_results", False)
+    if args.partial and (not partial_results):
+        _LOGGER.warning("Partial transcriptions are not supported by this profile")
 
-    # Set after a transcription has been printed
-    transcription_printed = threading.Event()
+    # Load decoder now instead of after the first voice command (Kaldi, Julius)
+    start_decoder = getattr(transcriber, "start_decoder", None)
+    if start_decoder is not None:
+        start_decoder()
 
-    # Run transcription in separate thread
-    frame_queue: "Queue[typing.Optional[bytes]]" = Queue()
+    bytes_per_second = sample_rate * sample_width * channels
+
+    # Live audio can't be paused, so the oldest audio is dropped if decoding
+    # falls too far behind. Audio from files waits for the decoder instead.
+    live_audio = (args.audio_source is None) or (
+        (args.audio_source == "-") and (not is_regular_file(sys.stdin))
+    )
+    max_chunks = int((args.buffer_seconds * bytes_per_second) / args.chunk_size)
+
+    # Audio source -> voice activity detection
+    capture_queue: "asyncio.Queue[typing.Optional[typing.Tuple[bytes, float]]]" = (
+        asyncio.Queue(maxsize=max(1, max_chunks))
+    )
+
+    # Voice activity detection -> decoding thread.
+    # Audio chunks are buffered with the time they were read.
+    decode_buffer = AudioChunkBuffer(max_chunks, drop_when_full=live_audio)
+
+    # End of each chunk in the current voice command (seconds of audio) and the
+    # time it was read.
+    chunk_ends: typing.List[float] = []
+    chunk_times: typing.List[float] = []
+
+    # Words and stable flags of last partial transcription
+    last_words: typing.List[str] = []
+    last_partial: typing.Optional[typing.List[typing.Tuple[str, bool]]] = None
+
+    # Frames from the audio source that can be read into again. Transcribers
+    # must be done with each chunk before asking for the next one.
+    free_frames: typing.Deque[bytearray] = collections.deque()
+
+    # Set by audio_stream when the voice command is finished
+    command_end: typing.Optional[VoiceCommandEnd] = None
 
     def audio_stream() -> typing.Iterable[bytes]:
-        """Read audio chunks from queue and yield."""
-        frames = frame_queue.get()
-        while frames:
+        """Read audio chunks from buffer and yield until voice command ends."""
+        nonlocal last_words, last_partial, command_end
+
+        chunk_ends.clear()
+        chunk_times.clear()
+        last_words = []
+        last_partial = None
+        command_end = None
+
+        audio_seconds = 0.0
+        item = decode_buffer.get()
+        while not isinstance(item, VoiceCommandEnd):
+            frames, read_time = item
+            audio_seconds += len(frames) / bytes_per_second
+            chunk_ends.append(audio_seconds)
+            chunk_times.append(read_time)
+
             yield frames
-            frames = frame_queue.get()
+
+            # Frame has been consumed by the transcriber
+            if isinstance(frames, bytearray) and (len(frames) == args.chunk_size):
+                free_frames.append(frames)
+
+            item = decode_buffer.get()
+
+        command_end = item
+
+    def on_partial(words: typing.List[str], audio_seconds: float):
+        """Print partial transcription if it has changed."""
+        nonlocal last_words, last_partial
+
+        # Words are stable if they were the same in the previous hypothesis
+        num_stable = 0
+        for word, last_word in zip(words, last_words):
+            if word != last_word:
+                break
+
+            num_stable += 1
+
+        last_words = words
+        partial = [(word, i < num_stable) for i, word in enumerate(words)]
+        if partial == last_partial:
+            # Nothing new
+            return
+
+        last_partial = partial
+
+        # Time since audio covered by hypothesis was read
+        latency_seconds = 0.0
+        if chunk_times:
+            chunk_index = min(
+                bisect.bisect_left(chunk_ends, audio_seconds - 1e-6),
+                len(chunk_times) - 1,
+            )
+            latency_seconds = time.perf_counter() - chunk_times[chunk_index]
+
+        print_json(
+            {
+                "text": " ".join(words),
+                "tokens": [
+                    {"token": word, "stable": stable} for word, stable in partial
+                ],
+                "partial": True,
+                "audio_seconds": audio_seconds,
+                "latency_seconds": latency_seconds,
+            }
+        )
+
+    def transcription_printed(printed: asyncio.Future):
+        if not printed.done():
+            printed.set_result(None)
 
     def transcribe_proc():
         """Transcribe live audio stream indefinitely."""
         while True:
             # Get result of transcription
-            transcribe_result = transcriber.transcribe_stream(
-                audio_stream(), sample_rate, sample_width, channels
-            )
+            if partial_results:
+                transcribe_result = transcriber.transcribe_stream_partial(
+                    audio_stream(), sample_rate, sample_width, channels, on_partial
+                )
+            else:
+                transcribe_result = transcriber.transcribe_stream(
+                    audio_stream(), sample_rate, sample_width, channels
+                )
+
+            # Skip audio the transcriber didn't read
+            while command_end is None:
+                for _ in audio_stream():
+                    pass
 
             _LOGGER.debug("Transcription result: %s", transcribe_result)
 
             transcribe_result = transcribe_result or Transcription.empty()
             transcribe_dict = dataclasses.asdict(transcribe_result)
-            transcribe_dict["timeout"] = is_timeout
+            transcribe_dict["timeout"] = command_end.is_timeout
+
+            # Time from end of voice command to transcription
+            transcribe_dict["latency_seconds"] = (
+                time.perf_counter() - command_end.end_time
+            )
 
             print_json(transcribe_dict)
-            transcription_printed.set()
+            loop.call_soon_threadsafe(transcription_printed, command_end.printed)
 
+    loop = asyncio.get_event_loop()
     threading.Thread(target=transcribe_proc, daemon=True).start()
 
-    # True if current voice command timed out
-    is_timeout = False
+    # Re-used for each chunk if audio source can read into a buffer
+    readinto = getattr(audio_source, "readinto", None)
+
+    async def read_chunk() -> typing.Union[bytes, bytearray]:
+        """Read the next audio chunk, re-using a frame the decoder is done with."""
+        if readinto is None:
+            return await audio_source.read(args.chunk_size)
+
+        frame = free_frames.pop() if free_frames else bytearray(args.chunk_size)
+        num_bytes = await readinto(frame)
+        if num_bytes < len(frame):
+            # End of audio
+            return frame[:num_bytes]
+
+        return frame
+
+    async def read_audio():
+        """Read audio chunks into capture queue until audio source is empty."""
+        try:
+            chunk = await read_chunk()
+            while chunk:
+                await capture_queue.put((chunk, time.perf_counter()))
+                chunk = await read_chunk()
+        except Exception:
+            # Stop main loop. Error is re-raised from read_task.
+            await capture_queue.put(None)
+            raise
+
+        await capture_queue.put(None)
+
+    def write_metrics():
+        """Write audio pipeline statistics to metrics sink."""
+        decode_stats = decode_buffer.statistics()
+        metrics = {
+            "capture_queue_depth": capture_queue.qsize(),
+            "decode_queue_depth": decode_stats["depth"],
+            "max_decode_queue_depth": decode_stats["max_depth"],
+            "dropped_chunks": decode_stats["dropped_chunks"],
+            "dropped_seconds": decode_stats["dropped_bytes"] / bytes_per_second,
+        }
+
+        _LOGGER.debug("Audio pipeline: %s", metrics)
+        if metrics_sink:
+            print_json(metrics, out_file=metrics_sink)
 
     # Number of events for pending voice command
     event_count = 0
@@ -204,13 +438,17 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
     # Number of transcriptions that have happened
     num_transcriptions = 0
 
+    # Resolved when the most recent voice command has been transcribed
+    pending_printed: typing.Optional[asyncio.Future] = None
+
     print("Ready", file=sys.stderr)
 
+    read_task = asyncio.ensure_future(read_audio())
+
     try:
-        chunk = await audio_source.read(args.chunk_size)
-        while chunk:
-            # Reset event
-            transcription_printed.clear()
+        item = await capture_queue.get()
+        while item:
+            chunk, read_time = item
 
             # Look for speech/silence
             voice_command = recorder.process_chunk(chunk)
@@ -223,10 +461,16 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
                 event_count = len(recorder.events)
 
             if voice_command:
-                is_timeout = voice_command.result == VoiceCommandResult.FAILURE
-
                 # Force transcription
-                frame_queue.put(None)
+                command_printed = loop.create_future()
+                pending_printed = command_printed
+                await decode_buffer.put(
+                    VoiceCommandEnd(
+                        is_timeout=(voice_command.result == VoiceCommandResult.FAILURE),
+                        end_time=read_time,
+                        printed=command_printed,
+                    )
+                )
 
                 # Reset
                 audio_data = recorder.stop()
@@ -247,25 +491,40 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
                     )
 
                 num_transcriptions += 1
-
-                # Wait for transcription to be printed
-                transcription_printed.wait(timeout=args.timeout)
+                write_metrics()
 
                 # Check exit count
                 if (args.exit_count is not None) and (
                     num_transcriptions >= args.exit_count
                 ):
                     _LOGGER.debug("Exit count reached")
+
                     break
 
                 recorder.start()
+
+                if isinstance(chunk, bytearray) and (len(chunk) == args.chunk_size):
+                    # Last chunk of voice command was only seen by the recorder
+                    free_frames.append(chunk)
             else:
                 # Add to current command
-                frame_queue.put(chunk)
+                await decode_buffer.put(item, size=len(chunk))
 
             # Next audio chunk
-            chunk = await audio_source.read(args.chunk_size)
+            item = await capture_queue.get()
+
+        if pending_printed is not None:
+            # Wait for last transcription to be printed
+            try:
+                await asyncio.wait_for(pending_printed, timeout=args.timeout)
+            except asyncio.TimeoutError:
+                _LOGGER.warning("Timeout waiting for transcription")
+
+        if read_task.done():
+            # Raise error from reading audio source (if any)
+            read_task.result()
     finally:
+        read_task.cancel()
         transcriber.stop()
 
         try:
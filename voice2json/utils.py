@@ -1,13 +1,20 @@
 """Utility methods for voice2json."""
+import asyncio
+import bisect
 import collections
+import hashlib
 import io
+import json
 import logging
 import os
 import random
+import socket
+import stat
 import sys
+import threading
+import time
 import typing
 import wave
-from collections import deque
 from pathlib import Path
 
 import pydash
@@ -27,6 +34,181 @@ def get_wav_duration(wav_bytes: bytes) -> float:
             return frames / float(rate)
 
 
+def convert_pcm_wav(
+    wav_bytes: bytes, sample_rate: int, sample_width: int, channels: int
+) -> typing.Optional[bytes]:
+    """Convert PCM WAV data in-process to a different rate/width/channel count.
+
+    Returns None if the audio can't be converted (use an external program).
+    """
+    global _WARNED_NO_NUMPY
+
+    try:
+        import numpy as np
+    except ImportError:
+        if not _WARNED_NO_NUMPY:
+            _LOGGER.warning("numpy is not installed. Using audio.convert-command.")
+            _WARNED_NO_NUMPY = True
+
+        return None
+
+    try:
+        with io.BytesIO(wav_bytes) as wav_io:
+            with wave.open(wav_io, "rb") as wav_file:
+                if wav_file.getcomptype() != "NONE":
+                    return None
+
+                rate, width, num_channels = (
+                    wav_file.getframerate(),
+                    wav_file.getsampwidth(),
+                    wav_file.getnchannels(),
+                )
+                audio = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError):
+        # Compressed, floating point, etc.
+        return None
+
+    if (num_channels != channels) and (
+        (num_channels, channels) not in [(2, 1), (1, 2)]
+    ):
+        # Only mono <-> stereo
+        return None
+
+    if (width not in _PCM_DTYPES) or (sample_width not in _PCM_DTYPES):
+        return None
+
+    # frames x channels in [-1, 1)
+    samples = _pcm_to_float(audio, width).reshape(-1, num_channels)
+
+    if (num_channels == 2) and (channels == 1):
+        # Down-mix stereo
+        samples = samples.mean(axis=1, keepdims=True)
+
+    if rate != sample_rate:
+        samples = np.stack(
+            [
+                _resample(samples[:, channel], rate, sample_rate)
+                for channel in range(samples.shape[1])
+            ],
+            axis=1,
+        )
+
+    if (samples.shape[1] == 1) and (channels == 2):
+        # Up-mix mono
+        samples = np.repeat(samples, 2, axis=1)
+
+    with io.BytesIO() as wav_io:
+        wav_out: wave.Wave_write = wave.open(wav_io, "wb")
+        with wav_out:
+            wav_out.setframerate(sample_rate)
+            wav_out.setsampwidth(sample_width)
+            wav_out.setnchannels(channels)
+            wav_out.writeframes(_float_to_pcm(samples.reshape(-1), sample_width))
+
+        return wav_io.getvalue()
+
+
+# True after warning that built-in conversion is unavailable
+_WARNED_NO_NUMPY = False
+
+# Sample width in bytes -> numpy dtype (24-bit is unpacked by hand)
+_PCM_DTYPES = {1: "u1", 2: "<i2", 3: "u1", 4: "<i4"}
+
+# Zero crossings on each side of the low-pass filter's center tap
+_RESAMPLE_ZERO_CROSSINGS = 32
+
+# Fraction of the output Nyquist frequency that is kept when downsampling
+_RESAMPLE_BANDWIDTH = 0.9
+
+
+def _pcm_to_float(audio: bytes, width: int):
+    """Decode little-endian PCM samples to floats in [-1, 1)."""
+    import numpy as np
+
+    # Drop incomplete sample at the end
+    audio = audio[: len(audio) - (len(audio) % width)]
+
+    if width == 1:
+        # 8-bit WAV audio is unsigned
+        samples = np.frombuffer(audio, dtype="u1").astype(np.float64) - 128
+    elif width == 3:
+        packed = np.frombuffer(audio, dtype="u1").reshape(-1, 3).astype(np.int32)
+        ints = packed[:, 0] | (packed[:, 1] << 8) | (packed[:, 2] << 16)
+        samples = np.where(ints >= (1 << 23), ints - (1 << 24), ints).astype(np.float64)
+    else:
+        samples = np.frombuffer(audio, dtype=_PCM_DTYPES[width]).astype(np.float64)
+
+    return samples / (1 << ((8 * width) - 1))
+
+
+def _float_to_pcm(samples, width: int) -> bytes:
+    """Encode floats in [-1, 1) as little-endian PCM samples."""
+    import numpy as np
+
+    scale = 1 << ((8 * width) - 1)
+    ints = np.clip(np.round(samples * scale), -scale, scale - 1).astype(np.int64)
+
+    if width == 1:
+        # 8-bit WAV audio is unsigned
+        return (ints + 128).astype("u1").tobytes()
+
+    if width == 3:
+        ints = ints & 0xFFFFFF
+        return (
+            np.stack([ints & 0xFF, (ints >> 8) & 0xFF, ints >> 16], axis=1)
+            .astype("u1")
+            .tobytes()
+        )
+
+    return ints.astype(_PCM_DTYPES[width]).tobytes()
+
+
+def _resample(samples, rate: int, new_rate: int):
+    """Resample one channel by interpolation.
+
+    When downsampling, a windowed-sinc low-pass filter first removes
+    frequencies above the new Nyquist frequency so they don't alias.
+    """
+    import numpy as np
+
+    if len(samples) == 0:
+        # Empty WAV file
+        return np.zeros(0)
+
+    ratio = new_rate / rate
+    if ratio < 1:
+        # Cutoff in cycles per input sample
+        cutoff = 0.5 * ratio * _RESAMPLE_BANDWIDTH
+        half_width = int(np.ceil(_RESAMPLE_ZERO_CROSSINGS / (2 * cutoff)))
+        taps = np.arange(-half_width, half_width + 1)
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.kaiser(len(taps), 8.6)
+        kernel /= kernel.sum()
+
+        # Keep filtered samples aligned with input
+        samples = np.convolve(samples, kernel)[half_width : half_width + len(samples)]
+
+    num_samples = (len(samples) * new_rate) // rate
+    return np.interp(
+        np.arange(num_samples) * (rate / new_rate),
+        np.arange(len(samples)),
+        samples,
+    )
+
+
+# -----------------------------------------------------------------------------
+
+
+def get_free_port(host: str = "127.0.0.1") -> int:
+    """Get a TCP port that is free right now.
+
+    Another program may take the port before it's used, so callers should
+    retry with a new port if binding fails.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as port_socket:
+        port_socket.bind((host, 0))
+        return port_socket.getsockname()[1]
+
+
 # -----------------------------------------------------------------------------
 
 
@@ -47,6 +229,45 @@ def ppath(
 # -----------------------------------------------------------------------------
 
 
+def hash_file(path: Path) -> str:
+    """Get SHA256 hash of a file's contents."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as hash_file:
+        for chunk in iter(lambda: hash_file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def fingerprint(
+    *inputs: typing.Any, hash_file_func: typing.Callable[[Path], str] = hash_file
+) -> str:
+    """Combine file/directory contents and settings into a single hash."""
+    hasher = hashlib.sha256()
+    for value in inputs:
+        if isinstance(value, Path):
+            if value.is_dir():
+                # All files in directory (recursive)
+                for file_path in sorted(value.rglob("*")):
+                    if file_path.is_file():
+                        hasher.update(str(file_path.relative_to(value)).encode())
+                        hasher.update(hash_file_func(file_path).encode())
+            elif value.is_file():
+                hasher.update(hash_file_func(value).encode())
+            else:
+                hasher.update(f"missing:{value}".encode())
+        else:
+            hasher.update(json.dumps(value, sort_keys=True, default=str).encode())
+
+        # Separate inputs
+        hasher.update(b"\0")
+
+    return hasher.hexdigest()
+
+
+# -----------------------------------------------------------------------------
+
+
 def recursive_update(
     base_dict: typing.Dict[typing.Any, typing.Any],
     new_dict: typing.Mapping[typing.Any, typing.Any],
@@ -64,13 +285,222 @@ def recursive_update(
 
 def print_json(value: typing.Any, out_file=sys.stdout) -> None:
     """Print a single line of JSON to stdout."""
-    import jsonlines
+    # Single write so lines from different threads aren't interleaved
+    out_file.write(json_dumps(value) + "\n")
+    out_file.flush()
 
-    with jsonlines.Writer(out_file) as out:
-        # pylint: disable=E1101
-        out.write(value)
 
-    out_file.flush()
+# Same output as jsonlines.Writer
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+
+def json_dumps(value: typing.Any) -> str:
+    """Serialize value to a single line of JSON."""
+    return _JSON_ENCODER.encode(value)
+
+
+class JsonLinesSink:
+    """Writes JSON lines to a file, flushing in batches.
+
+    With flush_bytes/flush_seconds of 0, every record is flushed immediately
+    (like print_json). Otherwise, records are buffered until either limit is
+    reached or the sink is closed.
+    """
+
+    def __init__(
+        self,
+        out_file: typing.TextIO = sys.stdout,
+        flush_bytes: int = 0,
+        flush_seconds: float = 0.0,
+    ):
+        self.out_file = out_file
+        self.flush_bytes = flush_bytes
+        self.flush_seconds = flush_seconds
+
+        self.lines: typing.List[str] = []
+        self.buffer_size = 0
+        self.last_flush = time.monotonic()
+
+    @classmethod
+    def for_batch(
+        cls, out_file: typing.TextIO = sys.stdout, batch: bool = True
+    ) -> "JsonLinesSink":
+        """Create sink that buffers output if batch is True and out_file is not a terminal."""
+        if batch and (not out_file.isatty()):
+            return cls(out_file, flush_bytes=64 * 1024, flush_seconds=1.0)
+
+        return cls(out_file)
+
+    def write(self, value: typing.Any):
+        """Write a single JSON record."""
+        line = json_dumps(value) + "\n"
+        self.lines.append(line)
+        self.buffer_size += len(line)
+
+        if (
+            (self.flush_bytes <= 0)
+            or (self.buffer_size >= self.flush_bytes)
+            or (
+                (self.flush_seconds > 0)
+                and ((time.monotonic() - self.last_flush) >= self.flush_seconds)
+            )
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write buffered records and flush file."""
+        if self.lines:
+            self.out_file.write("".join(self.lines))
+            self.lines.clear()
+            self.buffer_size = 0
+
+        self.out_file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """Flush remaining records (does not close file)."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def is_regular_file(in_file: typing.IO) -> bool:
+    """True if file is a regular file on disk (not a pipe or terminal)."""
+    try:
+        return stat.S_ISREG(os.fstat(in_file.fileno()).st_mode)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return False
+
+
+def is_pipe(in_file: typing.IO) -> bool:
+    """True if file is a pipe or socket (not a regular file or terminal)."""
+    try:
+        mode = os.fstat(in_file.fileno()).st_mode
+        return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return False
+
+
+# -----------------------------------------------------------------------------
+
+
+async def map_ordered(
+    func: typing.Callable[[T], typing.Awaitable[typing.Any]],
+    items: typing.Iterable[T],
+    max_pending: int = 1,
+) -> typing.AsyncIterator[typing.Tuple[T, typing.Any]]:
+    """Run coroutine function on items concurrently, yielding (item, result) in input order.
+
+    At most max_pending items are in progress at once.
+    """
+    pending: typing.Deque[typing.Tuple[T, asyncio.Future]] = collections.deque()
+
+    try:
+        for item in items:
+            pending.append((item, asyncio.ensure_future(func(item))))
+
+            if len(pending) >= max_pending:
+                done_item, future = pending.popleft()
+                yield (done_item, await future)
+
+        while pending:
+            done_item, future = pending.popleft()
+            yield (done_item, await future)
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+class AudioChunkBuffer:
+    """Bounded buffer of audio chunks from the event loop to a decoding thread.
+
+    Items put with a size (audio chunks) count toward max_chunks. Other items
+    (markers) are never dropped. When the buffer is full, put waits for the
+    decoding thread to catch up, or drops the oldest chunk if drop_when_full is
+    True (live audio can't be paused).
+    """
+
+    def __init__(self, max_chunks: int, drop_when_full: bool = False):
+        self.max_chunks = max(1, max_chunks)
+        self.drop_when_full = drop_when_full
+        self.loop = asyncio.get_event_loop()
+
+        # (item, size)
+        self.items: typing.Deque[
+            typing.Tuple[typing.Any, typing.Optional[int]]
+        ] = collections.deque()
+        self.num_chunks = 0
+        self.condition = threading.Condition()
+        self.not_full = asyncio.Event()
+
+        # Statistics
+        self.max_depth = 0
+        self.dropped_chunks = 0
+        self.dropped_bytes = 0
+
+    async def put(self, item: typing.Any, size: typing.Optional[int] = None):
+        """Add an item, waiting or dropping audio if the buffer is full."""
+        while True:
+            with self.condition:
+                if (
+                    (size is None)
+                    or (self.num_chunks < self.max_chunks)
+                    or self.drop_when_full
+                ):
+                    if (size is not None) and (self.num_chunks >= self.max_chunks):
+                        self._drop_oldest()
+
+                    self.items.append((item, size))
+                    if size is not None:
+                        self.num_chunks += 1
+                        self.max_depth = max(self.max_depth, self.num_chunks)
+
+                    self.condition.notify()
+                    return
+
+                self.not_full.clear()
+
+            await self.not_full.wait()
+
+    def get(self) -> typing.Any:
+        """Remove the oldest item, blocking until one is available (decoding thread)."""
+        with self.condition:
+            while not self.items:
+                self.condition.wait()
+
+            item, size = self.items.popleft()
+            if size is not None:
+                self.num_chunks -= 1
+
+        try:
+            self.loop.call_soon_threadsafe(self.not_full.set)
+        except RuntimeError:
+            # Event loop is closed
+            pass
+
+        return item
+
+    def _drop_oldest(self):
+        for index, (_, size) in enumerate(self.items):
+            if size is not None:
+                del self.items[index]
+                self.num_chunks -= 1
+                self.dropped_chunks += 1
+                self.dropped_bytes += size
+                break
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """Get current/maximum number of chunks and dropped audio."""
+        return {
+            "depth": self.num_chunks,
+            "max_depth": self.max_depth,
+            "dropped_chunks": self.dropped_chunks,
+            "dropped_bytes": self.dropped_bytes,
+        }
 
 
 # -----------------------------------------------------------------------------
@@ -84,44 +514,122 @@ def env_constructor(loader, node):
 # -----------------------------------------------------------------------------
 
 
-def dag_paths_random(G, source: int, target: int) -> typing.Iterable[typing.List[int]]:
-    """Yields paths from source to target in random order. Assumes no cycles."""
-    q: typing.Deque[typing.Tuple[int, typing.List[int]]] = deque([(source, [])])
-    while q:
-        node, path = q.popleft()
-        if node == target:
-            yield path + [target]
-        else:
-            children = list(G[node])
-            random.shuffle(children)
-            for child in children:
-                q.append((child, path + [node]))
+class PathSampler:
+    """Draws uniformly random paths from source to target in a DAG.
 
+    Each node is annotated with the number of paths from it to target, so a
+    path can be selected by index (0 <= index < total) without enumerating.
+    """
 
-def itershuffle(
-    iterable: typing.Iterable[T], bufsize: int = 1000
-) -> typing.Iterable[T]:
-    """Shuffle an iterator by maintaining a buffer of elements.
+    def __init__(self, G, source: int, target: int):
+        self.source = source
+        self.target = target
+
+        # node -> number of paths to target
+        counts: typing.Dict[int, int] = {target: 1}
+
+        # Depth-first post-order (no recursion)
+        stack: typing.List[typing.Tuple[int, bool]] = [(source, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if node in counts:
+                continue
+
+            if children_done:
+                counts[node] = sum(counts[child] for child in G[node])
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in G[node] if child not in counts)
+
+        # node -> (children that reach target, cumulative path counts)
+        self.children: typing.Dict[
+            int, typing.Tuple[typing.List[int], typing.List[int]]
+        ] = {}
+
+        for node, node_count in counts.items():
+            if (node == target) or (node_count == 0):
+                continue
+
+            child_nodes: typing.List[int] = []
+            child_ends: typing.List[int] = []
+            cumulative = 0
+            for child in G[node]:
+                if counts[child] > 0:
+                    cumulative += counts[child]
+                    child_nodes.append(child)
+                    child_ends.append(cumulative)
+
+            self.children[node] = (child_nodes, child_ends)
+
+        # Number of possible paths (may be very large)
+        self.total: int = counts[source]
+
+    def path(self, index: int) -> typing.List[int]:
+        """Get the path with a specific index in [0, total)."""
+        assert 0 <= index < self.total, f"Path index out of range: {index}"
+
+        node = self.source
+        path = [node]
+        while node != self.target:
+            child_nodes, child_ends = self.children[node]
+            child_index = bisect.bisect_right(child_ends, index)
+            if child_index > 0:
+                # Make index relative to chosen child
+                index -= child_ends[child_index - 1]
+
+            node = child_nodes[child_index]
+            path.append(node)
+
+        return path
+
+    def sample(
+        self, num_paths: int, rng: typing.Optional[random.Random] = None
+    ) -> typing.Iterable[typing.List[int]]:
+        """Yield distinct, uniformly random paths (all paths if num_paths <= 0)."""
+        rng = rng or random.Random()
+        if (num_paths <= 0) or (num_paths >= self.total):
+            num_paths = self.total
+
+        if num_paths > (self.total // 2):
+            # Most paths are needed, so shuffle indexes lazily
+            indexes: typing.Iterable[int] = self._shuffled_indexes(num_paths, rng)
+        else:
+            # Draw with rejection. Avoids materializing a huge range.
+            indexes = self._distinct_indexes(num_paths, rng)
 
-    Original credit: https://gist.github.com/andres-erbsen/1307752
-    """
-    iterator = iter(iterable)
-    buf: typing.List[T] = []
-    try:
+        for index in indexes:
+            yield self.path(index)
+
+    def sample_forever(
+        self, rng: typing.Optional[random.Random] = None
+    ) -> typing.Iterator[typing.List[int]]:
+        """Yield uniformly random paths (with replacement) forever."""
+        rng = rng or random.Random()
         while True:
-            # Drain some of the iterable
-            for _ in range(random.randint(1, bufsize - len(buf))):
-                buf.append(next(iterator))
-
-            # Shuffle and yield some of buffer
-            random.shuffle(buf)
-            for _ in range(random.randint(1, bufsize)):
-                if buf:
-                    yield buf.pop()
-                else:
-                    break
-    except StopIteration:
-        # Shuffle and yield rest of buffer
-        random.shuffle(buf)
-        while buf:
-            yield buf.pop()
+            yield self.path(rng.randrange(self.total))
+
+    def _distinct_indexes(
+        self, num_indexes: int, rng: random.Random
+    ) -> typing.Iterable[int]:
+        used_indexes: typing.Set[int] = set()
+        while len(used_indexes) < num_indexes:
+            index = rng.randrange(self.total)
+            if index not in used_indexes:
+                used_indexes.add(index)
+                yield index
+
+    def _shuffled_indexes(
+        self, num_indexes: int, rng: random.Random
+    ) -> typing.Iterable[int]:
+        # Fisher-Yates shuffle of range(total) that only stores swapped
+        # positions, so memory grows with the number of indexes yielded.
+        swapped: typing.Dict[int, int] = {}
+        for i in range(num_indexes):
+            j = rng.randrange(i, self.total)
+            index = swapped.get(j, j)
+
+            # Move value at i into the position that was drawn
+            swapped[j] = swapped.get(i, i)
+            swapped.pop(i, None)
+
+            yield index
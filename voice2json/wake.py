@@ -89,21 +89,33 @@ async def wake(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         # Audio data buffer
         chunk = bytes()
 
+        # Re-used for each chunk if audio source can read into a buffer
+        readinto = getattr(audio_source, "readinto", None)
+        frame = bytearray(args.chunk_size)
+
         try:
             while True:
-                chunk_part = await audio_source.read(args.chunk_size)
-                if not chunk_part:
-                    # Empty chunk
-                    break
+                if readinto is not None:
+                    if (await readinto(frame)) < args.chunk_size:
+                        # End of audio
+                        break
 
-                chunk += chunk_part
-                if len(chunk) >= args.chunk_size:
-                    chunk_stream.write(chunk[: args.chunk_size])
+                    chunk_stream.write(frame)
                     chunk_stream.flush()
-                    chunk = chunk[args.chunk_size :]
                 else:
-                    # Need more data before writing chunk
-                    continue
+                    chunk_part = await audio_source.read(args.chunk_size)
+                    if not chunk_part:
+                        # Empty chunk
+                        break
+
+                    chunk += chunk_part
+                    if len(chunk) >= args.chunk_size:
+                        chunk_stream.write(chunk[: args.chunk_size])
+                        chunk_stream.flush()
+                        chunk = chunk[args.chunk_size :]
+                    else:
+                        # Need more data before writing chunk
+                        continue
 
                 # Wait for prediction
                 prob_bytes = prob_stream.readline()